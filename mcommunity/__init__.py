@@ -1,5 +1,57 @@
+from mcommunity.mcommunity_async import AsyncMCommunityClient
 from mcommunity.mcommunity_base import MCommunityBase
+from mcommunity.mcommunity_cache import MCommunityCache
+from mcommunity.mcommunity_client import FetchResult, MCommunityClient
+from mcommunity.mcommunity_eligibility import EligibilityEngine, EligibilityRow
+from mcommunity.mcommunity_export import MCommunityExporter
 from mcommunity.mcommunity_group import MCommunityGroup
-from mcommunity.mcommunity_user import MCommunityUser
+from mcommunity.mcommunity_groupset import GroupSet, MemberSet
+from mcommunity.mcommunity_index import MembershipIndex
+from mcommunity.mcommunity_metrics import MCommunityMetrics, SearchEvent
+from mcommunity.mcommunity_pool import MCommunityConnectionPool
+from mcommunity.mcommunity_record import GroupRecord, UserRecord
+from mcommunity.mcommunity_retry import BindTimeout, CircuitBreaker, CircuitOpenError, ConnectTimeout, Deadline, \
+    DeadlineExceeded, MCommunityTimeout, RetryPolicy, SearchTimeout
+from mcommunity.mcommunity_servers import MCommunityServerSet
+from mcommunity.mcommunity_session import MCommunitySession
+from mcommunity.mcommunity_singleflight import SingleFlight
+from mcommunity.mcommunity_snapshot import MCommunitySnapshot
+from mcommunity.mcommunity_sync import GroupDelta, GroupSync
+from mcommunity.mcommunity_user import MCommunityUser, ServiceEntitlement
 
-__all__ = [MCommunityBase, MCommunityGroup, MCommunityUser]
+__all__ = [
+    AsyncMCommunityClient,
+    BindTimeout,
+    CircuitBreaker,
+    CircuitOpenError,
+    ConnectTimeout,
+    Deadline,
+    DeadlineExceeded,
+    EligibilityEngine,
+    EligibilityRow,
+    FetchResult,
+    GroupDelta,
+    GroupRecord,
+    GroupSet,
+    GroupSync,
+    MCommunityBase,
+    MCommunityCache,
+    MCommunityClient,
+    MCommunityConnectionPool,
+    MCommunityExporter,
+    MCommunityGroup,
+    MCommunityMetrics,
+    MCommunityServerSet,
+    MCommunitySession,
+    MCommunitySnapshot,
+    MCommunityTimeout,
+    MCommunityUser,
+    MemberSet,
+    MembershipIndex,
+    RetryPolicy,
+    SearchEvent,
+    SearchTimeout,
+    ServiceEntitlement,
+    SingleFlight,
+    UserRecord,
+]
@@ -0,0 +1,5 @@
+import sys
+
+from mcommunity.mcommunity_cli import main
+
+sys.exit(main())
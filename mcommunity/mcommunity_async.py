@@ -0,0 +1,323 @@
+import asyncio
+import logging
+import time
+from contextlib import nullcontext
+from typing import Dict, Iterable, List, Optional, Union
+
+import ldap
+from ldap.ldapobject import LDAPObject
+
+from mcommunity.mcommunity_base import MCommunityBase
+from mcommunity.mcommunity_cache import CacheKey, MCommunityCache
+from mcommunity.mcommunity_group import MCommunityGroup
+from mcommunity.mcommunity_pool import MCommunityConnectionPool
+from mcommunity.mcommunity_retry import Deadline, DeadlineExceeded, SearchTimeout
+from mcommunity.mcommunity_servers import MCommunityServer
+from mcommunity.mcommunity_session import MCommunitySession
+from mcommunity.mcommunity_user import MCommunityUser
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncMCommunityClient:
+    max_concurrency: int = 100  # Max searches outstanding on the connection at once
+    poll_interval: float = 0.005  # Seconds to wait between polls for results when none are ready
+
+    def __init__(self, mcommunity_app_cn: Optional[str] = None, mcommunity_secret: Optional[str] = None,
+                 max_concurrency: Optional[int] = None, session: Optional[MCommunitySession] = None):
+        """
+        asyncio client that sends many searches on one pooled connection with search_ext and collects their results
+        with non-blocking result3 polls, so lookups never block the event loop.
+        :param mcommunity_app_cn: cname of the MCommunity app that the secret is tied to (ex: ITS-Dropbox-McDirApp001)
+        :param mcommunity_secret: secret/password for that app to connect to LDAP
+        :param max_concurrency: max searches outstanding at once
+        :param session: session to use instead of mcommunity_app_cn and mcommunity_secret
+        """
+        self.session: MCommunitySession = session or MCommunitySession.for_credentials(
+            mcommunity_app_cn, mcommunity_secret
+        )
+        if max_concurrency is not None:
+            self.max_concurrency = max_concurrency
+
+        self._base = MCommunityBase(session=self.session)  # For connect(), the session's pool and the cache
+        self._connection: Optional[LDAPObject] = None
+        self._server: Optional[MCommunityServer] = None  # Server the connection is to, if the session has servers
+        self._pending: Dict[int, asyncio.Future] = {}  # msgid -> future for its result
+        self._in_flight: Dict[CacheKey, asyncio.Future] = {}  # Searches running now, for coalescing identical ones
+        self._dispatcher: Optional[asyncio.Task] = None
+        # asyncio primitives are created on first use so they belong to the loop the client is used from
+        self._connection_lock: Optional[asyncio.Lock] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self) -> 'AsyncMCommunityClient':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    ##################
+    # Public Methods #
+    ##################
+    async def search(self, search_base: str, query_object: str, ldap_attributes: list) -> list:
+        """
+        Asynchronous equivalent of MCommunityBase.search, including its use of the cache and the snapshot and its
+        coalescing of identical searches in flight.
+        :return: query result
+        """
+        key = MCommunityCache.make_key(search_base, query_object, ldap_attributes)
+        result = self._base._get_cached(key)
+        if result is None:
+            if self._base._setting('coalesce'):
+                result = await self._search_coalesced(key, search_base, query_object, ldap_attributes)
+            else:
+                result = await self._search_ldap(search_base, query_object, ldap_attributes)
+            self._base._set_cached([(key, result)])
+        return result
+
+    async def fetch_user(self, uniqname: str, profile: Union[str, list, None] = None) -> MCommunityUser:
+        """
+        :param uniqname: the uniqname of the user
+        :param profile: MCommunityUser fetch profile, e.g. 'minimal'; defaults to 'full'. Note that reading an
+        attribute the profile left out later does a blocking follow-up search.
+        :return: the MCommunityUser, built from the result without any blocking search
+        """
+        attributes = MCommunityUser.profile_attributes(profile)
+        raw_result = await self.search(MCommunityUser.search_base, f'uid={uniqname}', attributes)
+        return self.session.user(uniqname, raw_result=raw_result, profile=attributes)
+
+    async def fetch_group(self, cn: str, profile: Union[str, list, None] = None) -> MCommunityGroup:
+        """
+        :param cn: the cname of the group
+        :param profile: MCommunityGroup fetch profile, e.g. 'members'; defaults to 'full'
+        :return: the MCommunityGroup, built from the result without any blocking search; raises NameError if it does
+        not exist, like the MCommunityGroup constructor
+        """
+        attributes = MCommunityGroup.profile_attributes(profile)
+        raw_result = await self.search(MCommunityGroup.search_base, f'cn={cn}', attributes)
+        return self.session.group(cn, raw_result=raw_result, profile=attributes)
+
+    async def fetch_users(self, uniqnames: Iterable[str], return_exceptions: bool = False,
+                          profile: Union[str, list, None] = None,
+                          deadline: Optional[float] = None) -> List[MCommunityUser]:
+        """
+        Look up many users at once; at most max_concurrency searches are outstanding at a time.
+        :param uniqnames: uniqnames to look up
+        :param return_exceptions: passed to asyncio.gather; if True, a failed lookup is returned in its place
+        instead of raised
+        :param profile: MCommunityUser fetch profile; defaults to 'full'
+        :param deadline: seconds the whole batch may take; lookups still running or retrying after that fail with
+        DeadlineExceeded
+        :return: list of MCommunityUsers in the same order as uniqnames
+        """
+        with Deadline(deadline).scope() if deadline is not None else nullcontext():
+            return await asyncio.gather(
+                *(self.fetch_user(uniqname, profile) for uniqname in uniqnames), return_exceptions=return_exceptions
+            )
+
+    async def fetch_groups(self, cns: Iterable[str], return_exceptions: bool = False,
+                           profile: Union[str, list, None] = None,
+                           deadline: Optional[float] = None) -> List[MCommunityGroup]:
+        """
+        Look up many groups at once; at most max_concurrency searches are outstanding at a time.
+        :param cns: group cnames to look up
+        :param return_exceptions: passed to asyncio.gather; if True, a failed lookup is returned in its place
+        instead of raised
+        :param profile: MCommunityGroup fetch profile; defaults to 'full'
+        :param deadline: seconds the whole batch may take; lookups still running or retrying after that fail with
+        DeadlineExceeded
+        :return: list of MCommunityGroups in the same order as cns
+        """
+        with Deadline(deadline).scope() if deadline is not None else nullcontext():
+            return await asyncio.gather(
+                *(self.fetch_group(cn, profile) for cn in cns), return_exceptions=return_exceptions
+            )
+
+    async def close(self) -> None:
+        """
+        Stop polling, cancel any searches still waiting for results and hand the connection back to the session's
+        pool.
+        :return: None
+        """
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        pending = self._pending
+        self._pending = {}
+        for future in pending.values():
+            future.cancel()  # Not an LDAP error, so the retry policy does not start them again
+        if self._connection is not None:
+            self._pool().release(self._connection)
+            self._connection = None
+            self._server = None
+
+    ###################
+    # Private Methods #
+    ###################
+    async def _search_ldap(self, search_base: str, query_object: str, ldap_attributes: list) -> list:
+        """
+        Run the search, retrying per the retry policy without blocking the event loop, and failing fast while the
+        session's circuit breaker is open.
+        :return: query result
+        """
+        return await self._base._setting('retry_policy').call_async(
+            lambda: self._search_once(search_base, query_object, ldap_attributes), self.session.circuit_breaker,
+            on_retry=self.session.metrics.record_retry
+        )
+
+    async def _search_coalesced(self, key: CacheKey, search_base: str, query_object: str,
+                                ldap_attributes: list) -> list:
+        """
+        Run the search, or if an identical one is already in flight, wait for that one and share its result or
+        exception. If the task running the shared search is cancelled, the tasks waiting for it search again.
+        :param key: key from MCommunityCache.make_key()
+        :return: query result
+        """
+        while key in self._in_flight:
+            shared = self._in_flight[key]
+            self.session.metrics.record_coalesced(self._base._query_type(search_base, query_object))
+            try:
+                return await asyncio.shield(shared)  # Being cancelled ourselves does not cancel it for the others
+            except asyncio.CancelledError:
+                if not shared.cancelled():
+                    raise  # It was this task that was cancelled
+
+        shared = self._in_flight[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await self._search_ldap(search_base, query_object, ldap_attributes)
+        except asyncio.CancelledError:
+            shared.cancel()
+            raise
+        except BaseException as e:
+            shared.set_exception(e)
+            shared.exception()  # Mark it retrieved; this task raises it itself even if nobody else was waiting
+            raise
+        else:
+            shared.set_result(result)
+        finally:
+            del self._in_flight[key]
+        return result
+
+    async def _search_once(self, search_base: str, query_object: str, ldap_attributes: list) -> list:
+        """
+        Send the search on the shared connection and wait for the dispatcher to hand back its result, for at most the
+        search timeout capped by any Deadline in effect; the latency is recorded in the session's metrics.
+        :return: query result
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            connection = await self._get_connection()
+            server = self._server
+            future = asyncio.get_running_loop().create_future()
+            try:
+                msgid = connection.search_ext(search_base, ldap.SCOPE_SUBTREE, query_object, ldap_attributes)
+            except ldap.SERVER_DOWN:
+                self._drop_connection(connection)
+                raise
+            self._pending[msgid] = future
+            if self._dispatcher is None or self._dispatcher.done():
+                self._dispatcher = asyncio.ensure_future(self._dispatch())
+            query_type = self._base._query_type(search_base, query_object)
+            event = self.session.metrics.search_started(query_type, search_base, query_object)
+            timeout = Deadline.cap(self._base._setting('search_timeout'))
+            start = time.perf_counter()
+            try:
+                result = await (future if timeout < 0 else asyncio.wait_for(future, timeout))
+            except asyncio.TimeoutError:
+                if self._pending.pop(msgid, None) is not None:
+                    connection.abandon(msgid)  # Nobody is waiting for it anymore; tell the server to stop
+                error_type, desc = SearchTimeout, 'Timed out waiting for search results'
+                deadline = Deadline.current()
+                if deadline is not None and deadline.expired:
+                    error_type, desc = DeadlineExceeded, 'Deadline exceeded'
+                error = error_type({'desc': desc, 'info': f'No result for {query_object} in {timeout:.3g}s'})
+                self.session.metrics.search_finished(event, time.perf_counter() - start, error=error)
+                raise error
+            except ldap.LDAPError as e:
+                self.session.metrics.search_finished(event, time.perf_counter() - start, error=e)
+                raise
+            except asyncio.CancelledError:
+                if self._pending.pop(msgid, None) is not None:
+                    connection.abandon(msgid)  # Nobody is waiting for it anymore; tell the server to stop
+                raise
+            seconds = time.perf_counter() - start
+            self.session.metrics.search_finished(event, seconds, results=len(result))
+            if server is not None:
+                self._base._setting('servers').record_success(server, seconds)
+            return result
+
+    async def _get_connection(self) -> LDAPObject:
+        """
+        Check a bound connection out of the session's pool on first use; the blocking connect/bind runs in the default
+        executor. If the session has servers, the connection is to the one their strategy picks.
+        :return: the connection
+        """
+        if self._connection_lock is None:
+            self._connection_lock = asyncio.Lock()
+        async with self._connection_lock:
+            if self._connection is None:
+                servers = self._base._setting('servers')
+                self._server = servers.choose() if servers is not None else None
+                server_uri = self._server.uri if self._server is not None else None
+                self._connection = await asyncio.get_running_loop().run_in_executor(
+                    None, self._pool().acquire, lambda: self._base.connect(server_uri)
+                )
+            return self._connection
+
+    async def _dispatch(self) -> None:
+        """
+        Poll the connection for finished searches and resolve their futures until none are outstanding.
+        :return: None
+        """
+        while self._pending:
+            try:
+                result_type, result_data, msgid, _ = self._connection.result3(ldap.RES_ANY, all=1, timeout=0)
+            except ldap.LDAPError as e:
+                msgid = e.args[0].get('msgid') if e.args and isinstance(e.args[0], dict) else None
+                if msgid in self._pending:
+                    self._resolve(msgid, exception=e)
+                    continue
+                self._fail_pending(e)  # Can't tell which search it belongs to, so the connection is unusable
+                if isinstance(e, ldap.SERVER_DOWN):
+                    self._drop_connection(self._connection)
+                return
+            if result_type is None:
+                await asyncio.sleep(self.poll_interval)
+            else:
+                self._resolve(msgid, result=result_data)
+
+    def _drop_connection(self, connection: LDAPObject) -> None:
+        """
+        Throw away a connection the server closed; the next search checks out a fresh one, from the next healthy server
+        if the session has servers.
+        :param connection: the dead connection
+        :return: None
+        """
+        if self._connection is connection:
+            self._pool().discard(connection)
+            if self._server is not None:
+                self._base._setting('servers').record_failure(self._server)
+            self._connection = None
+            self._server = None
+
+    def _pool(self) -> MCommunityConnectionPool:
+        """
+        :return: the session's pool for the server the connection is to
+        """
+        return self._base.connection_pool(self._server.uri if self._server is not None else None)
+
+    def _resolve(self, msgid: int, result: Optional[list] = None, exception: Optional[BaseException] = None) -> None:
+        future = self._pending.pop(msgid, None)
+        if future is None or future.done():  # The caller gave up (e.g. was cancelled)
+            return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def _fail_pending(self, exception: BaseException) -> None:
+        pending = self._pending
+        self._pending = {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(exception)
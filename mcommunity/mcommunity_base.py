@@ -1,91 +1,477 @@
-from time import sleep
-from typing import Union
+import errno
+import sys
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar, Union
 
 import ldap
+from ldap.controls import SimplePagedResultsControl
+from ldap.filter import escape_filter_chars
+
+from mcommunity.mcommunity_cache import CacheKey, MCommunityCache
+from mcommunity.mcommunity_pool import MCommunityConnectionPool
+from mcommunity.mcommunity_retry import BindTimeout, ConnectTimeout, Deadline, DeadlineExceeded, RetryPolicy, \
+    SearchTimeout
+from mcommunity.mcommunity_servers import MCommunityServerSet
+from mcommunity.mcommunity_session import MCommunitySession
+from mcommunity.mcommunity_snapshot import MCommunitySnapshot
+
+T = TypeVar('T')
 
 
 class MCommunityBase:
-    mcommunity_app_cn: str = ''
-    mcommunity_secret: str = ''
+    session: Optional[MCommunitySession] = None  # Credentials and shared state; see MCommunitySession
+
+    server_uri: str = 'ldaps://ldap.umich.edu'
+    servers: Optional[MCommunityServerSet] = None  # Set to spread searches over several replicas instead of server_uri
+    pool_size: int = 10  # Max bound connections per server in each session's pools
+    size_limit: int = 0  # Client-side cap on entries returned per search; 0 means no limit beyond the server's
+    page_size: int = 500  # Entries per page for search_paged
+    cache: Optional[MCommunityCache] = None  # Set to an MCommunityCache to cache query results in-process
+    snapshot: Optional[MCommunitySnapshot] = None  # Set to an MCommunitySnapshot to persist query results on disk
+    retry_policy: RetryPolicy = RetryPolicy()  # How searches are retried while the server is unavailable
+    connect_timeout: float = 10.0  # Seconds to wait for the network connection to open; -1 for no timeout
+    bind_timeout: float = 10.0  # Seconds to wait for the bind to be answered; -1 for no timeout
+    search_timeout: float = 30.0  # Seconds to wait for a search's results (a page's, when paged); -1 for no timeout
+    time_limit: int = 0  # Seconds the server may spend on a search; 0 means no limit beyond the server's
+    coalesce: bool = True  # Identical searches in flight at the same time share one round trip and its result
 
     search_base: str = ''  # LDAP base to query
     ldap_attributes: list = ['*']  # Attributes to query for
+    fetch_profiles: Dict[str, list] = {'full': ldap_attributes}  # Named attribute lists, see profile_attributes
+    _fetched_attributes: list = ['*']  # Attributes raw_result was fetched with; others are fetched on first access
 
     name: str = ''  # Usually a person dn or a group cn
     query_object: str = ''  # The name with the added info required for submitting an LDAP query
     raw_result: list = []  # Exactly what is returned from the query
 
-    def __init__(self, mcommunity_app_cn: str, mcommunity_secret: str):
+    def __init__(self, mcommunity_app_cn: Optional[str] = None, mcommunity_secret: Optional[str] = None,
+                 session: Optional[MCommunitySession] = None):
         """
         Base class to use for connecting to LDAP (MCommunity).
         :param mcommunity_app_cn: cname of the MCommunity app that the secret is tied to (ex: ITS-Dropbox-McDirApp001)
         :param mcommunity_secret: secret/password for that app to connect to LDAP
+        :param session: session holding the credentials, pool and cache; if not given, the default session for
+        mcommunity_app_cn and mcommunity_secret is used
         """
-        self.mcommunity_app_cn = mcommunity_app_cn
-        self.mcommunity_secret = mcommunity_secret
+        if session is None:
+            session = MCommunitySession.for_credentials(mcommunity_app_cn, mcommunity_secret)
+        self.session = session
+        self._decoded: Dict[str, Union[str, tuple]] = {}  # Attribute -> value decoded from raw_result, see _decode
+
+    @property
+    def mcommunity_app_cn(self) -> str:
+        return self.session.mcommunity_app_cn
+
+    @property
+    def mcommunity_secret(self) -> str:
+        return self.session.mcommunity_secret
 
     ##################
     # Public Methods #
     ##################
-    def connect(self):
+    def connect(self, server_uri: Optional[str] = None):
         """
         Get a connection to M-Community for use in querying via LDAP.
+        :param server_uri: LDAP URI to connect to; defaults to the session's or the class's server_uri
         :return: the connection
         """
         ldap.set_option(ldap.OPT_X_TLS_REQUIRE_CERT, ldap.OPT_X_TLS_NEVER)
-        connect = ldap.initialize('ldaps://ldap.umich.edu')
-        ldap.OPT_SIZELIMIT = 100
+        connect = ldap.initialize(server_uri or self._setting('server_uri'))
+        self.session.metrics.increment('connects')
+        size_limit = self._setting('size_limit')
+        if size_limit:
+            connect.set_option(ldap.OPT_SIZELIMIT, size_limit)
+        time_limit = self._setting('time_limit')
+        if time_limit:
+            connect.set_option(ldap.OPT_TIMELIMIT, time_limit)
         connect.set_option(ldap.OPT_REFERRALS, 0)
-        # Request new ID
-        connect.simple_bind_s(f'cn={self.mcommunity_app_cn},ou=Applications,o=services', self.mcommunity_secret)
+        connect_timeout = Deadline.cap(self._setting('connect_timeout'))
+        if connect_timeout >= 0:
+            connect.set_option(ldap.OPT_NETWORK_TIMEOUT, connect_timeout)
+        # Request new ID; the connection is only opened by the bind, so a connect timeout surfaces here too
+        connect.timeout = bind_timeout = Deadline.cap(self._setting('bind_timeout'))
+        try:
+            connect.simple_bind_s(f'cn={self.mcommunity_app_cn},ou=Applications,o=services', self.mcommunity_secret)
+        except ldap.LDAPError as e:
+            self.session.metrics.increment('bind_errors')
+            if isinstance(e, ldap.TIMEOUT):
+                raise BindTimeout({
+                    'desc': 'Timed out binding to MCommunity', 'info': f'No answer in {bind_timeout}s'
+                }) from e
+            if isinstance(e, ldap.SERVER_DOWN) and self._timed_out(e):
+                raise ConnectTimeout({
+                    'desc': 'Timed out connecting to MCommunity', 'info': f'No connection in {connect_timeout}s'
+                }) from e
+            raise
+        self.session.metrics.increment('binds')
+        connect.timeout = -1  # Searches pass their own timeout
         return connect
 
-    def search(self, search_base, query_object, ldap_attributes):
+    def connection_pool(self, server_uri: Optional[str] = None) -> MCommunityConnectionPool:
         """
-        Perform a basic search for a single object (user or group)
-        :return: query result
+        Get the session's connection pool for a server, shared by every object using the same session.
+        :param server_uri: LDAP URI of the server; defaults to the session's or the class's server_uri
+        :return: the pool
+        """
+        return self.session.connection_pool(server_uri or self._setting('server_uri'))
+
+    @classmethod
+    def profile_attributes(cls, profile: Union[str, list, None]) -> list:
         """
-        for i in range(1, 4):
+        Resolve a fetch profile to the list of attributes to query for.
+        :param profile: the name of one of fetch_profiles (e.g. 'minimal', 'full'), a custom list of attributes,
+        or None for ldap_attributes
+        :return: list of attributes
+        """
+        if profile is None:
+            return cls.ldap_attributes
+        elif type(profile) == str:
             try:
-                return self.connect().search_st(search_base,
-                                                ldap.SCOPE_SUBTREE,
-                                                query_object,
-                                                ldap_attributes
-                                                )
-            except (ldap.SERVER_DOWN, ldap.UNAVAILABLE):
-                sleep(i * 5)  # Sleep longer each subsequent time if the last attempt was unsuccessful
+                return cls.fetch_profiles[profile]
+            except KeyError:
+                raise ValueError(f'Unknown fetch profile {profile}; expected one of {", ".join(cls.fetch_profiles)} '
+                                 f'or a list of attributes')
+        return list(profile)
+
+    def release_raw_result(self) -> None:
+        """
+        Decode every attribute in raw_result and then drop it, so a long-lived object only keeps the decoded values.
+        Reads afterwards are answered from those; an attribute the fetch profile left out reads as empty instead of
+        being fetched.
+        :return: None
+        """
+        if self.raw_result:
+            for which_key in self.raw_result[0][1]:
+                self._decoded_value(which_key)
+        self.raw_result = []
+
+    def search(self, search_base, query_object, ldap_attributes, use_cache: bool = True):
+        """
+        Perform a basic search for a single object (user or group) on a pooled connection, answering from the cache
+        or the snapshot if either is set
+        :param use_cache: if False, the cache and the snapshot are neither read nor updated
+        :return: query result
+        """
+        if not use_cache:
+            return self._search_ldap(search_base, query_object, ldap_attributes)
+
+        key = MCommunityCache.make_key(search_base, query_object, ldap_attributes)
+        result = self._get_cached(key)
+        if result is None:
+            result = self._search_ldap(search_base, query_object, ldap_attributes)
+            self._set_cached([(key, result)])
+        return result
+
+    def search_many(self, search_base: str, attribute: str, values: Iterable[str], ldap_attributes: list,
+                    chunk_size: int = 100, use_cache: bool = True) -> Dict[str, List[tuple]]:
+        """
+        Look up many objects by the same naming attribute using one OR filter per chunk, e.g. (|(uid=a)(uid=b)...),
+        instead of one search per object. Values already in the cache or the snapshot are not searched for, and the
+        results are cached under the same keys a single-object search() for them would use.
+        :param search_base: LDAP base to query
+        :param attribute: naming attribute the values are matched on (the first RDN of each result's DN), e.g. 'uid'
+        :param values: values to look up, e.g. uniqnames
+        :param ldap_attributes: attributes to query for
+        :param chunk_size: how many values to put in each OR filter
+        :param use_cache: if False, the cache and the snapshot are neither read nor updated
+        :return: dict of each value to its query result, in the same shape search() returns for a single object (an
+        empty list if nothing was found)
+        """
+        values = list(dict.fromkeys(values))  # Remove duplicates without losing order
+        results = {value: [] for value in values}
+        to_fetch = []
+        for value in values:
+            if not use_cache:
+                to_fetch.append(value)
                 continue
-        raise ldap.UNAVAILABLE  # If we get here, it failed 3 times and we just need to accept defeat and move on
+            cached = self._get_cached(MCommunityCache.make_key(search_base, f'{attribute}={value}', ldap_attributes))
+            if cached is None:
+                to_fetch.append(value)
+            else:
+                results[value] = list(cached)
+
+        by_lower = {value.lower(): value for value in to_fetch}  # LDAP matching on naming attributes ignores case
+        for start in range(0, len(to_fetch), chunk_size):
+            query_object = '(|{})'.format(''.join(
+                f'({attribute}={escape_filter_chars(value)})' for value in to_fetch[start:start + chunk_size]
+            ))
+            for dn, attrs in self.search(search_base, query_object, ldap_attributes, use_cache=False):
+                value = by_lower.get(self._rdn_value(dn).lower())
+                if value is not None:
+                    results[value].append((dn, attrs))
+
+        if use_cache:
+            self._set_cached([
+                (MCommunityCache.make_key(search_base, f'{attribute}={value}', ldap_attributes), results[value])
+                for value in to_fetch
+            ])
+        return results
+
+    def search_paged(self, search_base: str, query_object: str, ldap_attributes: list,
+                     page_size: Optional[int] = None) -> Iterator[tuple]:
+        """
+        Stream the entries of a search that may match many objects (e.g. every user with a given role), fetching them
+        page by page with the Simple Paged Results control so only one page is held in memory at a time. The pooled
+        connection is held until the generator is exhausted or closed. Results are not cached, and a scan interrupted
+        by the server going down is not resumed.
+        :param search_base: LDAP base to query
+        :param query_object: the LDAP filter
+        :param ldap_attributes: attributes to query for
+        :param page_size: entries per page; defaults to the session's or the class's page_size
+        :return: generator of (dn, attrs) tuples
+        """
+        cookie = ''
+        query_type = self._query_type(search_base, query_object, paged=True)
+        servers = self._setting('servers')
+        server_uri = servers.choose().uri if servers is not None else None
+        with self.connection_pool(server_uri).connection(lambda: self.connect(server_uri)) as connection:
+            while True:
+                control = SimplePagedResultsControl(True, size=page_size or self._setting('page_size'), cookie=cookie)
+                msgid = connection.search_ext(
+                    search_base, ldap.SCOPE_SUBTREE, query_object, ldap_attributes, serverctrls=[control]
+                )
+                _, entries, _, response_controls = self._timed(
+                    query_type, search_base, query_object, lambda timeout: connection.result3(
+                        msgid, timeout=timeout,
+                        resp_ctrl_classes={SimplePagedResultsControl.controlType: SimplePagedResultsControl}
+                    ), count=lambda page: len(page[1])
+                )
+                for dn, attrs in entries:
+                    if dn is not None:  # Skip search references
+                        yield dn, attrs
+                cookie = next((
+                    c.cookie for c in response_controls or [] if c.controlType == SimplePagedResultsControl.controlType
+                ), None)
+                if not cookie:  # An empty cookie means that was the last page
+                    return
 
     def to_dict(self):
-        d = self.__dict__.copy()
-        d.pop('mcommunity_secret')  # Remove secret for security
+        d = {k: v for k, v in self.__dict__.items() if not k.startswith('_')}  # Private attributes are internal state
+        d.pop('session')  # Holds the secret, and the pool and cache are not serializable
+        d['mcommunity_app_cn'] = self.mcommunity_app_cn
         d.pop('raw_result')  # raw_result contains bytes objects which are not JSON serializable, just remove it
         return d
 
     ###################
     # Private Methods #
     ###################
+    def _get_cached(self, key: CacheKey) -> Optional[list]:
+        """
+        Look a query result up in the cache, then in the snapshot; a snapshot hit is copied into the cache.
+        :param key: key from MCommunityCache.make_key()
+        :return: the query result, or None if neither has it
+        """
+        cache = self._setting('cache')
+        if cache is not None:
+            result = cache.get(key)
+            if result is not None:
+                self.session.metrics.increment('cache_hits')
+                return result
+        snapshot = self._setting('snapshot')
+        if snapshot is not None:
+            result = snapshot.get(key)
+            if result is not None and cache is not None:
+                cache.set(key, result)
+            if result is not None:
+                self.session.metrics.increment('snapshot_hits')
+                return result
+        if cache is not None or snapshot is not None:
+            self.session.metrics.increment('cache_misses')
+        return None
+
+    def _set_cached(self, items: List[Tuple[CacheKey, list]]) -> None:
+        """
+        Store freshly fetched query results in the cache and the snapshot, whichever are set.
+        :param items: (key, result) pairs
+        :return: None
+        """
+        cache = self._setting('cache')
+        if cache is not None:
+            for key, result in items:
+                cache.set(key, result)
+        snapshot = self._setting('snapshot')
+        if snapshot is not None and items:
+            snapshot.set_many(items)
+
+    def _search_ldap(self, search_base, query_object, ldap_attributes):
+        """
+        Run a search against LDAP on a pooled connection, retrying per the retry policy if the server is unavailable
+        or too slow and failing fast while the session's circuit breaker is open. With servers set, each attempt goes
+        to a server picked by its strategy and fails over to the next one at once. If coalesce is set and an identical
+        search is already in flight in the session, its result (or exception) is shared instead.
+        :return: query result
+        """
+        query_type = self._query_type(search_base, query_object)
+        if self._setting('coalesce'):
+            return self.session.single_flight.do(
+                MCommunityCache.make_key(search_base, query_object, ldap_attributes),
+                lambda: self._search_ldap_once(search_base, query_object, ldap_attributes, query_type),
+                on_coalesced=lambda: self.session.metrics.record_coalesced(query_type)
+            )
+        return self._search_ldap_once(search_base, query_object, ldap_attributes, query_type)
+
+    def _search_ldap_once(self, search_base: str, query_object: str, ldap_attributes: list, query_type: str):
+        """
+        Run a search against LDAP with retries and failover, see _search_ldap
+        :return: query result
+        """
+        def search(server_uri: Optional[str]):
+            return self.connection_pool(server_uri).run(
+                lambda: self.connect(server_uri), lambda connection: self._timed(
+                    query_type, search_base, query_object, lambda timeout: connection.search_st(
+                        search_base, ldap.SCOPE_SUBTREE, query_object, ldap_attributes, timeout=timeout
+                    )
+                )
+            )
+
+        def attempt():
+            if servers is None:
+                return search(None)
+            # A failed server's idle connections are dropped; its searches move to the other servers' pools
+            return servers.run(search, on_failure=lambda server_uri: self.connection_pool(server_uri).close())
+
+        servers = self._setting('servers')
+        return self._setting('retry_policy').call(
+            attempt, self.session.circuit_breaker, on_retry=self.session.metrics.record_retry
+        )
+
+    def _timed(self, query_type: str, search_base: str, query_object: str, operation: Callable[[float], T],
+               count: Callable[[T], int] = len) -> T:
+        """
+        Run one search attempt with the search timeout, capped by any Deadline in effect, recording it in the session's
+        metrics and calling their before_search and after_search hooks.
+        :param query_type: label the latency is recorded under, see _query_type
+        :param search_base: the LDAP base, for the metrics
+        :param query_object: the LDAP filter, for the hooks and the error message
+        :param operation: callable taking the timeout in seconds (-1 for none) and doing the search
+        :param count: callable taking what operation returns and giving the number of entries in it
+        :return: what operation returns; raises SearchTimeout, or DeadlineExceeded if the deadline was what ran out
+        """
+        metrics = self.session.metrics
+        event = metrics.search_started(query_type, search_base, query_object)
+        timeout = Deadline.cap(self._setting('search_timeout'))
+        start = time.perf_counter()
+        try:
+            result = operation(timeout)
+        except ldap.LDAPError as e:
+            metrics.search_finished(event, time.perf_counter() - start, error=e)
+            if isinstance(e, ldap.TIMEOUT) and not isinstance(e, DeadlineExceeded):
+                deadline = Deadline.current()
+                if deadline is not None and deadline.expired:
+                    raise DeadlineExceeded({
+                        'desc': 'Deadline exceeded', 'info': f'No result for {query_object} in time'
+                    }) from e
+                raise SearchTimeout({'desc': 'Timed out waiting for search results',
+                                     'info': f'No result for {query_object} in {timeout}s'}) from e
+            raise
+        metrics.search_finished(event, time.perf_counter() - start, results=count(result))
+        return result
+
+    def _setting(self, name: str):
+        """
+        :param name: one of the settings an MCommunitySession can override, e.g. 'server_uri' or 'cache'
+        :return: the session's value if it sets one, otherwise this object's class attribute
+        """
+        value = getattr(self.session, name)
+        return getattr(self, name) if value is None else value
+
+    @staticmethod
+    def _query_type(search_base: str, query_object: str, paged: bool = False) -> str:
+        """
+        Get the label a search's latency is recorded under: the first RDN value of the search base and the kind of
+        search, e.g. 'People/lookup' for uid=nemcardf, 'People/batch' for search_many's OR filters, 'User Groups/filter'
+        for any other filter, or 'People/paged' for the pages of search_paged
+        :param search_base: LDAP base being queried
+        :param query_object: the LDAP filter
+        :param paged: whether it is a paged search
+        :return: the label
+        """
+        base = search_base.split(',', 1)[0].split('=', 1)[-1]
+        if paged:
+            kind = 'paged'
+        elif query_object.startswith('(|'):
+            kind = 'batch'
+        elif query_object.startswith('('):
+            kind = 'filter'
+        else:
+            kind = 'lookup'
+        return f'{base}/{kind}'
+
+    @staticmethod
+    def _timed_out(error: ldap.LDAPError) -> bool:
+        """
+        :param error: a SERVER_DOWN raised while connecting
+        :return: whether it was because the connection attempt timed out, rather than e.g. being refused
+        """
+        info = error.args[0] if error.args and isinstance(error.args[0], dict) else {}
+        return info.get('errno') == errno.ETIMEDOUT or 'timed out' in str(info.get('info', '')).lower()
+
+    @staticmethod
+    def _rdn_value(dn: Union[str, bytes]) -> str:
+        """
+        Get the value of the first RDN of a DN, e.g. 'nemcardf' from 'uid=nemcardf,ou=People,dc=umich,dc=edu'
+        :param dn: the DN, as a str or bytes
+        :return: the value as a str
+        """
+        if type(dn) == bytes:
+            dn = dn.decode('UTF-8')
+        if '\\' in dn:  # Escaped characters; let python-ldap do the full parse
+            return ldap.dn.str2dn(dn)[0][0][1]
+        return dn.split(',', 1)[0].split('=', 1)[1]
+
+    def _ensure_attribute(self, which_key: str) -> None:
+        """
+        If raw_result was fetched with a profile that did not include an attribute, fetch just that attribute with one
+        targeted search and merge it into raw_result.
+        :param which_key: the attribute about to be read
+        :return: None
+        """
+        if not self.raw_result or '*' in self._fetched_attributes or \
+                which_key.lower() in (a.lower() for a in self._fetched_attributes):
+            return
+        self._fetched_attributes = self._fetched_attributes + [which_key]
+        result = self.search(self.search_base, self.query_object, [which_key])
+        if result:
+            dn, attrs = self.raw_result[0]
+            self.raw_result = [(dn, {**attrs, **result[0][1]})] + self.raw_result[1:]  # Copy; it may be cached
+
     def _decode(self, which_key, return_str=True) -> Union[str, list]:
         """
-        Decode a bytes object or a list of bytes objects to UTF-8
+        Decode a bytes object or a list of bytes objects to UTF-8; each attribute is decoded once and remembered
         :param which_key: a string representing the key to retrieve the value of in the user data
         :param return_str: if True and the decoded item is an empty or single-item list, return an empty str or the item
         instead of the list; if False, return the list with the single item; defaults to True;
         :return: the decoded item, either a string or a list
         """
+        which_key = sys.intern(which_key)
+        if which_key not in self._decoded:
+            self._ensure_attribute(which_key)
+        decoded = self._decoded_value(which_key)
+        if type(decoded) == tuple:
+            if return_str and len(decoded) <= 1:
+                return decoded[0] if decoded else ''
+            else:
+                return list(decoded)  # A copy, since callers may keep and change it
+        return decoded
+
+    def _decoded_value(self, which_key: str) -> Union[str, tuple, None]:
+        """
+        :param which_key: the attribute
+        :return: the attribute decoded from raw_result, as a str if LDAP returned a single bytes object or else a
+        tuple; an empty tuple if the object or the attribute is missing
+        """
+        decoded = self._decoded.get(which_key)
+        if decoded is not None:
+            return decoded
         try:
             value = self.raw_result[0][1].get(which_key, [])
         except IndexError:  # This will happen if the person/group doesn't exist or is not affiliated
-            if return_str:
-                return ''
-            else:
-                return []
+            return ()
         if type(value) == bytes:  # Never seen this in LDAP, it is always a list even if just one item, but just in case
-            return value.decode('UTF-8')
+            decoded = value.decode('UTF-8')
         elif type(value) == list:
-            decoded = [i.decode('UTF-8') for i in value]
-            if return_str and len(decoded) <= 1:
-                return decoded[0] if decoded else ''
-            else:
-                return decoded
+            decoded = tuple(i.decode('UTF-8') for i in value)
+        else:
+            return None
+        self._decoded[which_key] = decoded
+        return decoded
@@ -0,0 +1,161 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+CacheKey = Tuple[str, str, Tuple[str, ...]]
+
+_NAME_PATTERN = re.compile(r'(uid|cn)=([^(),]+)', re.IGNORECASE)  # Names a filter or DN refers to
+
+
+class MCommunityCache:
+    """
+    Thread-safe in-process cache of query results keyed by (search_base, filter, attribute list), with a per-entry
+    TTL and LRU eviction capped by entry count and approximate size. Empty results (a user or group that does not
+    exist) are cached as negative entries with their own, usually shorter, TTL.
+    """
+
+    def __init__(self, ttl: float = 300.0, negative_ttl: float = 60.0, max_entries: int = 10000,
+                 max_bytes: int = 64 * 1024 * 1024):
+        """
+        :param ttl: seconds a non-empty result stays fresh
+        :param negative_ttl: seconds an empty result stays fresh
+        :param max_entries: max number of results to keep before evicting the least recently used
+        :param max_bytes: max approximate total size of the cached results before evicting the least recently used
+        """
+        self.ttl: float = ttl
+        self.negative_ttl: float = negative_ttl
+        self.max_entries: int = max_entries
+        self.max_bytes: int = max_bytes
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+        self._entries: 'OrderedDict[CacheKey, Tuple[float, int, list]]' = OrderedDict()  # (expires at, size, result)
+        self._names: Dict[str, Set[CacheKey]] = {}  # e.g. 'uid=nemcardf' -> keys of results that refer to it
+        self._bytes: int = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(search_base: str, query_object: str, ldap_attributes: list) -> CacheKey:
+        return search_base, query_object, tuple(ldap_attributes)
+
+    ##################
+    # Public Methods #
+    ##################
+    def get(self, key: CacheKey) -> Optional[list]:
+        """
+        :param key: key from make_key()
+        :return: the cached query result (an empty list for a negative entry), or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key: CacheKey, result: list) -> None:
+        """
+        Cache a query result, evicting least recently used results if that puts the cache over its caps.
+        :param key: key from make_key()
+        :param result: the query result as returned by MCommunityBase.search
+        :return: None
+        """
+        size = self._approximate_size(key, result)
+        expires_at = time.monotonic() + (self.ttl if result else self.negative_ttl)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, size, result)
+            self._bytes += size
+            for name in self._names_for(key, result):
+                self._names.setdefault(name, set()).add(key)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, uniqname: Optional[str] = None, cn: Optional[str] = None) -> int:
+        """
+        Drop every cached result that was looked up by, or returned, the given user and/or group.
+        :param uniqname: uniqname of a user
+        :param cn: cname of a group
+        :return: number of results dropped
+        """
+        names = [f'uid={uniqname}'.lower()] if uniqname else []
+        names += [f'cn={cn}'.lower()] if cn else []
+        removed = 0
+        with self._lock:
+            for name in names:
+                for key in list(self._names.get(name, ())):
+                    if key in self._entries:
+                        self._remove(key)
+                        removed += 1
+        return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._names.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """
+        :return: dict of hit/miss/eviction counters and current size
+        """
+        with self._lock:
+            return {
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self._entries), 'bytes': self._bytes
+            }
+
+    ###################
+    # Private Methods #
+    ###################
+    def _remove(self, key: CacheKey) -> None:
+        """
+        Remove an entry and its name index references; the caller must hold the lock.
+        """
+        _, size, result = self._entries.pop(key)
+        self._bytes -= size
+        for name in self._names_for(key, result):
+            keys = self._names.get(name)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._names[name]
+
+    @staticmethod
+    def _names_for(key: CacheKey, result: list) -> Set[str]:
+        """
+        :return: the 'uid=...'/'cn=...' names a cached result refers to, from its filter and the DNs it returned
+        """
+        names = {f'{a}={v}'.lower() for a, v in _NAME_PATTERN.findall(key[1])}
+        for dn, _ in result:
+            match = _NAME_PATTERN.match(dn or '')
+            if match:
+                names.add(f'{match.group(1)}={match.group(2)}'.lower())
+        return names
+
+    @staticmethod
+    def _approximate_size(key: CacheKey, result: list) -> int:
+        """
+        Rough size in bytes of a result: the lengths of its DNs, attribute names and values, plus the key. It ignores
+        Python object overhead, so it is only useful as a relative measure for the max_bytes cap.
+        """
+        size = len(key[0]) + len(key[1]) + sum(len(a) for a in key[2])
+        for dn, attrs in result:
+            size += len(dn or '')
+            for attr, values in attrs.items():
+                size += len(attr)
+                if type(values) == list:
+                    size += sum(len(v) for v in values)
+                else:
+                    size += len(values)
+        return size
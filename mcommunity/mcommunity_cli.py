@@ -0,0 +1,161 @@
+import argparse
+import contextlib
+import logging
+import os
+import sys
+import time
+from typing import IO, ContextManager, Iterator, List, Optional
+
+from mcommunity.mcommunity_cache import MCommunityCache
+from mcommunity.mcommunity_eligibility import EligibilityEngine
+from mcommunity.mcommunity_export import MCommunityExporter
+from mcommunity.mcommunity_servers import MCommunityServerSet
+from mcommunity.mcommunity_session import MCommunitySession
+from mcommunity.mcommunity_snapshot import MCommunitySnapshot
+
+logger = logging.getLogger(__name__)
+
+APP_CN_VARIABLE: str = 'MCOMMUNITY_APP_CN'
+SECRET_VARIABLE: str = 'MCOMMUNITY_SECRET'
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    :return: the parser for the mcommunity command and its subcommands
+    """
+    parser = argparse.ArgumentParser(
+        prog='mcommunity', description='Bulk lookups and exports from the MCommunity directory.',
+        epilog=f'Credentials default to the {APP_CN_VARIABLE} and {SECRET_VARIABLE} environment variables.'
+    )
+    parser.add_argument('--app', default=os.environ.get(APP_CN_VARIABLE),
+                        help='cname of the MCommunity app to bind as (ex: ITS-Dropbox-McDirApp001)')
+    parser.add_argument('--secret', default=os.environ.get(SECRET_VARIABLE), help='secret/password for that app')
+    parser.add_argument('--server', action='append', dest='servers', metavar='URI',
+                        help='LDAP URI to search; repeat to spread searches over several replicas')
+    parser.add_argument('-o', '--output', default='-',
+                        help='file to write to, gzipped if it ends in .gz; defaults to stdout')
+    parser.add_argument('-f', '--format', choices=MCommunityExporter.formats,
+                        help="output format; defaults to the output file's extension, or jsonl")
+    parser.add_argument('--columns', help='comma-separated columns to write, e.g. uniqname,display_name,mail')
+    parser.add_argument('-w', '--workers', type=int, default=2, help='chunks to fetch at once (default: 2)')
+    parser.add_argument('--chunk-size', type=int, default=100, help='uniqnames or groups per search (default: 100)')
+    parser.add_argument('--cache', metavar='PATH',
+                        help='SQLite file to keep results in between runs; lookups found there are not searched for')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not print the summary')
+    parser.add_argument('-v', '--verbose', action='count', default=0, help='log more; repeat for debug logging')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    users = subparsers.add_parser('users', help='look up users by uniqname, or by LDAP filter')
+    users.add_argument('file', nargs='?', default='-', help='file of uniqnames, one per line; defaults to stdin')
+    users.add_argument('--filter', help='LDAP filter to page through instead, e.g. (umichInstRoles=FacultyAA*)')
+
+    group = subparsers.add_parser('group', help="dump groups, or write their members' user records")
+    group.add_argument('cns', nargs='+', metavar='CN', help='cnames of the groups')
+    group.add_argument('--members', action='store_true', help='write one user record per member instead')
+    group.add_argument('--recursive', action='store_true', help='with --members, include nested groups')
+
+    eligibility = subparsers.add_parser('eligibility', help='check service eligibility for many users')
+    eligibility.add_argument('file', nargs='?', default='-', help='file of uniqnames, one per line; defaults to stdin')
+    eligibility.add_argument('-s', '--service', action='append', dest='services', required=True, metavar='SERVICE',
+                             help='uSE system to check, e.g. Box; repeat for several')
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Entry point of the mcommunity command.
+    :param argv: arguments, without the program name; defaults to sys.argv[1:]
+    :return: exit status
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=[logging.WARNING, logging.INFO, logging.DEBUG][min(args.verbose, 2)])
+    if not args.app or not args.secret:
+        parser.error(f'--app and --secret (or {APP_CN_VARIABLE} and {SECRET_VARIABLE}) are required')
+
+    session = _session(args)
+    exporter = MCommunityExporter(
+        sys.stdout if args.output == '-' else args.output, format=args.format,
+        columns=args.columns.split(',') if args.columns else None, chunk_size=args.chunk_size,
+        max_workers=args.workers, use_cache=True, session=session
+    )
+    start = time.perf_counter()
+    try:
+        if args.command == 'users' and args.filter:
+            exporter.export_search(args.filter)
+        elif args.command == 'users':
+            with _open(args.file) as lines:
+                exporter.export_users(lines)
+        elif args.command == 'group':
+            if args.members:
+                for cn in args.cns:
+                    exporter.export_group_members(cn, recursive=args.recursive)
+            else:
+                exporter.export_groups(args.cns)
+        else:
+            engine = EligibilityEngine(services=args.services, chunk_size=args.chunk_size, max_workers=args.workers,
+                                       session=session)
+            with _open(args.file) as lines:
+                for row in engine.run(_names(lines)):
+                    exporter.write({
+                        'uniqname': row.uniqname, 'exists': row.exists, 'highest_affiliation': row.highest_affiliation,
+                        'sponsorship_type': row.sponsorship_type, **row.eligibility
+                    })
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        exporter.close()
+        if not args.quiet:
+            print(_summary(args.command, exporter.records, time.perf_counter() - start, session), file=sys.stderr)
+        session.close()
+    return 0
+
+
+def _names(lines: IO[str]) -> Iterator[str]:
+    """
+    :return: generator of the non-blank lines of a file, stripped
+    """
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield line
+
+
+def _open(path: str) -> ContextManager[IO[str]]:
+    """
+    :param path: path of a text file, or '-' for stdin
+    :return: context manager of the open file; stdin is left open when it exits
+    """
+    if path == '-':
+        return contextlib.nullcontext(sys.stdin)
+    return open(path, encoding='UTF-8')
+
+
+def _session(args: argparse.Namespace) -> MCommunitySession:
+    """
+    :return: a session for the command, with an in-process cache backed by the --cache snapshot, a pool big enough
+    for --workers, and the --server replicas if there are several
+    """
+    servers = args.servers or []
+    return MCommunitySession(
+        args.app, args.secret, server_uri=servers[0] if len(servers) == 1 else None, pool_size=max(args.workers, 1),
+        cache=MCommunityCache(), snapshot=MCommunitySnapshot(args.cache) if args.cache else None,
+        servers=MCommunityServerSet(servers) if len(servers) > 1 else None
+    )
+
+
+def _summary(command: str, records: int, seconds: float, session: MCommunitySession) -> str:
+    """
+    :return: one line of throughput, bind, search, retry and cache counts for the end of a run
+    """
+    counters = session.metrics.counters()
+    errors = sum(latency['errors'] for latency in session.metrics.stats().values())
+    return f'mcommunity {command}: {records} records in {seconds:.2f}s ' \
+           f'({records / seconds if seconds else 0.0:.0f} records/sec), {counters["binds"]} binds, ' \
+           f'{counters["searches"]} searches returning {counters["results"]} entries, {errors} errors, ' \
+           f'{counters["retries"]} retries ({counters["sleep_seconds"]:.1f}s waiting), ' \
+           f'cache {counters["cache_hits"] + counters["snapshot_hits"]} hits/{counters["cache_misses"]} misses'
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+import logging
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional, Union
+
+from mcommunity.mcommunity_base import MCommunityBase
+from mcommunity.mcommunity_group import MCommunityGroup
+from mcommunity.mcommunity_retry import Deadline
+from mcommunity.mcommunity_session import MCommunitySession
+from mcommunity.mcommunity_user import MCommunityUser
+
+logger = logging.getLogger(__name__)
+
+
+class FetchResult(NamedTuple):
+    name: str  # The uniqname or group cn that was requested
+    value: Optional[MCommunityBase]  # The MCommunityUser/MCommunityGroup, or None if fetching it raised
+    error: Optional[BaseException]  # The exception raised while fetching, or None if it succeeded
+
+
+class MCommunityClient:
+    max_workers: int = 8  # Keep at or below MCommunityBase.pool_size so workers don't wait for connections
+
+    def __init__(self, mcommunity_app_cn: Optional[str] = None, mcommunity_secret: Optional[str] = None,
+                 max_workers: Optional[int] = None, session: Optional[MCommunitySession] = None):
+        """
+        Run many independent MCommunity lookups in parallel on pooled connections.
+        :param mcommunity_app_cn: cname of the MCommunity app that the secret is tied to (ex: ITS-Dropbox-McDirApp001)
+        :param mcommunity_secret: secret/password for that app to connect to LDAP
+        :param max_workers: default concurrency limit for the fetch methods
+        :param session: session to use instead of mcommunity_app_cn and mcommunity_secret
+        """
+        self.session: MCommunitySession = session or MCommunitySession.for_credentials(
+            mcommunity_app_cn, mcommunity_secret
+        )
+        if max_workers is not None:
+            self.max_workers = max_workers
+
+    ##################
+    # Public Methods #
+    ##################
+    def fetch_users(self, uniqnames: Iterable[str], max_workers: Optional[int] = None, ordered: bool = True,
+                    profile: Union[str, list, None] = None, deadline: Optional[float] = None) -> Iterator[FetchResult]:
+        """
+        Look up many users concurrently. An error looking up one user is returned on its FetchResult rather than
+        raised, so it does not stop the rest of the batch.
+        :param uniqnames: uniqnames to look up
+        :param max_workers: how many searches to run at once; defaults to self.max_workers
+        :param ordered: if True, yield results in the order of uniqnames; if False, yield them as they complete
+        :param profile: MCommunityUser fetch profile, e.g. 'minimal'; defaults to 'full'
+        :param deadline: seconds the whole batch may take, counted from the first result being requested; lookups
+        started or retrying after that fail with DeadlineExceeded instead of waiting out their retries
+        :return: generator of FetchResults whose value is an MCommunityUser
+        """
+        return self._fetch(
+            lambda uniqname: self.session.user(uniqname, profile=profile),
+            uniqnames, max_workers, ordered, deadline
+        )
+
+    def fetch_groups(self, cns: Iterable[str], max_workers: Optional[int] = None, ordered: bool = True,
+                     profile: Union[str, list, None] = None, deadline: Optional[float] = None) -> Iterator[FetchResult]:
+        """
+        Look up many groups concurrently. A group that does not exist is returned with its NameError on its
+        FetchResult rather than raised, so it does not stop the rest of the batch.
+        :param cns: group cnames to look up
+        :param max_workers: how many searches to run at once; defaults to self.max_workers
+        :param ordered: if True, yield results in the order of cns; if False, yield them as they complete
+        :param profile: MCommunityGroup fetch profile, e.g. 'members'; defaults to 'full'
+        :param deadline: seconds the whole batch may take; see fetch_users
+        :return: generator of FetchResults whose value is an MCommunityGroup
+        """
+        return self._fetch(
+            lambda cn: self.session.group(cn, profile=profile),
+            cns, max_workers, ordered, deadline
+        )
+
+    def iter_users(self, query_object: str, page_size: Optional[int] = None,
+                   profile: Union[str, list, None] = None) -> Iterator[MCommunityUser]:
+        """
+        Stream every user matching an LDAP filter, e.g. '(umichInstRoles=FacultyAA)', fetching a page at a time so
+        memory stays flat however many users match.
+        :param query_object: the LDAP filter
+        :param page_size: entries per page; defaults to MCommunityBase.page_size
+        :param profile: MCommunityUser fetch profile; defaults to 'full'
+        :return: generator of MCommunityUsers
+        """
+        base = MCommunityBase(session=self.session)
+        attributes = MCommunityUser.profile_attributes(profile)
+        for dn, attrs in base.search_paged(MCommunityUser.search_base, query_object, attributes, page_size):
+            yield self.session.user(base._rdn_value(dn), raw_result=[(dn, attrs)], profile=attributes)
+
+    def iter_groups(self, query_object: str, page_size: Optional[int] = None,
+                    profile: Union[str, list, None] = None) -> Iterator[MCommunityGroup]:
+        """
+        Stream every group matching an LDAP filter, fetching a page at a time.
+        :param query_object: the LDAP filter
+        :param page_size: entries per page; defaults to MCommunityBase.page_size
+        :param profile: MCommunityGroup fetch profile; defaults to 'full'
+        :return: generator of MCommunityGroups
+        """
+        base = MCommunityBase(session=self.session)
+        attributes = MCommunityGroup.profile_attributes(profile)
+        for dn, attrs in base.search_paged(MCommunityGroup.search_base, query_object, attributes, page_size):
+            yield self.session.group(base._rdn_value(dn), raw_result=[(dn, attrs)], profile=attributes)
+
+    ###################
+    # Private Methods #
+    ###################
+    def _fetch(self, build: Callable[[str], MCommunityBase], names: Iterable[str], max_workers: Optional[int],
+               ordered: bool, deadline: Optional[float] = None) -> Iterator[FetchResult]:
+        """
+        Run build(name) for each name on a thread pool, keeping at most twice max_workers lookups queued so memory
+        stays bounded however many names there are.
+        :param build: callable that looks up one name
+        :param names: names to look up
+        :param max_workers: concurrency limit
+        :param ordered: whether to yield in input order or completion order
+        :param deadline: seconds the whole batch may take
+        :return: generator of FetchResults
+        """
+        max_workers = max_workers or self.max_workers
+        pending: deque = deque()  # (name, future) in submission order
+        batch_deadline = Deadline(deadline) if deadline is not None else None
+
+        def _run(name: str) -> FetchResult:
+            try:
+                with batch_deadline.scope() if batch_deadline is not None else nullcontext():
+                    return FetchResult(name, build(name), None)
+            except Exception as e:
+                logger.debug(f'Failed to fetch {name} from MCommunity: {e!r}')
+                return FetchResult(name, None, e)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            try:
+                for name in names:
+                    pending.append((name, executor.submit(_run, name)))
+                    if len(pending) < max_workers * 2:
+                        continue
+                    if ordered:
+                        yield pending.popleft()[1].result()
+                    else:
+                        yield from self._pop_completed(pending)
+                while pending:
+                    if ordered:
+                        yield pending.popleft()[1].result()
+                    else:
+                        yield from self._pop_completed(pending)
+            finally:
+                for _, future in pending:  # Don't start lookups nobody will read if the caller stopped early
+                    future.cancel()
+
+    @staticmethod
+    def _pop_completed(pending: deque) -> Iterator[FetchResult]:
+        done, _ = wait([future for _, future in pending], return_when=FIRST_COMPLETED)
+        remaining = [(name, future) for name, future in pending if future not in done]
+        pending.clear()
+        pending.extend(remaining)
+        for future in done:
+            yield future.result()
@@ -0,0 +1,119 @@
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Union
+
+from mcommunity.mcommunity_base import MCommunityBase
+from mcommunity.mcommunity_session import MCommunitySession
+from mcommunity.mcommunity_user import MCommunityUser
+
+logger = logging.getLogger(__name__)
+
+
+class EligibilityRow(NamedTuple):
+    uniqname: str
+    exists: bool
+    highest_affiliation: str  # 'NA' if the user does not exist or has no roles
+    sponsorship_type: int  # See MCommunityUser.check_sponsorship_type
+    eligibility: Dict[str, bool]  # Service -> eligible, per MCommunityUser.check_service_entitlements
+
+
+class EligibilityEngine:
+    chunk_size: int = 100  # Uniqnames per batched search
+    max_workers: int = 2  # Chunks fetched at once while earlier chunks are being evaluated
+
+    def __init__(self, mcommunity_app_cn: Optional[str] = None, mcommunity_secret: Optional[str] = None,
+                 services: Iterable[str] = (), chunk_size: Optional[int] = None, max_workers: Optional[int] = None,
+                 profile: Union[str, list] = 'eligibility', session: Optional[MCommunitySession] = None):
+        """
+        Compute highest affiliation, sponsorship type and service eligibility for many users, fetching them with
+        batched searches limited to the attributes the checks need.
+        :param mcommunity_app_cn: cname of the MCommunity app that the secret is tied to (ex: ITS-Dropbox-McDirApp001)
+        :param mcommunity_secret: secret/password for that app to connect to LDAP
+        :param services: the uSE systems to check for every user
+        :param chunk_size: uniqnames per batched search
+        :param max_workers: how many chunks to fetch concurrently
+        :param profile: MCommunityUser fetch profile to look users up with
+        :param session: session to use instead of mcommunity_app_cn and mcommunity_secret
+        """
+        self.session: MCommunitySession = session or MCommunitySession.for_credentials(
+            mcommunity_app_cn, mcommunity_secret
+        )
+        self.services: List[str] = list(services)
+        if chunk_size is not None:
+            self.chunk_size = chunk_size
+        if max_workers is not None:
+            self.max_workers = max_workers
+        self.ldap_attributes: list = MCommunityUser.profile_attributes(profile)
+
+        self.users_evaluated: int = 0
+        self.seconds: float = 0.0
+        self._base = MCommunityBase(session=self.session)
+
+    @property
+    def users_per_second(self) -> float:
+        return self.users_evaluated / self.seconds if self.seconds else 0.0
+
+    ##################
+    # Public Methods #
+    ##################
+    def run(self, uniqnames: Iterable[str]) -> Iterator[EligibilityRow]:
+        """
+        Evaluate every uniqname, yielding one row per uniqname in input order as each chunk is fetched. Throughput is
+        added to users_evaluated/seconds/users_per_second as rows are produced and logged when the run finishes.
+        :param uniqnames: uniqnames to evaluate; may be a generator of any length
+        :return: generator of EligibilityRows
+        """
+        uniqnames = iter(uniqnames)
+        start = time.perf_counter()
+        evaluated = 0
+        pending: deque = deque()  # (chunk, future of search_many results)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            try:
+                while True:
+                    while len(pending) < self.max_workers:
+                        chunk = list(islice(uniqnames, self.chunk_size))
+                        if not chunk:
+                            break
+                        pending.append((chunk, executor.submit(
+                            self._base.search_many, MCommunityUser.search_base, 'uid', chunk, self.ldap_attributes,
+                            self.chunk_size
+                        )))
+                    if not pending:
+                        break
+                    chunk, future = pending.popleft()
+                    results = future.result()
+                    for uniqname in chunk:
+                        yield self.evaluate(uniqname, results[uniqname])
+                    evaluated += len(chunk)
+                    self.users_evaluated += len(chunk)
+                    self.seconds += time.perf_counter() - start
+                    start = time.perf_counter()
+            finally:
+                for _, future in pending:
+                    future.cancel()
+        logger.info(f'Evaluated {evaluated} users for {len(self.services)} services '
+                    f'({self.users_per_second:.0f} users/sec overall)')
+
+    def evaluate(self, uniqname: str, raw_result: list) -> EligibilityRow:
+        """
+        Evaluate one already-fetched user.
+        :param uniqname: the uniqname
+        :param raw_result: the user's query result, fetched with self.ldap_attributes
+        :return: the row
+        """
+        user = self.session.user(uniqname, raw_result=raw_result, profile=self.ldap_attributes)
+        if not user.exists:
+            return EligibilityRow(uniqname, False, 'NA', 0, dict.fromkeys(self.services, False))
+        user.populate_highest_affiliation()
+        return EligibilityRow(
+            uniqname, True, user.highest_affiliation, user.check_sponsorship_type(),
+            user.check_service_entitlements(self.services)
+        )
+
+    def stats(self) -> dict:
+        return {
+            'users': self.users_evaluated, 'seconds': self.seconds, 'users_per_second': self.users_per_second
+        }
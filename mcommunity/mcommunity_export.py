@@ -0,0 +1,237 @@
+import csv
+import gzip
+import itertools
+import json
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from mcommunity.mcommunity_base import MCommunityBase
+from mcommunity.mcommunity_group import MCommunityGroup
+from mcommunity.mcommunity_record import GroupRecord, UserRecord
+from mcommunity.mcommunity_session import MCommunitySession
+from mcommunity.mcommunity_user import MCommunityUser
+
+logger = logging.getLogger(__name__)
+
+
+class MCommunityExporter:
+    """
+    Streams users or groups to JSONL or CSV one record at a time, straight from batched or paged searches, so memory
+    stays bounded by max_workers chunks of results however many records are written. By default results are not
+    cached, since a dump would only push everything else out of the cache.
+    """
+    formats: tuple = ('jsonl', 'csv')
+    user_columns: tuple = (
+        'uniqname', 'exists', 'display_name', 'entityid', 'affiliations', 'highest_affiliation', 'service_entitlements'
+    )  # Available for users besides any other LDAP attribute, e.g. 'mail'
+    group_columns: tuple = ('name', 'members', 'member_groups')
+    csv_separator: str = ';'  # Joins multi-valued attributes in a CSV cell
+
+    def __init__(self, out: Union[str, IO[str]], format: Optional[str] = None, columns: Optional[List[str]] = None,
+                 compress: Optional[bool] = None, mcommunity_app_cn: Optional[str] = None,
+                 mcommunity_secret: Optional[str] = None, chunk_size: int = 100, max_workers: int = 1,
+                 use_cache: bool = False, session: Optional[MCommunitySession] = None):
+        """
+        :param out: path to write to, or an open text file (e.g. sys.stdout)
+        :param format: 'jsonl' or 'csv'; defaults to the path's extension (ignoring .gz), or jsonl
+        :param columns: columns to write, in order; defaults to user_columns or group_columns
+        :param compress: gzip the output; defaults to whether the path ends in .gz. Only for paths.
+        :param mcommunity_app_cn: cname of the MCommunity app that the secret is tied to (ex: ITS-Dropbox-McDirApp001)
+        :param mcommunity_secret: secret/password for that app to connect to LDAP
+        :param chunk_size: how many users or groups to fetch per search
+        :param max_workers: how many chunks to fetch at once while earlier chunks are being written
+        :param use_cache: whether searches read and update the session's cache and snapshot
+        :param session: session to use instead of mcommunity_app_cn and mcommunity_secret
+        """
+        path = out if isinstance(out, str) else None
+        if format is None:
+            format = 'csv' if path is not None and path.lower().endswith(('.csv', '.csv.gz')) else 'jsonl'
+        if format not in self.formats:
+            raise ValueError(f'Unknown format {format}; expected one of {", ".join(self.formats)}')
+        if compress is None:
+            compress = path is not None and path.lower().endswith('.gz')
+        if compress and path is None:
+            raise ValueError('compress needs a path; wrap the file in gzip yourself instead')
+
+        self.format: str = format
+        self.columns: Optional[List[str]] = list(columns) if columns is not None else None
+        self.chunk_size: int = chunk_size
+        self.max_workers: int = max_workers
+        self.use_cache: bool = use_cache
+        self.session: MCommunitySession = session or MCommunitySession.for_credentials(
+            mcommunity_app_cn, mcommunity_secret
+        )
+        self.records: int = 0  # Written so far
+
+        if path is None:
+            self._file, self._owns_file = out, False
+        elif compress:
+            self._file, self._owns_file = gzip.open(path, 'wt', encoding='UTF-8', newline=''), True
+        else:
+            self._file, self._owns_file = open(path, 'w', encoding='UTF-8', newline=''), True
+        self._csv: Optional[csv.DictWriter] = None
+        self._base = MCommunityBase(session=self.session)
+
+    def __enter__(self) -> 'MCommunityExporter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    ##################
+    # Public Methods #
+    ##################
+    def close(self) -> None:
+        """
+        Flush the output, and close it if the exporter opened it.
+        :return: None
+        """
+        if self._owns_file:
+            self._file.close()
+        else:
+            self._file.flush()
+
+    def export_group_members(self, cn: str, recursive: bool = False) -> int:
+        """
+        Write one user record per member of a group.
+        :param cn: the cname of the group
+        :param recursive: if True, include the members of nested groups, see MCommunityGroup.expand
+        :return: number of records written
+        """
+        group = self.session.group(cn, profile='members')
+        return self.export_users(group.expand(recursive=recursive, chunk_size=self.chunk_size))
+
+    def export_groups(self, cns: Iterable[str]) -> int:
+        """
+        Write one record per group with its direct members, fetching chunk_size groups per search. Groups that do not
+        exist are skipped with a warning.
+        :param cns: cnames of the groups; may be a generator
+        :return: number of records written
+        """
+        columns = self._columns(self.group_columns, allow_attributes=False)
+        written = 0
+        for chunk, results in self._fetched_chunks(cns, MCommunityGroup.search_base, 'cn', ['cn', 'member']):
+            for cn in chunk:
+                if not results[cn]:
+                    logger.warning(f'MCommunity group {cn} does not exist; skipping it')
+                    continue
+                members, member_groups = MCommunityGroup._parse_members(results[cn][0][1].get('member', []))
+                record = GroupRecord(cn, members, member_groups)
+                self.write({column: getattr(record, column) for column in columns}, columns)
+                written += 1
+        return written
+
+    def export_search(self, query_object: str, page_size: Optional[int] = None) -> int:
+        """
+        Write one user record per person matching an LDAP filter, fetched page by page with search_paged.
+        :param query_object: the filter, e.g. '(umichInstRoles=FacultyAA*)'
+        :param page_size: entries per page; defaults to the session's or the class's page_size
+        :return: number of records written
+        """
+        columns = self._columns(self.user_columns)
+        attributes = self._user_attributes(columns)
+        written = 0
+        for dn, attrs in self._base.search_paged(MCommunityUser.search_base, query_object, attributes, page_size):
+            self.write(self._user_row(self._base._rdn_value(dn), [(dn, attrs)], columns), columns)
+            written += 1
+        return written
+
+    def export_users(self, uniqnames: Iterable[str]) -> int:
+        """
+        Write one record per user, fetching chunk_size users per search. Users that do not exist are written too, with
+        exists false.
+        :param uniqnames: uniqnames; may be a generator, e.g. lines of a file
+        :return: number of records written
+        """
+        columns = self._columns(self.user_columns)
+        attributes = self._user_attributes(columns)
+        written = 0
+        for chunk, results in self._fetched_chunks(uniqnames, MCommunityUser.search_base, 'uid', attributes):
+            for uniqname in dict.fromkeys(chunk):
+                self.write(self._user_row(uniqname, results[uniqname], columns), columns)
+                written += 1
+        return written
+
+    def write(self, row: dict, columns: Optional[List[str]] = None) -> None:
+        """
+        Write one record, e.g. an EligibilityRow flattened to a dict.
+        :param row: dict of column to value; lists and tuples are JSON arrays, or joined with csv_separator in CSV
+        :param columns: the CSV header, fixed by the first record written; defaults to the row's keys
+        :return: None
+        """
+        if self.format == 'jsonl':
+            self._file.write(json.dumps(row) + '\n')
+        else:
+            if self._csv is None:
+                self._csv = csv.DictWriter(self._file, columns or list(row))
+                self._csv.writeheader()
+            self._csv.writerow({
+                column: self.csv_separator.join(value) if type(value) in (list, tuple) else value
+                for column, value in row.items()
+            })
+        self.records += 1
+
+    ###################
+    # Private Methods #
+    ###################
+    def _columns(self, defaults: tuple, allow_attributes: bool = True) -> List[str]:
+        """
+        :param defaults: the columns written if none were chosen
+        :param allow_attributes: whether columns other than defaults are allowed, as LDAP attributes
+        :return: the columns to write
+        """
+        if self.columns is None:
+            return list(defaults)
+        unknown = [column for column in self.columns if column not in defaults]
+        if unknown and not allow_attributes:
+            raise ValueError(f'Unknown columns {", ".join(unknown)}; expected some of {", ".join(defaults)}')
+        return self.columns
+
+    def _fetched_chunks(self, names: Iterable[str], search_base: str, key_attribute: str,
+                        attributes: list) -> Iterator[Tuple[List[str], Dict[str, list]]]:
+        """
+        Fetch names chunk_size at a time with search_many, up to max_workers chunks at once, in input order.
+        :param names: uniqnames or cnames; surrounding whitespace and blank names are dropped, so lines of a file do
+        :return: generator of tuples of each chunk and its search_many results
+        """
+        names = (name.strip() for name in names)
+        iterator = (name for name in names if name)
+        pending: deque = deque()  # (chunk, future of search_many results)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            try:
+                while True:
+                    while len(pending) < self.max_workers:
+                        chunk = list(itertools.islice(iterator, self.chunk_size))
+                        if not chunk:
+                            break
+                        pending.append((chunk, executor.submit(
+                            self._base.search_many, search_base, key_attribute, chunk, attributes, self.chunk_size,
+                            use_cache=self.use_cache
+                        )))
+                    if not pending:
+                        return
+                    chunk, future = pending.popleft()
+                    yield chunk, future.result()
+            finally:
+                for _, future in pending:
+                    future.cancel()
+
+    def _user_attributes(self, columns: List[str]) -> list:
+        """
+        :return: attributes to fetch for the columns: UserRecord's, plus any columns that are LDAP attributes
+        """
+        return list(UserRecord.attributes) + [column for column in columns if column not in self.user_columns]
+
+    def _user_row(self, uniqname: str, raw_result: list, columns: List[str]) -> dict:
+        record = UserRecord(uniqname, raw_result)
+        attrs = raw_result[0][1] if raw_result else {}
+        row = {}
+        for column in columns:
+            if column in self.user_columns:
+                row[column] = getattr(record, column)
+            else:
+                values = [value.decode('UTF-8') for value in attrs.get(column, [])]
+                row[column] = values[0] if len(values) == 1 else values
+        return row
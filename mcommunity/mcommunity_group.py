@@ -1,8 +1,8 @@
 import logging
-
-import ldap
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 from mcommunity.mcommunity_base import MCommunityBase
+from mcommunity.mcommunity_session import MCommunitySession
 from mcommunity.mcommunity_user import MCommunityUser
 
 logger = logging.getLogger(__name__)
@@ -10,43 +10,164 @@ logger = logging.getLogger(__name__)
 
 class MCommunityGroup(MCommunityBase):
     search_base: str = 'ou=User Groups,ou=Groups,dc=umich,dc=edu'
+    fetch_profiles: dict = {
+        'minimal': ['cn'],
+        'members': ['cn', 'member'],
+        'full': MCommunityBase.ldap_attributes,
+    }
 
-    def __init__(self, cn: str, mcommunity_app_cn: str, mcommunity_secret: str):
+    def __init__(self, cn: str, mcommunity_app_cn: Optional[str] = None, mcommunity_secret: Optional[str] = None,
+                 raw_result: Optional[list] = None, profile: Union[str, list, None] = None,
+                 session: Optional[MCommunitySession] = None):
         """
         Get data about an M-Community group via LDAP.
         :param cn: the cname of the M-Community group (this is the NAME, not the email!)
         e.g. "ITS Collaboration Services Core Team", not "its-collab-core"
+        :param raw_result: an already-fetched query result for this group; if given, no search is done
+        :param profile: which attributes to fetch: 'minimal', 'members', 'full' (the default) or a list of attributes;
+        member is always fetched (with a follow-up search if the profile left it out) since it is needed for members.
+        If raw_result is given, this is the profile it was fetched with.
+        :param session: session to use instead of mcommunity_app_cn and mcommunity_secret, see MCommunitySession.group
         :return: None
         """
-        super().__init__(mcommunity_app_cn, mcommunity_secret)
+        super().__init__(mcommunity_app_cn, mcommunity_secret, session)
         self.name: str = cn
         self.exists: bool = False
         self.members: list = []
+        self.member_groups: list = []  # cnames of groups nested directly in this one
         self.members_mcomm_users: list = []
         self.query_object: str = f'cn={self.name}'
 
-        self.raw_result = self.search(self.search_base, self.query_object, self.ldap_attributes)
+        self._fetched_attributes = self.profile_attributes(profile)
+        if raw_result is None:
+            raw_result = self.search(self.search_base, self.query_object, self._fetched_attributes)
+        self.raw_result = raw_result
 
         if not self.raw_result:
             raise NameError(f'MCommunity group {self.name} does not exist.')
         else:
             self.exists = True
-            all_members = []
-            for i in self.raw_result[0][1].get('member', []):
-                all_members.append(ldap.dn.explode_dn(i, flags=ldap.DN_FORMAT_LDAPV2)[0].split('uid=')[1])
-                self.members = list(set(all_members))  # Convert to a set then back to a list as a way of removing duplicates
+            self.members, self.member_groups = self._parse_members(self._member_values())
+
+    def expand(self, recursive: bool = True, chunk_size: int = 100,
+               memo: Optional[Dict[str, Tuple[list, list]]] = None) -> Dict[str, Tuple[str, ...]]:
+        """
+        Flatten the membership of this group and, if recursive, every group nested in it. Nested groups are resolved
+        breadth-first with one batched search per level; each group is fetched at most once even if it is nested in
+        several places, and cycles are skipped.
+        :param recursive: if False, only the direct members are returned
+        :param chunk_size: how many nested groups to fetch per search
+        :param memo: optional dict of lowercased cn to (members, member_groups), shared between calls to avoid
+        refetching subgroups common to several expanded groups
+        :return: dict of each unique uniqname to the path of group cnames it was first reached through, starting with
+        this group, e.g. {'nemcardf': ('parent-group', 'child-group')}
+        """
+        paths = {uniqname: (self.name,) for uniqname in self.members}
+        if not recursive:
+            return paths
 
-    def populate_members_mcomm_users(self) -> list:
+        memo = {} if memo is None else memo
+        memo[self.name.lower()] = (self.members, self.member_groups)
+        visited = {self.name.lower()}
+        level = [(cn, (self.name, cn)) for cn in self.member_groups]
+        while level:
+            to_fetch = [cn for cn, _ in level if cn.lower() not in memo and cn.lower() not in visited]
+            for cn, result in self.search_many(self.search_base, 'cn', to_fetch, ['cn', 'member'], chunk_size).items():
+                memo[cn.lower()] = self._parse_members(result[0][1].get('member', [])) if result else ([], [])
+
+            next_level = []
+            for cn, path in level:
+                if cn.lower() in visited:
+                    logger.debug(f'Skipping {cn} in {" > ".join(path)}; it was already expanded (or is a cycle)')
+                    continue
+                visited.add(cn.lower())
+                members, member_groups = memo[cn.lower()]
+                for uniqname in members:
+                    paths.setdefault(uniqname, path)  # Breadth-first, so the first path found is the shortest
+                next_level += [(sub_cn, path + (sub_cn,)) for sub_cn in member_groups]
+            level = next_level
+        return paths
+
+    def populate_members_mcomm_users(self, chunk_size: int = 100, profile: Union[str, list, None] = None) -> list:
         """
-        Add all members of the group to self.members_mcomm_users as MCommunityUser objects.
+        Add all members of the group to self.members_mcomm_users as MCommunityUser objects. Members are looked up in
+        batches of chunk_size per search rather than one search per member.
+        :param chunk_size: how many members to resolve per search
+        :param profile: MCommunityUser fetch profile to look the members up with; defaults to 'full'
         :return: list of MCommunityUsers (self.members.mcomm_users)
         """
         if not self.members_mcomm_users:  # Don't overwrite if it has already been populated
-            self.members_mcomm_users = [MCommunityUser(
-                uniqname, self.mcommunity_app_cn, self.mcommunity_secret) for uniqname in self.members]
+            attributes = MCommunityUser.profile_attributes(profile)
+            results = self.search_many(MCommunityUser.search_base, 'uid', self.members, attributes, chunk_size)
+            self.members_mcomm_users = [
+                self.session.user(uniqname, raw_result=results[uniqname], profile=attributes)
+                for uniqname in self.members
+            ]
         return self.members_mcomm_users
 
     def to_dict(self):
         d = super().to_dict()
         d['members_mcomm_users'] = [i.to_dict() for i in self.members_mcomm_users]
         return d
+
+    ###################
+    # Private Methods #
+    ###################
+    def _member_values(self) -> Iterator[Union[str, bytes]]:
+        """
+        Yield the raw values of the group's member attribute. If the server returned the attribute in ranges (e.g.
+        member;range=0-1499, as Active Directory does for very large groups), the remaining ranges are fetched one at a
+        time as the values are consumed.
+        :return: generator of member DNs
+        """
+        self._ensure_attribute('member')
+        attrs = self.raw_result[0][1]
+        yield from attrs.get('member', [])
+        range_key = self._member_range_key(attrs)
+        while range_key is not None:
+            yield from attrs[range_key]
+            end = range_key.rsplit('-', 1)[1]
+            if end == '*':  # That was the last range
+                break
+            result = self.search(self.search_base, self.query_object, [f'member;range={int(end) + 1}-*'])
+            attrs = result[0][1] if result else {}
+            range_key = self._member_range_key(attrs)
+
+    @staticmethod
+    def _member_range_key(attrs: dict) -> Optional[str]:
+        return next((key for key in attrs if key.lower().startswith('member;range=')), None)
+
+    @classmethod
+    def _parse_members(cls, values: Iterable[Union[str, bytes]]) -> Tuple[List[str], List[str]]:
+        """
+        Extract the uniqnames and nested group cnames from member DNs in one pass, removing duplicates and keeping the
+        server's order.
+        :param values: member DNs
+        :return: tuple of the list of uniqnames and the list of nested group cnames
+        """
+        members = {}  # dicts rather than sets so the order is stable
+        member_groups = {}
+        for value in values:
+            uid = cls._member_uid(value)
+            if uid is not None:
+                members[uid] = None
+            elif value[:3].lower() in (b'cn=', 'cn='):
+                member_groups[cls._rdn_value(value)] = None
+        return list(members), list(member_groups)
+
+    @classmethod
+    def _member_uid(cls, dn: Union[str, bytes]) -> Optional[str]:
+        """
+        Fast uniqname extraction from a member DN like b'uid=nemcardf,ou=People,dc=umich,dc=edu'. Only DNs with escaped
+        characters go through the full python-ldap DN parser.
+        :param dn: the member DN
+        :return: the uniqname, or None if the DN is not a person
+        """
+        if type(dn) == str:
+            dn = dn.encode('UTF-8')
+        if dn[:4].lower() != b'uid=':
+            return None
+        if b'\\' in dn:
+            return cls._rdn_value(dn)
+        end = dn.find(b',')
+        return dn[4:end if end != -1 else len(dn)].decode('UTF-8')
@@ -0,0 +1,254 @@
+import logging
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from mcommunity.mcommunity_base import MCommunityBase
+from mcommunity.mcommunity_group import MCommunityGroup
+from mcommunity.mcommunity_session import MCommunitySession
+
+logger = logging.getLogger(__name__)
+
+
+class MemberSet:
+    """
+    Set of uniqnames from a GroupSet, stored as a bitmap over the GroupSet's interned uniqnames. Combine MemberSets
+    from the same GroupSet with | & - ^; iterating yields uniqnames in the order they were first loaded.
+    """
+    __slots__ = ('_group_set', '_bitmap')
+
+    def __init__(self, group_set: 'GroupSet', bitmap: int = 0):
+        self._group_set: GroupSet = group_set
+        self._bitmap: int = bitmap
+
+    def __contains__(self, uniqname: str) -> bool:
+        index = self._group_set._index.get(uniqname)
+        return index is not None and bool(self._bitmap >> index & 1)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, MemberSet):
+            return self._group_set is other._group_set and self._bitmap == other._bitmap
+        return NotImplemented
+
+    def __iter__(self) -> Iterator[str]:
+        names = self._group_set._names
+        return (names[index] for index in GroupSet._indexes(self._bitmap))
+
+    def __len__(self) -> int:
+        return bin(self._bitmap).count('1')
+
+    def __or__(self, other: 'MemberSet') -> 'MemberSet':
+        return MemberSet(self._group_set, self._bitmap | self._check(other)._bitmap)
+
+    def __and__(self, other: 'MemberSet') -> 'MemberSet':
+        return MemberSet(self._group_set, self._bitmap & self._check(other)._bitmap)
+
+    def __sub__(self, other: 'MemberSet') -> 'MemberSet':
+        return MemberSet(self._group_set, self._bitmap & ~self._check(other)._bitmap)
+
+    def __xor__(self, other: 'MemberSet') -> 'MemberSet':
+        return MemberSet(self._group_set, self._bitmap ^ self._check(other)._bitmap)
+
+    def __repr__(self) -> str:
+        return f'MemberSet({len(self)} members)'
+
+    ##################
+    # Public Methods #
+    ##################
+    def to_list(self) -> List[str]:
+        return list(self)
+
+    ###################
+    # Private Methods #
+    ###################
+    def _check(self, other: 'MemberSet') -> 'MemberSet':
+        if not isinstance(other, MemberSet) or other._group_set is not self._group_set:
+            raise ValueError('MemberSets can only be combined with MemberSets from the same GroupSet')
+        return other
+
+
+class GroupSet:
+    """
+    The memberships of many groups, loaded with batched searches, for set algebra over them: union, intersection,
+    difference and how many of the groups each person is in. Every uniqname is interned once to a small int and each
+    group's membership is a bitmap over those ints, so a group costs one bit per distinct uniqname in the whole set
+    (about 50 KB per group at 400,000 people) and combining groups is a handful of big-int operations rather than a
+    scan of member lists.
+    """
+    chunk_size: int = 100  # Groups per search
+
+    def __init__(self, cns: Iterable[str] = (), mcommunity_app_cn: Optional[str] = None,
+                 mcommunity_secret: Optional[str] = None, recursive: bool = False,
+                 session: Optional[MCommunitySession] = None):
+        """
+        :param cns: cnames of groups to load straight away, see load
+        :param mcommunity_app_cn: cname of the MCommunity app that the secret is tied to (ex: ITS-Dropbox-McDirApp001)
+        :param mcommunity_secret: secret/password for that app to connect to LDAP
+        :param recursive: see load
+        :param session: session to use instead of mcommunity_app_cn and mcommunity_secret
+        """
+        self.session: MCommunitySession = session or MCommunitySession.for_credentials(
+            mcommunity_app_cn, mcommunity_secret
+        )
+        self._names: List[str] = []  # Interned int -> uniqname
+        self._index: Dict[str, int] = {}  # Uniqname -> interned int
+        self._bitmaps: Dict[str, int] = {}  # Group cn -> bitmap of its members
+        self._base = MCommunityBase(session=self.session)
+
+        cns = list(cns)
+        if cns:
+            self.load(cns, recursive)
+
+    def __contains__(self, cn: str) -> bool:
+        return cn in self._bitmaps
+
+    def __len__(self) -> int:
+        return len(self._bitmaps)
+
+    @property
+    def cns(self) -> List[str]:
+        return list(self._bitmaps)
+
+    ##################
+    # Public Methods #
+    ##################
+    def add(self, cn: str, members: Iterable[str]) -> None:
+        """
+        Add a group whose members are already known, e.g. from an MCommunityGroup or a GroupSync, replacing any group
+        with the same cname.
+        :param cn: the cname of the group
+        :param members: its uniqnames
+        :return: None
+        """
+        index = self._index
+        names = self._names
+        indexes = []
+        for uniqname in members:
+            i = index.get(uniqname)
+            if i is None:
+                i = index[uniqname] = len(names)
+                names.append(uniqname)
+            indexes.append(i)
+        self._bitmaps[cn] = self._bitmap(indexes)
+
+    def counts(self, cns: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """
+        :param cns: cnames of the groups to count over; defaults to all of them
+        :return: dict of each uniqname in at least one of the groups to how many of them they are in
+        """
+        counts = array('I', bytes(4 * len(self._names)))
+        for cn in self.cns if cns is None else cns:
+            for i in self._indexes(self._group_bitmap(cn)):
+                counts[i] += 1
+        names = self._names
+        return {names[i]: count for i, count in enumerate(counts) if count}
+
+    def difference(self, cn: str, *others: str) -> MemberSet:
+        """
+        :return: members of group cn who are in none of the others
+        """
+        bitmap = self._group_bitmap(cn)
+        for other in others:
+            bitmap &= ~self._group_bitmap(other)
+        return MemberSet(self, bitmap)
+
+    def groups_for(self, uniqname: str) -> List[str]:
+        """
+        :param uniqname: the uniqname to look up
+        :return: cnames of the groups in the set that the user is in
+        """
+        i = self._index.get(uniqname)
+        if i is None:
+            return []
+        return [cn for cn, bitmap in self._bitmaps.items() if bitmap >> i & 1]
+
+    def intersection(self, *cns: str) -> MemberSet:
+        """
+        :return: members who are in every one of the groups
+        """
+        if not cns:
+            return MemberSet(self)
+        bitmap = self._group_bitmap(cns[0])
+        for cn in cns[1:]:
+            bitmap &= self._group_bitmap(cn)
+        return MemberSet(self, bitmap)
+
+    def load(self, cns: Iterable[str], recursive: bool = False) -> None:
+        """
+        Fetch groups with one search per chunk_size groups and add them.
+        :param cns: cnames of the groups
+        :param recursive: if True, each group's members include the members of the groups nested in it (see
+        MCommunityGroup.expand); nested groups common to several of the groups are fetched once
+        :return: None; raises NameError naming the groups that do not exist, after adding the ones that do
+        """
+        cns = list(dict.fromkeys(cns))
+        results = self._base.search_many(MCommunityGroup.search_base, 'cn', cns, ['cn', 'member'], self.chunk_size)
+        memo = {}
+        missing = []
+        for cn in cns:
+            if not results[cn]:
+                missing.append(cn)
+                continue
+            group = self.session.group(cn, raw_result=results[cn], profile='members')
+            self.add(cn, group.expand(chunk_size=self.chunk_size, memo=memo) if recursive else group.members)
+        logger.debug(f'Loaded {len(cns) - len(missing)} groups; {len(self._names)} distinct members in the set')
+        if missing:
+            raise NameError(f'MCommunity groups {", ".join(missing)} do not exist.')
+
+    def members(self, cn: str) -> MemberSet:
+        """
+        :param cn: the cname of one of the groups
+        :return: its members
+        """
+        return MemberSet(self, self._group_bitmap(cn))
+
+    def remove(self, cn: str) -> None:
+        """
+        Drop a group from the set; its members stay interned.
+        :param cn: the cname of the group
+        :return: None
+        """
+        self._bitmaps.pop(cn, None)
+
+    def union(self, *cns: str) -> MemberSet:
+        """
+        :return: members who are in at least one of the groups
+        """
+        bitmap = 0
+        for cn in cns:
+            bitmap |= self._group_bitmap(cn)
+        return MemberSet(self, bitmap)
+
+    ###################
+    # Private Methods #
+    ###################
+    def _group_bitmap(self, cn: str) -> int:
+        try:
+            return self._bitmaps[cn]
+        except KeyError:
+            raise KeyError(f'Group {cn} is not in the GroupSet; load or add it first')
+
+    @staticmethod
+    def _bitmap(indexes: Iterable[int]) -> int:
+        """
+        :param indexes: interned ints
+        :return: bitmap with those bits set, built in a bytearray rather than by OR-ing one big int per member
+        """
+        indexes = list(indexes)
+        if not indexes:
+            return 0
+        bits = bytearray((max(indexes) >> 3) + 1)
+        for i in indexes:
+            bits[i >> 3] |= 1 << (i & 7)
+        return int.from_bytes(bits, 'little')
+
+    @staticmethod
+    def _indexes(bitmap: int) -> Iterator[int]:
+        """
+        :param bitmap: a bitmap
+        :return: generator of the set bits' positions, ascending; bytes with no bits set are skipped whole
+        """
+        for byte_index, byte in enumerate(bitmap.to_bytes((bitmap.bit_length() + 7) >> 3, 'little')):
+            while byte:
+                low = byte & -byte
+                yield (byte_index << 3) + low.bit_length() - 1
+                byte ^= low
@@ -0,0 +1,74 @@
+from typing import Dict, Iterable, Set
+
+from mcommunity.mcommunity_group import MCommunityGroup
+
+
+class MembershipIndex:
+    """
+    In-memory inverted index of uniqname -> cnames of the groups they are in, built from already-loaded groups, so
+    checking whether someone is in any of many groups is a dict lookup instead of a scan of every member list.
+    """
+
+    def __init__(self, groups: Iterable[MCommunityGroup] = (), recursive: bool = False):
+        """
+        :param groups: groups to index
+        :param recursive: if True, index the flattened membership from MCommunityGroup.expand() so members of nested
+        groups count as members of the groups they are nested in
+        """
+        self._groups_by_member: Dict[str, Set[str]] = {}
+        self._members_by_group: Dict[str, Set[str]] = {}
+        for group in groups:
+            self.add(group, recursive)
+
+    def __contains__(self, uniqname: str) -> bool:
+        return uniqname in self._groups_by_member
+
+    def __len__(self) -> int:
+        return len(self._groups_by_member)
+
+    ##################
+    # Public Methods #
+    ##################
+    def add(self, group: MCommunityGroup, recursive: bool = False) -> None:
+        """
+        Index a group's members, replacing anything previously indexed for a group with the same cname.
+        :param group: the group
+        :param recursive: if True, index the flattened membership from MCommunityGroup.expand()
+        :return: None
+        """
+        self.remove(group.name)
+        members = set(group.expand() if recursive else group.members)
+        self._members_by_group[group.name] = members
+        for uniqname in members:
+            self._groups_by_member.setdefault(uniqname, set()).add(group.name)
+
+    def groups_for(self, uniqname: str) -> Set[str]:
+        """
+        :param uniqname: the uniqname to look up
+        :return: cnames of the indexed groups the user is in (empty if none)
+        """
+        return set(self._groups_by_member.get(uniqname, ()))
+
+    def is_member(self, uniqname: str, cn: str) -> bool:
+        return cn in self._groups_by_member.get(uniqname, ())
+
+    def is_member_of_any(self, uniqname: str, cns: Iterable[str]) -> bool:
+        """
+        :param uniqname: the uniqname to look up
+        :param cns: cnames of groups to check
+        :return: True if the user is in at least one of the groups
+        """
+        groups = self._groups_by_member.get(uniqname)
+        return bool(groups) and not groups.isdisjoint(cns)
+
+    def remove(self, cn: str) -> None:
+        """
+        Drop a group from the index.
+        :param cn: cname of the group
+        :return: None
+        """
+        for uniqname in self._members_by_group.pop(cn, ()):
+            groups = self._groups_by_member[uniqname]
+            groups.discard(cn)
+            if not groups:
+                del self._groups_by_member[uniqname]
@@ -0,0 +1,248 @@
+import bisect
+import logging
+import math
+import threading
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import ldap
+
+logger = logging.getLogger(__name__)
+
+
+class SearchEvent:
+    """
+    One search attempt, as passed to MCommunityMetrics' before_search and after_search hooks. The same object is passed
+    to both, so a hook can keep what it needs between them in context, e.g. an OpenTelemetry span.
+    """
+    __slots__ = ('query_type', 'search_base', 'query_object', 'seconds', 'results', 'error', 'context')
+
+    def __init__(self, query_type: str, search_base: str, query_object: str):
+        self.query_type: str = query_type
+        self.search_base: str = search_base
+        self.query_object: str = query_object
+        self.seconds: Optional[float] = None  # Set once the attempt finishes
+        self.results: Optional[int] = None  # Entries returned; None if it failed
+        self.error: Optional[BaseException] = None
+        self.context: dict = {}
+
+
+class MCommunityMetrics:
+    """
+    Thread-safe instrumentation of the search path: latency and error tracking per query type (see
+    MCommunityBase._query_type), e.g. to tune timeouts, a latency histogram per query type, and counters of connects,
+    binds, searches and results per search base, retries, time spent sleeping between them, and cache hits and misses.
+    Percentiles are computed over the latest window successful searches of each type; the histograms count every
+    attempt. Searches that shared an identical search already in flight instead of going to the server are counted as
+    coalesced.
+
+    Hooks are called with a SearchEvent before and after every search attempt that goes to the server, e.g. to export
+    to Prometheus or OpenTelemetry. They run on the searching thread (or event loop), so they should be quick; an
+    exception from a hook is logged and otherwise ignored.
+    """
+    window: int = 10000  # Latest latencies kept per query type
+    buckets: Tuple[float, ...] = (
+        0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+    )  # Histogram upper bounds in seconds, as Prometheus' defaults; there is always a last +Inf bucket
+    counter_names: Tuple[str, ...] = (
+        'connects', 'binds', 'bind_errors', 'searches', 'results', 'retries', 'sleep_seconds', 'cache_hits',
+        'snapshot_hits', 'cache_misses'
+    )
+
+    def __init__(self, window: Optional[int] = None,
+                 before_search: Iterable[Callable[[SearchEvent], None]] = (),
+                 after_search: Iterable[Callable[[SearchEvent], None]] = ()):
+        """
+        :param window: how many of the latest latencies to keep per query type
+        :param before_search: hooks called with a SearchEvent before each search attempt
+        :param after_search: hooks called with the same SearchEvent once the attempt has finished or failed
+        """
+        if window is not None:
+            self.window = window
+        self.before_search: List[Callable[[SearchEvent], None]] = list(before_search)
+        self.after_search: List[Callable[[SearchEvent], None]] = list(after_search)
+        self._latencies: Dict[str, deque] = {}  # Query type -> latest latencies in seconds
+        self._counts: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+        self._timeouts: Dict[str, int] = {}
+        self._coalesced: Dict[str, int] = {}
+        self._histograms: Dict[str, List[int]] = {}  # Query type -> attempts per bucket, not cumulative
+        self._histogram_sums: Dict[str, float] = {}
+        self._counters: Dict[str, float] = dict.fromkeys(self.counter_names, 0)
+        self._searches_by_base: Dict[str, int] = {}
+        self._results_by_base: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    ##################
+    # Public Methods #
+    ##################
+    def counters(self) -> dict:
+        """
+        Cheap snapshot of the counters, e.g. for a batch job's report.
+        :return: dict of each of counter_names to its value, plus searches_by_base and results_by_base dicts of search
+        base to searches and entries returned
+        """
+        with self._lock:
+            return {
+                **self._counters, 'searches_by_base': dict(self._searches_by_base),
+                'results_by_base': dict(self._results_by_base)
+            }
+
+    def histograms(self) -> Dict[str, dict]:
+        """
+        :return: dict of each query type to its latency histogram in Prometheus' shape: 'buckets', a list of (upper
+        bound, cumulative count) pairs ending with (math.inf, count), and the 'sum' of the latencies and their 'count'
+        """
+        with self._lock:
+            histograms = {t: (list(counts), self._histogram_sums[t]) for t, counts in self._histograms.items()}
+        result = {}
+        for query_type, (counts, total) in histograms.items():
+            cumulative, buckets = 0, []
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                buckets.append((bound, cumulative))
+            result[query_type] = {'buckets': buckets, 'sum': total, 'count': cumulative}
+        return result
+
+    def increment(self, counter: str, amount: float = 1) -> None:
+        """
+        :param counter: one of counter_names
+        :param amount: how much to add
+        :return: None
+        """
+        with self._lock:
+            self._counters[counter] += amount
+
+    def percentiles(self, query_type: str, percentiles: Iterable[int] = (50, 95, 99)) -> Dict[str, float]:
+        """
+        :param query_type: the query type
+        :param percentiles: which percentiles to compute
+        :return: dict like {'p50': 0.012, 'p95': ...} in seconds, by nearest rank; empty if nothing was recorded
+        """
+        with self._lock:
+            latencies = sorted(self._latencies.get(query_type, ()))
+        if not latencies:
+            return {}
+        return {f'p{p}': latencies[max(math.ceil(p / 100 * len(latencies)) - 1, 0)] for p in percentiles}
+
+    def record(self, query_type: str, seconds: float, error: Optional[BaseException] = None,
+               search_base: Optional[str] = None, results: Optional[int] = None) -> None:
+        """
+        Record one search attempt.
+        :param query_type: the query type
+        :param seconds: how long the attempt took
+        :param error: the exception it failed with, if any; failed attempts are counted but not included in the
+        percentiles, and ldap.TIMEOUTs are also counted as timeouts
+        :param search_base: the LDAP base searched, to count searches and results by
+        :param results: how many entries it returned
+        :return: None
+        """
+        with self._lock:
+            self._counts[query_type] = self._counts.get(query_type, 0) + 1
+            if query_type not in self._histograms:
+                self._histograms[query_type] = [0] * (len(self.buckets) + 1)
+                self._histogram_sums[query_type] = 0.0
+            self._histograms[query_type][bisect.bisect_left(self.buckets, seconds)] += 1
+            self._histogram_sums[query_type] += seconds
+            self._counters['searches'] += 1
+            self._counters['results'] += results or 0
+            if search_base is not None:
+                self._searches_by_base[search_base] = self._searches_by_base.get(search_base, 0) + 1
+                self._results_by_base[search_base] = self._results_by_base.get(search_base, 0) + (results or 0)
+            if error is None:
+                if query_type not in self._latencies:
+                    self._latencies[query_type] = deque(maxlen=self.window)
+                self._latencies[query_type].append(seconds)
+                return
+            self._errors[query_type] = self._errors.get(query_type, 0) + 1
+            if self._is_timeout(error):
+                self._timeouts[query_type] = self._timeouts.get(query_type, 0) + 1
+
+    def record_coalesced(self, query_type: str) -> None:
+        """
+        Record a search that shared the result of an identical one already in flight.
+        :param query_type: the query type
+        :return: None
+        """
+        with self._lock:
+            self._coalesced[query_type] = self._coalesced.get(query_type, 0) + 1
+
+    def record_retry(self, error: BaseException, delay: float) -> None:
+        """
+        Record a failed attempt that is about to be retried, see RetryPolicy.call's on_retry.
+        :param error: what the attempt failed with
+        :param delay: seconds that will be slept before the next attempt
+        :return: None
+        """
+        with self._lock:
+            self._counters['retries'] += 1
+            self._counters['sleep_seconds'] += delay
+
+    def reset(self) -> None:
+        with self._lock:
+            self._latencies.clear()
+            self._counts.clear()
+            self._errors.clear()
+            self._timeouts.clear()
+            self._coalesced.clear()
+            self._histograms.clear()
+            self._histogram_sums.clear()
+            self._counters = dict.fromkeys(self.counter_names, 0)
+            self._searches_by_base.clear()
+            self._results_by_base.clear()
+
+    def search_finished(self, event: SearchEvent, seconds: float, results: Optional[int] = None,
+                        error: Optional[BaseException] = None) -> None:
+        """
+        Record a search attempt started with search_started and call the after_search hooks.
+        :param event: what search_started returned
+        :param seconds: how long the attempt took
+        :param results: how many entries it returned
+        :param error: the exception it failed with, if any
+        :return: None
+        """
+        event.seconds, event.results, event.error = seconds, results, error
+        self.record(event.query_type, seconds, error, event.search_base, results)
+        self._run_hooks(self.after_search, event)
+
+    def search_started(self, query_type: str, search_base: str, query_object: str) -> SearchEvent:
+        """
+        Call the before_search hooks for a search attempt about to go to the server.
+        :param query_type: the query type
+        :param search_base: the LDAP base
+        :param query_object: the LDAP filter
+        :return: the event to pass to search_finished
+        """
+        event = SearchEvent(query_type, search_base, query_object)
+        self._run_hooks(self.before_search, event)
+        return event
+
+    def stats(self) -> Dict[str, dict]:
+        """
+        :return: dict of each query type to its attempt, error, timeout and coalesced counts and p50/p95/p99 latency in
+        seconds
+        """
+        with self._lock:
+            query_types = list(dict.fromkeys([*self._counts, *self._coalesced]))
+            counts = {t: (
+                self._counts.get(t, 0), self._errors.get(t, 0), self._timeouts.get(t, 0), self._coalesced.get(t, 0)
+            ) for t in query_types}
+        return {
+            t: {'count': count, 'errors': errors, 'timeouts': timeouts, 'coalesced': coalesced, **self.percentiles(t)}
+            for t, (count, errors, timeouts, coalesced) in counts.items()
+        }
+
+    ###################
+    # Private Methods #
+    ###################
+    @staticmethod
+    def _is_timeout(error: BaseException) -> bool:
+        return isinstance(error, (ldap.TIMEOUT, ldap.TIMELIMIT_EXCEEDED))
+
+    @staticmethod
+    def _run_hooks(hooks: List[Callable[[SearchEvent], None]], event: SearchEvent) -> None:
+        for hook in hooks:
+            try:
+                hook(event)
+            except Exception:
+                logger.exception(f'MCommunity metrics hook {hook!r} failed')
@@ -1,5 +1,9 @@
+import re
+import time
 from copy import deepcopy
 
+import ldap
+
 
 def change_uniqname_on_mock(mock: list, new_uniqname: str):
     copy = deepcopy(mock)
@@ -9,7 +13,70 @@ def change_uniqname_on_mock(mock: list, new_uniqname: str):
     return copy
 
 
-def mcomm_side_effect(*args):
+class FakeLDAPServer:
+    """
+    Local stand-in for one LDAP replica that answers searches with mcomm_side_effect. Patch ldap.initialize with
+    fake_initialize(servers) to send connections to it. Set down to have it refuse binds and searches like a server that
+    went away, or delay to have it answer that many seconds late.
+    """
+
+    def __init__(self, uri: str, down: bool = False, delay: float = 0.0):
+        self.uri = uri
+        self.down = down
+        self.delay = delay
+        self.binds = 0
+        self.searches = 0
+
+
+class FakeLDAPConnection:
+
+    def __init__(self, server: FakeLDAPServer):
+        self.server = server
+        self.timeout = -1
+        self.options = {}
+
+    def set_option(self, option, value):
+        self.options[option] = value
+
+    def simple_bind_s(self, who, cred):
+        if self.server.down:
+            raise ldap.SERVER_DOWN({'desc': "Can't contact LDAP server"})
+        self.server.binds += 1
+
+    def search_st(self, search_base, scope, query_object, ldap_attributes, timeout=-1):
+        if self.server.down:
+            raise ldap.SERVER_DOWN({'desc': "Can't contact LDAP server"})
+        if 0 <= timeout < self.server.delay:
+            time.sleep(timeout)
+            raise ldap.TIMEOUT()
+        time.sleep(self.server.delay)
+        self.server.searches += 1
+        return mcomm_side_effect(search_base, query_object, ldap_attributes)
+
+    def whoami_s(self):
+        if self.server.down:
+            raise ldap.SERVER_DOWN({'desc': "Can't contact LDAP server"})
+        return f'dn:cn={test_app},ou=Applications,o=services'
+
+    def unbind_s(self):
+        pass
+
+
+def fake_initialize(servers):
+    """
+    :param servers: FakeLDAPServers
+    :return: replacement for ldap.initialize that connects to the one with the given URI
+    """
+    by_uri = {server.uri: server for server in servers}
+    return lambda uri, **kwargs: FakeLDAPConnection(by_uri[uri])
+
+
+def mcomm_side_effect(*args, **kwargs):
+    if args[1].startswith('(|'):  # OR filter from search_many; answer each term as if it had been searched on its own
+        result = []
+        for attribute, value in re.findall(r'\((\w+)=([^()]*)\)', args[1]):
+            result += mcomm_side_effect(args[0], f'{attribute}={value}', *args[2:])
+        return result
     query = args[1].split('=')[1]
     if args[0] == 'ou=People,dc=umich,dc=edu':
         if query == 'nemcardf':
@@ -41,12 +108,22 @@ def mcomm_side_effect(*args):
         else:
             return []
     elif args[0] == 'ou=User Groups,ou=Groups,dc=umich,dc=edu':
-        if query in ['test-group', 'collab-iam-admins']:
+        if args[1].startswith('(member='):  # Reverse membership lookup, e.g. MCommunityUser.groups
+            member = args[1][len('(member='):-1].encode()
+            return [g[0] for g in [group_mock_1, group_mock_2, something_iam_primary_mock, nested_parent_mock,
+                                   nested_child_mock, nested_shared_mock] if member in g[0][1]['member']]
+        elif query in ['test-group', 'collab-iam-admins']:
             return group_mock_1
         elif query == 'test-group-2':
             return group_mock_2
         elif query == 'something-iam-primary':
             return something_iam_primary_mock
+        elif query == 'nested-parent':
+            return nested_parent_mock
+        elif query == 'nested-child':
+            return nested_child_mock
+        elif query == 'nested-shared':
+            return nested_shared_mock
         else:
             return []
     else:
@@ -172,3 +249,25 @@ something_iam_primary_mock = [
         'member': [b'uid=nemcardts,ou=People,dc=umich,dc=edu', b'uid=nemcarda,ou=People,dc=umich,dc=edu'],
         'cn': [b'something-iam-primary']})
 ]
+
+nested_parent_mock = [
+    ('cn=nested-parent,ou=User Groups,ou=Groups,dc=umich,dc=edu', {
+        'member': [b'uid=nemcardf,ou=People,dc=umich,dc=edu',
+                   b'cn=nested-child,ou=User Groups,ou=Groups,dc=umich,dc=edu',
+                   b'cn=nested-shared,ou=User Groups,ou=Groups,dc=umich,dc=edu'],
+        'cn': [b'nested-parent']})
+]
+
+nested_child_mock = [
+    ('cn=nested-child,ou=User Groups,ou=Groups,dc=umich,dc=edu', {
+        'member': [b'uid=nemcards,ou=People,dc=umich,dc=edu',
+                   b'cn=nested-shared,ou=User Groups,ou=Groups,dc=umich,dc=edu',
+                   b'cn=nested-parent,ou=User Groups,ou=Groups,dc=umich,dc=edu'],  # Cycle back to the parent
+        'cn': [b'nested-child']})
+]
+
+nested_shared_mock = [
+    ('cn=nested-shared,ou=User Groups,ou=Groups,dc=umich,dc=edu', {
+        'member': [b'uid=nemcarda,ou=People,dc=umich,dc=edu', b'uid=nemcardf,ou=People,dc=umich,dc=edu'],
+        'cn': [b'nested-shared']})
+]
@@ -0,0 +1,225 @@
+import hashlib
+import logging
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+import ldap
+from ldap.ldapobject import LDAPObject
+
+logger = logging.getLogger(__name__)
+
+
+class MCommunityConnectionPool:
+    """
+    Thread-safe pool of already-bound LDAP connections. Each MCommunitySession has its own pool per server; outside a
+    session, one shared pool exists per (app cn, secret, server URI), see for_credentials(). The secret is part of the
+    key (as a hash) so a client with the wrong secret can't borrow connections bound with the right one.
+    """
+    _pools: Dict[Tuple[str, str, str], 'MCommunityConnectionPool'] = {}
+    _pools_lock = threading.Lock()
+    _all_pools: 'weakref.WeakSet[MCommunityConnectionPool]' = weakref.WeakSet()  # Shared or not, for close_all
+    _all_pools_lock = threading.Lock()
+
+    def __init__(self, max_size: int = 10, health_check_interval: float = 60.0, acquire_timeout: float = 30.0):
+        """
+        :param max_size: maximum number of connections (idle + in use) the pool will open at once
+        :param health_check_interval: idle connections older than this many seconds are checked with a whoami before
+        being handed out again
+        :param acquire_timeout: how many seconds to wait for a free connection when the pool is at max_size
+        """
+        self.max_size: int = max_size
+        self.health_check_interval: float = health_check_interval
+        self.acquire_timeout: float = acquire_timeout
+
+        self._idle: List[Tuple[LDAPObject, float]] = []  # (connection, monotonic time it was returned to the pool)
+        self._in_use: int = 0
+        self._condition = threading.Condition()
+        with self._all_pools_lock:
+            self._all_pools.add(self)
+
+    @classmethod
+    def for_credentials(cls, mcommunity_app_cn: str, server_uri: str, mcommunity_secret: Optional[str] = None,
+                        **kwargs) -> 'MCommunityConnectionPool':
+        """
+        Get the shared pool for a set of credentials and a server URI, creating it on first use.
+        :param mcommunity_app_cn: cname of the MCommunity app the connections are bound as
+        :param server_uri: LDAP URI the connections point at
+        :param mcommunity_secret: secret the connections are bound with
+        :param kwargs: passed to the constructor if the pool does not exist yet
+        :return: the shared pool
+        """
+        key = (mcommunity_app_cn, cls._fingerprint(mcommunity_secret), server_uri)
+        with cls._pools_lock:
+            if key not in cls._pools:
+                cls._pools[key] = cls(**kwargs)
+            return cls._pools[key]
+
+    @classmethod
+    def close_all(cls) -> None:
+        """
+        Unbind every idle connection in every pool, sessions' included, and forget the shared pools.
+        :return: None
+        """
+        with cls._pools_lock:
+            cls._pools.clear()
+        with cls._all_pools_lock:
+            pools = list(cls._all_pools)
+        for pool in pools:
+            pool.close()
+
+    ##################
+    # Public Methods #
+    ##################
+    def acquire(self, connect: Callable[[], LDAPObject]) -> LDAPObject:
+        """
+        Check out a bound connection, opening a new one with connect() if no healthy idle connection is available.
+        Every acquired connection must be handed back with release() or discard().
+        :param connect: callable returning a new bound connection, e.g. MCommunityBase.connect
+        :return: the connection
+        """
+        return self._checkout(connect)[0]
+
+    def release(self, connection: LDAPObject) -> None:
+        """
+        Return a healthy connection to the pool for reuse.
+        :param connection: a connection previously handed out by acquire()
+        :return: None
+        """
+        with self._condition:
+            self._in_use -= 1
+            self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    def discard(self, connection: LDAPObject) -> None:
+        """
+        Unbind a broken connection and free its slot in the pool.
+        :param connection: a connection previously handed out by acquire()
+        :return: None
+        """
+        self._unbind(connection)
+        with self._condition:
+            self._in_use -= 1
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self, connect: Callable[[], LDAPObject]):
+        """
+        Context manager around acquire()/release(); the connection is discarded instead if the server went away or an
+        operation on it timed out, since the server may still answer it later.
+        :param connect: callable returning a new bound connection
+        """
+        connection = self.acquire(connect)
+        try:
+            yield connection
+        except (ldap.SERVER_DOWN, ldap.TIMEOUT):
+            self.discard(connection)
+            raise
+        except BaseException:
+            self.release(connection)
+            raise
+        else:
+            self.release(connection)
+
+    def run(self, connect: Callable[[], LDAPObject], operation: Callable[[LDAPObject], object]):
+        """
+        Run operation(connection) on a pooled connection. If a reused connection turns out to be dead (SERVER_DOWN),
+        it is thrown away and the operation is tried once more on a freshly bound connection. A connection the
+        operation timed out on is thrown away too, but the timeout is raised.
+        :param connect: callable returning a new bound connection
+        :param operation: callable taking the connection and returning the result
+        :return: whatever operation returns
+        """
+        connection, reused = self._checkout(connect)
+        try:
+            result = operation(connection)
+        except ldap.SERVER_DOWN:
+            self.discard(connection)
+            if not reused:
+                raise
+            logger.debug('Pooled MCommunity connection went away; rebinding')
+            with self.connection(connect) as connection:
+                return operation(connection)
+        except ldap.TIMEOUT:
+            self.discard(connection)
+            raise
+        except BaseException:
+            self.release(connection)
+            raise
+        self.release(connection)
+        return result
+
+    def close(self) -> None:
+        """
+        Unbind all idle connections. Connections currently checked out are unbound when they are discarded.
+        :return: None
+        """
+        with self._condition:
+            idle = self._idle
+            self._idle = []
+        for connection, _ in idle:
+            self._unbind(connection)
+
+    @property
+    def size(self) -> int:
+        """
+        :return: number of connections currently open (idle + in use)
+        """
+        with self._condition:
+            return len(self._idle) + self._in_use
+
+    ###################
+    # Private Methods #
+    ###################
+    def _checkout(self, connect: Callable[[], LDAPObject]) -> Tuple[LDAPObject, bool]:
+        """
+        Take an idle connection or reserve a slot for a new one, waiting up to acquire_timeout if the pool is full.
+        :param connect: callable returning a new bound connection
+        :return: tuple of the connection and whether it was reused from the pool
+        """
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._condition:
+            while not self._idle and len(self._idle) + self._in_use >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ldap.UNAVAILABLE({'desc': 'Timed out waiting for a pooled MCommunity connection'})
+                self._condition.wait(remaining)
+            self._in_use += 1
+            connection, last_used = self._idle.pop() if self._idle else (None, 0.0)
+
+        if connection is not None:
+            if time.monotonic() - last_used < self.health_check_interval or self._is_healthy(connection):
+                return connection, True
+            self._unbind(connection)
+
+        try:
+            return connect(), False
+        except BaseException:
+            with self._condition:
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+
+    @staticmethod
+    def _fingerprint(mcommunity_secret: Optional[str]) -> str:
+        """
+        :return: hash of the secret, so the pool registry doesn't hold the secret itself
+        """
+        return hashlib.sha256((mcommunity_secret or '').encode('UTF-8')).hexdigest()
+
+    @staticmethod
+    def _is_healthy(connection: LDAPObject) -> bool:
+        try:
+            connection.whoami_s()
+            return True
+        except ldap.LDAPError:
+            return False
+
+    @staticmethod
+    def _unbind(connection: LDAPObject) -> None:
+        try:
+            connection.unbind_s()
+        except ldap.LDAPError:
+            pass  # It is already gone, which is what we wanted anyway
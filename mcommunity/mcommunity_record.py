@@ -0,0 +1,177 @@
+import sys
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from mcommunity.mcommunity_group import MCommunityGroup
+from mcommunity.mcommunity_user import AFFILIATIONS, MCommunityUser, ServiceEntitlement
+
+
+class UserRecord:
+    """
+    Compact, read-only view of one user for holding many users in memory at once (e.g. a whole sweep), instead of
+    MCommunityUser objects. Only the 'eligibility' profile attributes are kept, in a list aligned with the class-wide
+    attributes tuple, and each is decoded from bytes on first access; no app credentials, raw_result or per-instance
+    __dict__ are kept.
+    """
+    __slots__ = ('name', '_values', '_entitlements')
+
+    attributes: Tuple[str, ...] = tuple(sys.intern(a) for a in MCommunityUser.fetch_profiles['eligibility'])
+    _positions: Dict[str, int] = {a.lower(): i for i, a in enumerate(attributes)}
+    _interned_positions: frozenset = frozenset([_positions['umichinstroles']])  # Values shared by many users
+
+    def __init__(self, uniqname: str, raw_result: list):
+        """
+        :param uniqname: the uniqname of the user
+        :param raw_result: the user's query result, e.g. from MCommunityBase.search_many; any attributes it has other
+        than the 'eligibility' profile ones are not kept
+        """
+        self.name: str = uniqname
+        self._values: Optional[list] = None  # None if the user does not exist
+        self._entitlements: Optional[Dict[str, ServiceEntitlement]] = None
+        if raw_result:
+            values = [None] * len(self.attributes)
+            for attribute, value in raw_result[0][1].items():
+                position = self._positions.get(attribute.lower())
+                if position is not None:
+                    values[position] = value
+            self._values = values
+
+    @classmethod
+    def from_user(cls, user: MCommunityUser) -> 'UserRecord':
+        """
+        :param user: an MCommunityUser whose raw_result has not been released
+        :return: the record for it
+        """
+        return cls(user.name, user.raw_result)
+
+    @property
+    def exists(self) -> bool:
+        return self._values is not None
+
+    @property
+    def uniqname(self) -> str:
+        return self.name
+
+    @property
+    def entityid(self) -> str:
+        return self.get('entityid')
+
+    @property
+    def display_name(self) -> str:
+        return self.get('displayName')
+
+    @property
+    def affiliations(self) -> list:
+        return self.get('umichInstRoles', return_str=False)
+
+    @property
+    def affiliation_rank(self) -> int:
+        """
+        :return: see MCommunityUser.affiliation_rank; ranked from the raw values, so the roles are never decoded
+        """
+        if self._values is None:
+            return 0
+        return MCommunityUser.affiliation_rank(self._values[self._positions['umichinstroles']] or ())
+
+    @property
+    def highest_affiliation(self) -> str:
+        return AFFILIATIONS[self.affiliation_rank]
+
+    @property
+    def service_entitlements(self) -> list:
+        return self.get('umichServiceEntitlement', return_str=False)
+
+    @property
+    def entitlements(self) -> Dict[str, ServiceEntitlement]:
+        """
+        :return: see MCommunityUser.entitlements; parsed straight from the raw values, so the uSE is not kept decoded
+        as well unless service_entitlements is read
+        """
+        if self._entitlements is None:
+            values = None if self._values is None else self._values[self._positions['umichserviceentitlement']]
+            self._entitlements = MCommunityUser._index_entitlements(values or ())
+        return self._entitlements
+
+    ##################
+    # Public Methods #
+    ##################
+    def check_service_entitlement(self, service: str = 'enterprise') -> bool:
+        """
+        :return: see MCommunityUser.check_service_entitlement
+        """
+        entitlement = self.entitlements.get(service)
+        return entitlement is not None and entitlement.eligible
+
+    def check_service_entitlements(self, services: Iterable[str]) -> Dict[str, bool]:
+        """
+        :return: see MCommunityUser.check_service_entitlements
+        """
+        return {service: self.check_service_entitlement(service) for service in services}
+
+    def check_sponsorship_type(self) -> int:
+        """
+        :return: see MCommunityUser.check_sponsorship_type
+        """
+        return MCommunityUser._sponsorship_type(self.highest_affiliation, self.name, self.entityid)
+
+    def get(self, attribute: str, return_str: bool = True) -> Union[str, list]:
+        """
+        Read one of the record's attributes, decoding it on first access; same return values as
+        MCommunityBase._decode.
+        :param attribute: one of attributes
+        :param return_str: see MCommunityBase._decode
+        :return: the decoded item, either a string or a list
+        """
+        position = self._positions[attribute.lower()]  # KeyError for an attribute the record does not keep
+        value = None if self._values is None else self._values[position]
+        if value is None:
+            value = ()
+        elif type(value) == list:
+            if position in self._interned_positions:
+                value = tuple(sys.intern(i.decode('UTF-8')) for i in value)
+            else:
+                value = tuple(i.decode('UTF-8') for i in value)
+            self._values[position] = value
+        elif type(value) == bytes:
+            value = self._values[position] = value.decode('UTF-8')
+        if type(value) == str:
+            return value
+        if return_str and len(value) <= 1:
+            return value[0] if value else ''
+        return list(value)
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name, 'exists': self.exists, 'entityid': self.entityid, 'display_name': self.display_name,
+            'affiliations': self.affiliations, 'highest_affiliation': self.highest_affiliation,
+            'service_entitlements': self.service_entitlements
+        }
+
+
+class GroupRecord:
+    """
+    Compact, read-only view of one group: its cn and its direct members, without raw_result or app credentials.
+    """
+    __slots__ = ('name', 'members', 'member_groups')
+
+    def __init__(self, cn: str, members: Iterable[str], member_groups: Iterable[str] = ()):
+        """
+        :param cn: the cname of the group
+        :param members: uniqnames of the direct members
+        :param member_groups: cnames of the groups nested directly in this one
+        """
+        self.name: str = cn
+        self.members: Tuple[str, ...] = tuple(members)
+        self.member_groups: Tuple[str, ...] = tuple(member_groups)
+
+    @classmethod
+    def from_group(cls, group: MCommunityGroup) -> 'GroupRecord':
+        return cls(group.name, group.members, group.member_groups)
+
+    def __contains__(self, uniqname: str) -> bool:
+        return uniqname in self.members
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def to_dict(self) -> Dict[str, Union[str, List[str]]]:
+        return {'name': self.name, 'members': list(self.members), 'member_groups': list(self.member_groups)}
@@ -0,0 +1,340 @@
+import asyncio
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Awaitable, Callable, Iterator, Optional, Tuple, Type, TypeVar
+
+import ldap
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+_current_deadline: contextvars.ContextVar = contextvars.ContextVar('mcommunity_deadline', default=None)
+
+
+class CircuitOpenError(ldap.UNAVAILABLE):
+    """
+    Raised without contacting the server while a CircuitBreaker is open. It is an ldap.UNAVAILABLE, so code that
+    already handles the server being unavailable handles it too.
+    """
+
+
+class DeadlineExceeded(ldap.TIMEOUT):
+    """
+    Raised when a call or batch runs out of time, including when there is not enough time left to wait for the next
+    retry.
+    """
+
+
+class MCommunityTimeout(ldap.TIMEOUT):
+    """
+    Raised when the server does not answer within one of the client-side timeouts (see ConnectTimeout, BindTimeout
+    and SearchTimeout). It is an ldap.TIMEOUT; the default RetryPolicy retries it and the circuit breaker counts it as
+    a failure. A search the server itself stops at its time limit raises ldap.TIMELIMIT_EXCEEDED instead, which is not
+    retried.
+    """
+
+
+class ConnectTimeout(MCommunityTimeout):
+    """
+    Raised when opening the network connection to the server takes longer than connect_timeout.
+    """
+
+
+class BindTimeout(MCommunityTimeout):
+    """
+    Raised when binding as the app takes longer than bind_timeout.
+    """
+
+
+class SearchTimeout(MCommunityTimeout):
+    """
+    Raised when a search takes longer than search_timeout.
+    """
+
+
+class Deadline:
+    """
+    A point in time by which a call, or a whole batch of calls, has to finish. Put a deadline in effect with scope();
+    every RetryPolicy.call made in that scope, including from threads or asyncio tasks started with a copy of the
+    context, stops retrying and raises DeadlineExceeded once it passes.
+    """
+
+    def __init__(self, seconds: float):
+        """
+        :param seconds: seconds from now
+        """
+        self.expires_at: float = time.monotonic() + seconds
+
+    @staticmethod
+    def current() -> Optional['Deadline']:
+        """
+        :return: the deadline in effect, if any
+        """
+        return _current_deadline.get()
+
+    @staticmethod
+    def cap(timeout: float) -> float:
+        """
+        :param timeout: seconds, or -1 for no timeout
+        :return: timeout, shortened to the time left before the deadline in effect if that comes first
+        """
+        deadline = _current_deadline.get()
+        if deadline is None:
+            return timeout
+        remaining = max(deadline.remaining(), 0.0)
+        return remaining if timeout < 0 else min(timeout, remaining)
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def remaining(self) -> float:
+        """
+        :return: seconds left, negative once it has passed
+        """
+        return self.expires_at - time.monotonic()
+
+    @contextmanager
+    def scope(self) -> Iterator['Deadline']:
+        """
+        Put this deadline in effect for the current context; an earlier deadline already in effect wins.
+        :return: context manager
+        """
+        current = _current_deadline.get()
+        token = _current_deadline.set(self if current is None or self.expires_at < current.expires_at else current)
+        try:
+            yield self
+        finally:
+            _current_deadline.reset(token)
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker shared by everything that talks to the same server. After failure_threshold failures
+    in a row it opens and calls fail fast with CircuitOpenError; once recovery_timeout has passed it lets a single
+    probe call through (half-open), closing again if the probe succeeds and reopening if it fails.
+    """
+    CLOSED: str = 'closed'
+    OPEN: str = 'open'
+    HALF_OPEN: str = 'half-open'
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        """
+        :param failure_threshold: consecutive failures that open the circuit
+        :param recovery_timeout: seconds to stay open before probing; also how long a probe may take before another
+        one is allowed
+        """
+        self.failure_threshold: int = failure_threshold
+        self.recovery_timeout: float = recovery_timeout
+
+        self.state: str = self.CLOSED
+        self.failures: int = 0  # Consecutive failures
+        self._opened_at: float = 0.0
+        self._probe_started_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    ##################
+    # Public Methods #
+    ##################
+    def allow(self) -> bool:
+        """
+        :return: whether a call may go to the server now; in the half-open state, True only for the probe
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == self.OPEN:
+                if now - self._opened_at < self.recovery_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                logger.info('Circuit breaker half-open; probing the server')
+            elif self._probe_started_at is not None and now - self._probe_started_at < self.recovery_timeout:
+                return False  # A probe is already in flight
+            self._probe_started_at = now
+            return True
+
+    def check(self) -> None:
+        """
+        Raise CircuitOpenError if a call may not go to the server now.
+        :return: None
+        """
+        if not self.allow():
+            raise CircuitOpenError({'desc': 'Circuit breaker is open', 'info': f'{self.failures} failures in a row'})
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f'Circuit breaker open after {self.failures} failures in a row')
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_started_at = None
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info('Circuit breaker closed; the server is reachable again')
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_started_at = None
+
+    def reset(self) -> None:
+        self.record_success()
+
+
+class RetryPolicy:
+    """
+    How to retry a call that failed because the server was unavailable: up to max_attempts attempts, waiting an
+    exponentially growing, jittered delay between them, within an optional per-call deadline and whatever Deadline is
+    in effect for the batch. The same policy object can be used from threads (call) and from asyncio (call_async),
+    where waiting does not block the event loop.
+    """
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0,
+                 multiplier: float = 2.0, jitter: float = 1.0, deadline: Optional[float] = None,
+                 retry_on: Tuple[Type[BaseException], ...] = (
+                     ldap.SERVER_DOWN, ldap.UNAVAILABLE, MCommunityTimeout
+                 )):
+        """
+        :param max_attempts: attempts in total, including the first
+        :param base_delay: seconds before the second attempt, before jitter
+        :param max_delay: cap on the delay before any attempt, before jitter
+        :param multiplier: how much the delay grows after each attempt
+        :param jitter: fraction of each delay that is randomized; 1.0 picks uniformly between 0 and the delay so that
+        clients that failed together don't retry together, 0.0 disables jitter
+        :param deadline: seconds a call may take including its retries; None for no per-call deadline
+        :param retry_on: exceptions that are retried and count as failures for the circuit breaker
+        """
+        self.max_attempts: int = max_attempts
+        self.base_delay: float = base_delay
+        self.max_delay: float = max_delay
+        self.multiplier: float = multiplier
+        self.jitter: float = jitter
+        self.deadline: Optional[float] = deadline
+        self.retry_on: Tuple[Type[BaseException], ...] = retry_on
+
+    ##################
+    # Public Methods #
+    ##################
+    def call(self, operation: Callable[[], T], circuit_breaker: Optional[CircuitBreaker] = None,
+             on_retry: Optional[Callable[[BaseException, float], None]] = None) -> T:
+        """
+        Run operation, retrying per the policy and sleeping between attempts. The call's deadline is in effect while
+        operation runs, so it can bound its own waits by Deadline.current().
+        :param operation: callable to run
+        :param circuit_breaker: breaker to check before and update after each attempt
+        :param on_retry: called with the error and the seconds about to be slept before each retry, e.g.
+        MCommunityMetrics.record_retry
+        :return: what operation returns
+        """
+        deadline = self._call_deadline()
+        attempt = 1
+        while True:
+            self._before_attempt(circuit_breaker, deadline)
+            try:
+                with deadline.scope() if deadline is not None else nullcontext():
+                    result = operation()
+            except (CircuitOpenError, DeadlineExceeded):
+                raise
+            except self.retry_on as e:
+                time.sleep(self._after_failure(attempt, e, circuit_breaker, deadline, on_retry))
+            except ldap.LDAPError:
+                if circuit_breaker is not None:
+                    circuit_breaker.record_success()  # The server answered, even if with an error
+                raise
+            else:
+                if circuit_breaker is not None:
+                    circuit_breaker.record_success()
+                return result
+            attempt += 1
+
+    async def call_async(self, operation: Callable[[], Awaitable[T]], circuit_breaker: Optional[CircuitBreaker] = None,
+                         on_retry: Optional[Callable[[BaseException, float], None]] = None) -> T:
+        """
+        Asynchronous equivalent of call; waits between attempts with asyncio.sleep.
+        :param operation: callable returning a new awaitable for each attempt
+        :param circuit_breaker: breaker to check before and update after each attempt
+        :param on_retry: called with the error and the seconds about to be slept before each retry
+        :return: what the awaitable returns
+        """
+        deadline = self._call_deadline()
+        attempt = 1
+        while True:
+            self._before_attempt(circuit_breaker, deadline)
+            try:
+                with deadline.scope() if deadline is not None else nullcontext():
+                    result = await operation()
+            except (CircuitOpenError, DeadlineExceeded):
+                raise
+            except self.retry_on as e:
+                await asyncio.sleep(self._after_failure(attempt, e, circuit_breaker, deadline, on_retry))
+            except ldap.LDAPError:
+                if circuit_breaker is not None:
+                    circuit_breaker.record_success()  # The server answered, even if with an error
+                raise
+            else:
+                if circuit_breaker is not None:
+                    circuit_breaker.record_success()
+                return result
+            attempt += 1
+
+    def delay(self, attempt: int) -> float:
+        """
+        :param attempt: the attempt that just failed, starting at 1
+        :return: seconds to wait before the next attempt
+        """
+        delay = min(self.max_delay, self.base_delay * self.multiplier ** (attempt - 1))
+        return delay * (1 - self.jitter * random.random())
+
+    ###################
+    # Private Methods #
+    ###################
+    def _call_deadline(self) -> Optional[Deadline]:
+        """
+        :return: the earlier of the per-call deadline and the deadline in effect, if either is set
+        """
+        deadline = Deadline.current()
+        if self.deadline is not None:
+            call_deadline = Deadline(self.deadline)
+            if deadline is None or call_deadline.expires_at < deadline.expires_at:
+                deadline = call_deadline
+        return deadline
+
+    @staticmethod
+    def _before_attempt(circuit_breaker: Optional[CircuitBreaker], deadline: Optional[Deadline]) -> None:
+        if deadline is not None and deadline.expired:
+            raise DeadlineExceeded({'desc': 'Deadline exceeded', 'info': 'No time left to contact the server'})
+        if circuit_breaker is not None:
+            circuit_breaker.check()
+
+    def _after_failure(self, attempt: int, error: BaseException, circuit_breaker: Optional[CircuitBreaker],
+                       deadline: Optional[Deadline],
+                       on_retry: Optional[Callable[[BaseException, float], None]] = None) -> float:
+        """
+        Record a failed attempt and decide whether to retry.
+        :return: seconds to wait before the next attempt; raises instead if there is no next attempt: the last
+        MCommunityTimeout if that is what failed, otherwise ldap.UNAVAILABLE
+        """
+        if circuit_breaker is not None:
+            circuit_breaker.record_failure()
+        if attempt >= self.max_attempts:
+            if isinstance(error, MCommunityTimeout):
+                raise error  # Still a timeout, so callers can tell a slow server from one that is down
+            raise ldap.UNAVAILABLE({
+                'desc': 'Server unavailable', 'info': f'Gave up after {attempt} attempts: {error!r}'
+            }) from error
+        delay = self.delay(attempt)
+        if deadline is not None and delay >= deadline.remaining():
+            raise DeadlineExceeded({'desc': 'Deadline exceeded',
+                                    'info': f'No time left to retry after attempt {attempt}: {error!r}'}) from error
+        logger.debug(f'Attempt {attempt} failed with {error!r}; retrying in {delay:.2f}s')
+        if on_retry is not None:
+            on_retry(error, delay)
+        return delay
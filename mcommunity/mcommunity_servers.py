@@ -0,0 +1,200 @@
+import logging
+import random
+import threading
+import time
+from typing import Callable, Iterable, List, Optional, Tuple, Type, TypeVar
+
+import ldap
+
+from mcommunity.mcommunity_retry import CircuitBreaker, CircuitOpenError, DeadlineExceeded, MCommunityTimeout
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class MCommunityServer:
+    """
+    Health and load of one server in an MCommunityServerSet.
+    """
+
+    def __init__(self, uri: str, failure_threshold: int, recovery_timeout: float):
+        """
+        :param uri: LDAP URI of the server
+        :param failure_threshold: consecutive failures after which the server is skipped
+        :param recovery_timeout: seconds to skip it for before probing it again
+        """
+        self.uri: str = uri
+        self.breaker: CircuitBreaker = CircuitBreaker(failure_threshold, recovery_timeout)
+        self.outstanding: int = 0  # Searches currently running against it
+        self.latency: Optional[float] = None  # Moving average of its search latency in seconds
+        self.searches: int = 0
+        self.failures: int = 0
+
+    @property
+    def healthy(self) -> bool:
+        return self.breaker.state == CircuitBreaker.CLOSED
+
+    def to_dict(self) -> dict:
+        return {
+            'uri': self.uri, 'state': self.breaker.state, 'outstanding': self.outstanding, 'latency': self.latency,
+            'searches': self.searches, 'failures': self.failures
+        }
+
+
+class MCommunityServerSet:
+    """
+    Several LDAP replicas to spread searches over, instead of the single MCommunityBase.server_uri. Each search goes to
+    a healthy server picked by the strategy:
+        'round-robin': each server in turn
+        'least-outstanding': the server with the fewest searches running against it
+        'latency': a random server, weighted towards the ones that have answered fastest lately
+    A server that fails (per failover_on) is skipped until recovery_timeout has passed, then probed with one search,
+    and the search that failed is sent to the next healthy server straight away. Each server has its own connection
+    pool, so connections follow the searches to whichever servers are healthy.
+    """
+    ROUND_ROBIN: str = 'round-robin'
+    LEAST_OUTSTANDING: str = 'least-outstanding'
+    LATENCY: str = 'latency'
+    strategies: Tuple[str, ...] = (ROUND_ROBIN, LEAST_OUTSTANDING, LATENCY)
+
+    latency_alpha: float = 0.2  # Weight of the newest sample in each server's moving average latency
+
+    def __init__(self, server_uris: Iterable[str], strategy: str = ROUND_ROBIN, failure_threshold: int = 1,
+                 recovery_timeout: float = 30.0, failover_on: Tuple[Type[BaseException], ...] = (
+                     ldap.SERVER_DOWN, ldap.UNAVAILABLE, MCommunityTimeout
+                 )):
+        """
+        :param server_uris: LDAP URIs of the replicas, e.g. ['ldaps://ldap1.umich.edu', 'ldaps://ldap2.umich.edu']
+        :param strategy: one of strategies
+        :param failure_threshold: consecutive failures after which a server is skipped
+        :param recovery_timeout: seconds to skip a failed server for before probing it again
+        :param failover_on: exceptions that count as the server failing and send the search to the next server
+        """
+        if strategy not in self.strategies:
+            raise ValueError(f'Unknown strategy {strategy}; expected one of {", ".join(self.strategies)}')
+        self.servers: List[MCommunityServer] = [
+            MCommunityServer(uri, failure_threshold, recovery_timeout) for uri in server_uris
+        ]
+        if not self.servers:
+            raise ValueError('At least one server URI is required')
+        self.strategy: str = strategy
+        self.failover_on: Tuple[Type[BaseException], ...] = failover_on
+
+        self._turn: int = 0  # For round-robin, and to break least-outstanding ties fairly
+        self._lock = threading.Lock()
+
+    ##################
+    # Public Methods #
+    ##################
+    def choose(self, exclude: Iterable[str] = ()) -> MCommunityServer:
+        """
+        Pick the server for the next search. If no server is healthy, the first one due a probe is picked instead.
+        :param exclude: URIs not to pick, e.g. ones that already failed this search
+        :return: the server; raises CircuitOpenError if none can be used now
+        """
+        exclude = set(exclude)
+        candidates = [s for s in self.servers if s.uri not in exclude]
+        healthy = [s for s in candidates if s.healthy]
+        if healthy:
+            return self._pick(healthy)
+        for server in candidates:
+            if server.breaker.allow():
+                logger.info(f'Probing MCommunity server {server.uri}')
+                return server
+        raise CircuitOpenError({'desc': 'No MCommunity server available',
+                                'info': f'{len(self.servers)} servers, none healthy'})
+
+    def record_failure(self, server: MCommunityServer) -> None:
+        with self._lock:
+            server.failures += 1
+        server.breaker.record_failure()
+
+    def record_success(self, server: MCommunityServer, seconds: float) -> None:
+        """
+        :param server: the server that answered
+        :param seconds: how long it took
+        :return: None
+        """
+        with self._lock:
+            server.searches += 1
+            server.latency = seconds if server.latency is None else \
+                self.latency_alpha * seconds + (1 - self.latency_alpha) * server.latency
+        server.breaker.record_success()
+
+    def run(self, operation: Callable[[str], T], on_failure: Optional[Callable[[str], None]] = None) -> T:
+        """
+        Run operation(uri) against a server picked by the strategy, sending it to the next healthy server as soon as
+        one fails. Each server is tried at most once; waiting and trying again is left to the RetryPolicy.
+        :param operation: callable taking the server URI
+        :param on_failure: called with the URI of each server that fails, e.g. to drop its pooled connections
+        :return: what operation returns; raises the last failure if every server failed
+        """
+        tried = []
+        last_error: Optional[BaseException] = None
+        while True:
+            try:
+                server = self.choose(exclude=tried)
+            except CircuitOpenError:
+                if last_error is None:
+                    raise
+                server = None
+            if server is None:
+                raise last_error  # Every server failed; the RetryPolicy decides whether to try them again
+            tried.append(server.uri)
+            with self._lock:
+                server.outstanding += 1
+            start = time.perf_counter()
+            try:
+                result = operation(server.uri)
+            except (CircuitOpenError, DeadlineExceeded):
+                raise
+            except self.failover_on as e:
+                self.record_failure(server)
+                if on_failure is not None:
+                    on_failure(server.uri)
+                logger.warning(f'MCommunity server {server.uri} failed with {e!r}; failing over')
+                last_error = e
+                continue
+            except ldap.LDAPError:
+                self.record_success(server, time.perf_counter() - start)  # It answered, even if with an error
+                raise
+            finally:
+                with self._lock:
+                    server.outstanding -= 1
+            self.record_success(server, time.perf_counter() - start)
+            return result
+
+    def stats(self) -> List[dict]:
+        """
+        :return: list of each server's URI, circuit state, outstanding searches, moving average latency, and search
+        and failure counts
+        """
+        with self._lock:
+            return [server.to_dict() for server in self.servers]
+
+    @property
+    def uris(self) -> List[str]:
+        return [server.uri for server in self.servers]
+
+    ###################
+    # Private Methods #
+    ###################
+    def _pick(self, candidates: List[MCommunityServer]) -> MCommunityServer:
+        """
+        :param candidates: healthy servers
+        :return: the one the strategy picks
+        """
+        with self._lock:
+            turn = self._turn % len(self.servers)
+            self._turn += 1
+            # Candidates starting from this turn's place in the full list, so a failed over search goes to the next one
+            ordered = [s for s in self.servers[turn:] + self.servers[:turn] if s in candidates]
+            if self.strategy == self.ROUND_ROBIN:
+                return ordered[0]
+            if self.strategy == self.LEAST_OUTSTANDING:
+                return min(ordered, key=lambda s: s.outstanding)
+            known = [s.latency for s in candidates if s.latency is not None]
+            default = min(known) if known else 1.0  # Servers not measured yet get a turn as if they were the fastest
+            weights = [1 / max(s.latency if s.latency is not None else default, 1e-6) for s in candidates]
+        return random.choices(candidates, weights)[0]
@@ -0,0 +1,167 @@
+import threading
+from typing import Dict, Optional, Tuple, Union
+
+from mcommunity.mcommunity_cache import MCommunityCache
+from mcommunity.mcommunity_metrics import MCommunityMetrics
+from mcommunity.mcommunity_pool import MCommunityConnectionPool
+from mcommunity.mcommunity_retry import CircuitBreaker, RetryPolicy
+from mcommunity.mcommunity_servers import MCommunityServerSet
+from mcommunity.mcommunity_singleflight import SingleFlight
+from mcommunity.mcommunity_snapshot import MCommunitySnapshot
+
+
+class MCommunitySession:
+    """
+    Holds what every MCommunityUser/MCommunityGroup looked up with one set of app credentials has in common: the
+    credentials themselves, the session's own connection pools (one per server), the circuit breaker, the latency
+    metrics, and optionally a cache and a snapshot. Objects built through a session only keep a reference to it.
+    Objects built the old way, with an app cn and secret, share a default session per credentials (see
+    for_credentials) whose settings all fall back to the MCommunityBase class attributes.
+    """
+    _sessions: Dict[Tuple[str, str], 'MCommunitySession'] = {}
+    _sessions_lock = threading.Lock()
+
+    def __init__(self, mcommunity_app_cn: str, mcommunity_secret: str, server_uri: Optional[str] = None,
+                 pool_size: Optional[int] = None, size_limit: Optional[int] = None, page_size: Optional[int] = None,
+                 cache: Optional[MCommunityCache] = None, snapshot: Optional[MCommunitySnapshot] = None,
+                 retry_policy: Optional[RetryPolicy] = None, circuit_breaker: Optional[CircuitBreaker] = None,
+                 connect_timeout: Optional[float] = None, bind_timeout: Optional[float] = None,
+                 search_timeout: Optional[float] = None, time_limit: Optional[int] = None,
+                 metrics: Optional[MCommunityMetrics] = None, servers: Optional[MCommunityServerSet] = None,
+                 coalesce: Optional[bool] = None):
+        """
+        Any setting left as None falls back to the same-named class attribute of the object doing the search, e.g.
+        MCommunityBase.server_uri.
+        :param mcommunity_app_cn: cname of the MCommunity app that the secret is tied to (ex: ITS-Dropbox-McDirApp001)
+        :param mcommunity_secret: secret/password for that app to connect to LDAP
+        :param server_uri: LDAP URI to connect to
+        :param pool_size: max bound connections in each of the session's pools
+        :param size_limit: client-side cap on entries returned per search
+        :param page_size: entries per page for paged searches
+        :param cache: in-process cache for query results
+        :param snapshot: on-disk store for query results
+        :param retry_policy: how to retry searches while the server is unavailable
+        :param circuit_breaker: breaker shared by every search in the session; a new one by default. Pass the same
+        breaker to several sessions that talk to the same server so they all fail fast together.
+        :param connect_timeout: seconds to wait for the network connection to open; -1 for no timeout
+        :param bind_timeout: seconds to wait for the bind to be answered; -1 for no timeout
+        :param search_timeout: seconds to wait for a search's results; -1 for no timeout
+        :param time_limit: seconds the server may spend on a search; 0 for no limit beyond the server's
+        :param metrics: where search latencies and counters are recorded and hooks registered; a new MCommunityMetrics
+        by default
+        :param servers: replicas to spread searches over instead of server_uri
+        :param coalesce: whether identical searches in flight at the same time share one round trip
+        """
+        self.mcommunity_app_cn: str = mcommunity_app_cn
+        self.mcommunity_secret: str = mcommunity_secret
+        self.server_uri: Optional[str] = server_uri
+        self.pool_size: Optional[int] = pool_size
+        self.size_limit: Optional[int] = size_limit
+        self.page_size: Optional[int] = page_size
+        self.cache: Optional[MCommunityCache] = cache
+        self.snapshot: Optional[MCommunitySnapshot] = snapshot
+        self.retry_policy: Optional[RetryPolicy] = retry_policy
+        self.circuit_breaker: CircuitBreaker = circuit_breaker or CircuitBreaker()
+        self.connect_timeout: Optional[float] = connect_timeout
+        self.bind_timeout: Optional[float] = bind_timeout
+        self.search_timeout: Optional[float] = search_timeout
+        self.time_limit: Optional[int] = time_limit
+        self.metrics: MCommunityMetrics = metrics or MCommunityMetrics()
+        self.servers: Optional[MCommunityServerSet] = servers
+        self.coalesce: Optional[bool] = coalesce
+        self.single_flight: SingleFlight = SingleFlight()  # Searches in flight, shared by everything in the session
+        self._connection_pools: Dict[str, MCommunityConnectionPool] = {}  # Server URI -> the session's pool for it
+        self._connection_pools_lock = threading.Lock()
+
+    def __enter__(self) -> 'MCommunitySession':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @classmethod
+    def for_credentials(cls, mcommunity_app_cn: str, mcommunity_secret: str) -> 'MCommunitySession':
+        """
+        Get the default session for a set of credentials, creating it on first use; used for objects built without a
+        session.
+        :param mcommunity_app_cn: cname of the MCommunity app
+        :param mcommunity_secret: secret/password for that app
+        :return: the shared session
+        """
+        key = (mcommunity_app_cn, mcommunity_secret)
+        with cls._sessions_lock:
+            if key not in cls._sessions:
+                cls._sessions[key] = cls(mcommunity_app_cn, mcommunity_secret)
+            return cls._sessions[key]
+
+    ##################
+    # Public Methods #
+    ##################
+    def close(self) -> None:
+        """
+        Unbind the idle connections in the session's pools; other sessions' connections are left alone.
+        :return: None
+        """
+        for pool in self._pools():
+            pool.close()
+
+    def connection_pool(self, server_uri: Optional[str] = None) -> MCommunityConnectionPool:
+        """
+        Get the session's pool of connections to a server, creating it with pool_size connections on first use.
+        :param server_uri: LDAP URI of the server; defaults to the session's or MCommunityBase's server_uri
+        :return: the pool
+        """
+        base = self._base()
+        server_uri = server_uri or base._setting('server_uri')
+        with self._connection_pools_lock:
+            if server_uri not in self._connection_pools:
+                self._connection_pools[server_uri] = MCommunityConnectionPool(max_size=base._setting('pool_size'))
+            return self._connection_pools[server_uri]
+
+    def group(self, cn: str, raw_result: Optional[list] = None, profile: Union[str, list, None] = None):
+        """
+        :return: MCommunityGroup(cn, raw_result=raw_result, profile=profile) using this session
+        """
+        from mcommunity.mcommunity_group import MCommunityGroup  # Here, since mcommunity_base imports this module
+        return MCommunityGroup(cn, raw_result=raw_result, profile=profile, session=self)
+
+    def stats(self) -> dict:
+        """
+        :return: dict of the cache's counters (None without a cache), the number of pooled connections, the
+        circuit breaker's state, the search latencies per query type (see MCommunityMetrics.stats), the connect, bind,
+        search, retry and cache counters (see MCommunityMetrics.counters) and each server's health and load (None
+        without servers)
+        """
+        servers = self._base()._setting('servers')
+        return {
+            'cache': self.cache.stats() if self.cache is not None else None,
+            'pool_connections': sum(pool.size for pool in self._pools()),
+            'circuit': self.circuit_breaker.state,
+            'latency': self.metrics.stats(),
+            'counters': self.metrics.counters(),
+            'servers': servers.stats() if servers is not None else None,
+        }
+
+    def user(self, uniqname: str, raw_result: Optional[list] = None, profile: Union[str, list, None] = None):
+        """
+        :return: MCommunityUser(uniqname, raw_result=raw_result, profile=profile) using this session
+        """
+        from mcommunity.mcommunity_user import MCommunityUser  # Here, since mcommunity_base imports this module
+        return MCommunityUser(uniqname, raw_result=raw_result, profile=profile, session=self)
+
+    ###################
+    # Private Methods #
+    ###################
+    def _base(self):
+        """
+        :return: an MCommunityBase using this session, to resolve settings that fall back to its class attributes
+        """
+        from mcommunity.mcommunity_base import MCommunityBase  # Here, since mcommunity_base imports this module
+        return MCommunityBase(session=self)
+
+    def _pools(self) -> list:
+        """
+        :return: the connection pools the session has opened so far
+        """
+        with self._connection_pools_lock:
+            return list(self._connection_pools.values())
@@ -0,0 +1,73 @@
+import threading
+from typing import Callable, Dict, Hashable, Optional, TypeVar
+
+T = TypeVar('T')
+
+
+class _Call:
+    """
+    One operation in flight and what it ended with.
+    """
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Thread-safe de-duplication of identical operations running at the same time: while one caller runs the operation
+    for a key, every other caller asking for the same key waits for it and gets the same result or exception instead of
+    running it again. Nothing is kept once the operation finishes; that is what MCommunityCache is for.
+    """
+
+    def __init__(self):
+        self.coalesced: int = 0  # Callers that shared another caller's operation instead of running their own
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    ##################
+    # Public Methods #
+    ##################
+    def do(self, key: Hashable, operation: Callable[[], T], on_coalesced: Optional[Callable[[], None]] = None) -> T:
+        """
+        :param key: what identifies identical operations, e.g. a key from MCommunityCache.make_key()
+        :param operation: callable to run if no operation for key is in flight
+        :param on_coalesced: called if this caller ends up sharing an operation already in flight
+        :return: what the operation returns; raises what it raised
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+        if not leader:
+            if on_coalesced is not None:
+                on_coalesced()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = operation()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    @property
+    def in_flight(self) -> int:
+        """
+        :return: number of distinct operations running now
+        """
+        with self._lock:
+            return len(self._calls)
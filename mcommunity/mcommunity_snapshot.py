@@ -0,0 +1,129 @@
+import json
+import logging
+import marshal
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional, Tuple
+
+from mcommunity.mcommunity_cache import CacheKey, MCommunityCache
+
+logger = logging.getLogger(__name__)
+
+
+class MCommunitySnapshot:
+    """
+    Persistent on-disk store of raw query results in SQLite, keyed the same way as MCommunityCache. It survives process
+    restarts and can be shared by several worker processes on the same host, so a warm start does not have to go back
+    to LDAP for entries fetched recently.
+    """
+
+    def __init__(self, path: str, max_age: float = 86400.0, timeout: float = 30.0):
+        """
+        :param path: path to the SQLite file; it is created if it does not exist
+        :param max_age: seconds a stored result is considered fresh; older results are ignored
+        :param timeout: seconds to wait for another process holding a write lock on the file
+        """
+        self.path: str = path
+        self.max_age: float = max_age
+        self.timeout: float = timeout
+        self._local = threading.local()  # sqlite3 connections can't be shared between threads
+        with self._connection() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                'search_base TEXT NOT NULL, query_object TEXT NOT NULL, ldap_attributes TEXT NOT NULL, '
+                'fetched_at REAL NOT NULL, result BLOB NOT NULL, '
+                'PRIMARY KEY (search_base, query_object, ldap_attributes))'
+            )
+
+    ##################
+    # Public Methods #
+    ##################
+    def get(self, key: CacheKey) -> Optional[list]:
+        """
+        :param key: key from MCommunityCache.make_key()
+        :return: the stored query result if it is fresh, otherwise None
+        """
+        row = self._connection().execute(
+            'SELECT result FROM results WHERE search_base = ? AND query_object = ? AND ldap_attributes = ? '
+            'AND fetched_at > ?', self._row_key(key) + (time.time() - self.max_age,)
+        ).fetchone()
+        return marshal.loads(row[0]) if row else None
+
+    def set(self, key: CacheKey, result: list) -> None:
+        """
+        Store a query result, replacing any older one for the same key.
+        :param key: key from MCommunityCache.make_key()
+        :param result: the query result as returned by MCommunityBase.search
+        :return: None
+        """
+        self.set_many([(key, result)])
+
+    def set_many(self, items: Iterable[Tuple[CacheKey, list]]) -> None:
+        """
+        Store many query results in a single transaction.
+        :param items: (key, result) pairs
+        :return: None
+        """
+        now = time.time()
+        with self._connection() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+                [self._row_key(key) + (now, marshal.dumps(result)) for key, result in items]
+            )
+
+    def warm(self, cache: MCommunityCache) -> int:
+        """
+        Load every fresh stored result into an in-memory cache.
+        :param cache: the cache to fill
+        :return: number of results loaded
+        """
+        loaded = 0
+        rows = self._connection().execute(
+            'SELECT search_base, query_object, ldap_attributes, result FROM results WHERE fetched_at > ?',
+            (time.time() - self.max_age,)
+        )
+        for search_base, query_object, ldap_attributes, result in rows:
+            cache.set(cache.make_key(search_base, query_object, json.loads(ldap_attributes)), marshal.loads(result))
+            loaded += 1
+        logger.debug(f'Warmed MCommunity cache with {loaded} results from {self.path}')
+        return loaded
+
+    def delete(self, key: CacheKey) -> None:
+        with self._connection() as connection:
+            connection.execute(
+                'DELETE FROM results WHERE search_base = ? AND query_object = ? AND ldap_attributes = ?',
+                self._row_key(key)
+            )
+
+    def prune(self) -> int:
+        """
+        Delete results older than max_age.
+        :return: number of results deleted
+        """
+        with self._connection() as connection:
+            cursor = connection.execute('DELETE FROM results WHERE fetched_at <= ?', (time.time() - self.max_age,))
+            return cursor.rowcount
+
+    def clear(self) -> None:
+        with self._connection() as connection:
+            connection.execute('DELETE FROM results')
+
+    ###################
+    # Private Methods #
+    ###################
+    def _connection(self) -> sqlite3.Connection:
+        """
+        :return: this thread's connection to the SQLite file, opened in WAL mode so readers in other processes are not
+        blocked by a writer
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _row_key(key: CacheKey) -> Tuple[str, str, str]:
+        return key[0], key[1], json.dumps(list(key[2]))
@@ -0,0 +1,194 @@
+import logging
+import marshal
+import sqlite3
+import threading
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from ldap.filter import escape_filter_chars
+
+from mcommunity.mcommunity_base import MCommunityBase
+from mcommunity.mcommunity_group import MCommunityGroup
+from mcommunity.mcommunity_session import MCommunitySession
+
+logger = logging.getLogger(__name__)
+
+
+class GroupDelta(NamedTuple):
+    """
+    How one group's direct membership changed between two polls of a GroupSync.
+    """
+    cn: str
+    added: Tuple[str, ...]  # Uniqnames, in the server's order
+    removed: Tuple[str, ...]
+    added_groups: Tuple[str, ...]  # cnames of nested groups
+    removed_groups: Tuple[str, ...]
+    modify_timestamp: str  # The group's modifyTimestamp, e.g. '20261018120000Z'; empty if it was deleted
+
+    @property
+    def deleted(self) -> bool:
+        return not self.modify_timestamp
+
+
+class GroupSync:
+    """
+    Incremental mirror of the direct membership of many groups. Each poll() asks the server only for the groups whose
+    modifyTimestamp is at or after the newest one already seen, re-fetches just those, and yields what changed against
+    the membership stored from the previous poll; unchanged groups cost nothing beyond their share of one small filter
+    per chunk_size groups, so steady-state polling scales with the number of changes rather than the total membership.
+    The stored membership lives in SQLite, so a poller can pick up where it left off after a restart.
+
+    An incremental poll can't see a group being deleted, and can miss a second change made within the same second as
+    the fetch that saw the first; poll(full=True) compares every group's modifyTimestamp instead and catches both, so
+    run one now and then.
+    """
+    chunk_size: int = 100  # Groups per OR filter
+    fetch_attributes: list = ['cn', 'member', 'modifyTimestamp']
+
+    def __init__(self, cns: Iterable[str], mcommunity_app_cn: Optional[str] = None,
+                 mcommunity_secret: Optional[str] = None, state_path: str = ':memory:',
+                 session: Optional[MCommunitySession] = None):
+        """
+        :param cns: cnames of the groups to mirror
+        :param mcommunity_app_cn: cname of the MCommunity app that the secret is tied to (ex: ITS-Dropbox-McDirApp001)
+        :param mcommunity_secret: secret/password for that app to connect to LDAP
+        :param state_path: path to the SQLite file the membership is stored in; it is created if it does not exist.
+        The default keeps it in memory for the life of the object.
+        :param session: session to use instead of mcommunity_app_cn and mcommunity_secret
+        """
+        self.cns: List[str] = list(dict.fromkeys(cns))
+        self.session: MCommunitySession = session or MCommunitySession.for_credentials(
+            mcommunity_app_cn, mcommunity_secret
+        )
+        self.state_path: str = state_path
+        self.last_poll: Dict[str, int] = {}  # Groups checked, fetched (new or changed), deleted and deltas yielded
+
+        self._base = MCommunityBase(session=self.session)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(state_path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS groups ('
+                'cn TEXT PRIMARY KEY, modify_timestamp TEXT NOT NULL, members BLOB NOT NULL, '
+                'member_groups BLOB NOT NULL)'
+            )
+
+    ##################
+    # Public Methods #
+    ##################
+    def close(self) -> None:
+        self._db.close()
+
+    def members(self, cn: str) -> Tuple[str, ...]:
+        """
+        :param cn: cname of one of the groups
+        :return: its uniqnames as of the latest poll; empty if it has not been seen
+        """
+        with self._lock:
+            row = self._db.execute('SELECT members FROM groups WHERE cn = ?', (cn,)).fetchone()
+        return marshal.loads(row[0]) if row else ()
+
+    def poll(self, full: bool = False) -> Iterator[GroupDelta]:
+        """
+        Find the groups that changed since the last poll and yield how. The first poll of a group yields all of its
+        members as added. The stored membership of each group is updated as its delta is yielded, so stopping partway
+        loses nothing; the rest are found again by the next poll.
+        :param full: if True, compare every group's modifyTimestamp instead of asking only for groups changed since the
+        newest one seen, which also finds deleted groups
+        :return: generator of GroupDeltas for the groups whose membership changed
+        """
+        with self._lock:
+            stored = dict(self._db.execute('SELECT cn, modify_timestamp FROM groups').fetchall())
+        watermark = max(stored.values(), default=None)
+        known = [cn for cn in self.cns if cn in stored]
+
+        if full or watermark is None:
+            timestamps = self._timestamps(known)
+        else:
+            timestamps = self._timestamps(known, since=watermark)
+        changed = [cn for cn in self.cns if cn not in stored] + \
+            [cn for cn, timestamp in timestamps.items() if timestamp != stored[cn]]
+        deleted = [cn for cn in known if cn not in timestamps] if full or watermark is None else []
+        self.last_poll = {'checked': len(self.cns), 'fetched': len(changed), 'deleted': len(deleted), 'deltas': 0}
+        logger.debug(f'Group sync: {len(changed)} of {len(self.cns)} groups new or changed, {len(deleted)} deleted')
+
+        results = self._base.search_many(
+            MCommunityGroup.search_base, 'cn', changed, self.fetch_attributes, self.chunk_size, use_cache=False
+        ) if changed else {}
+        for cn in changed:
+            if results[cn]:
+                group = self.session.group(cn, raw_result=results[cn], profile=self.fetch_attributes)
+                modify_timestamp = results[cn][0][1].get('modifyTimestamp', [b''])[0].decode('UTF-8')
+                delta = self._update(cn, modify_timestamp, group.members, group.member_groups)
+            elif cn in stored:
+                delta = self._update(cn, '', (), ())  # Gone between the timestamp query and the fetch
+            else:
+                logger.warning(f'MCommunity group {cn} does not exist; skipping it')
+                continue
+            if delta is not None:
+                self.last_poll['deltas'] += 1
+                yield delta
+        for cn in deleted:
+            self.last_poll['deltas'] += 1
+            yield self._update(cn, '', (), ())
+
+    def reset(self) -> None:
+        """
+        Forget the stored membership, so the next poll yields every group in full.
+        :return: None
+        """
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM groups')
+
+    ###################
+    # Private Methods #
+    ###################
+    def _timestamps(self, cns: List[str], since: Optional[str] = None) -> Dict[str, str]:
+        """
+        Get the modifyTimestamp of groups with one small search per chunk_size groups.
+        :param cns: cnames of the groups
+        :param since: if given, only groups modified at or after this timestamp are returned, filtered by the server
+        :return: dict of cname to modifyTimestamp for the groups that exist (and changed, if since is given)
+        """
+        timestamps = {}
+        for start in range(0, len(cns), self.chunk_size):
+            query_object = '(|{})'.format(''.join(f'(cn={escape_filter_chars(cn)})'
+                                                  for cn in cns[start:start + self.chunk_size]))
+            if since is not None:
+                query_object = f'(&(modifyTimestamp>={escape_filter_chars(since)}){query_object})'
+            result = self._base.search(MCommunityGroup.search_base, query_object, ['cn', 'modifyTimestamp'],
+                                       use_cache=False)
+            by_lower = {cn.lower(): cn for cn in cns[start:start + self.chunk_size]}
+            for dn, attrs in result:
+                cn = by_lower.get(self._base._rdn_value(dn).lower())
+                if cn is not None:
+                    timestamps[cn] = attrs.get('modifyTimestamp', [b''])[0].decode('UTF-8')
+        return timestamps
+
+    def _update(self, cn: str, modify_timestamp: str, members: Iterable[str],
+                member_groups: Iterable[str]) -> Optional[GroupDelta]:
+        """
+        Store a group's new membership (or drop it, if modify_timestamp is empty) and work out what changed.
+        :return: the delta, or None if the membership is the same as stored
+        """
+        members, member_groups = tuple(members), tuple(member_groups)
+        with self._lock, self._db:
+            row = self._db.execute('SELECT members, member_groups FROM groups WHERE cn = ?', (cn,)).fetchone()
+            if modify_timestamp:
+                self._db.execute('INSERT OR REPLACE INTO groups VALUES (?, ?, ?, ?)',
+                                 (cn, modify_timestamp, marshal.dumps(members), marshal.dumps(member_groups)))
+            else:
+                self._db.execute('DELETE FROM groups WHERE cn = ?', (cn,))
+        old_members, old_groups = (marshal.loads(row[0]), marshal.loads(row[1])) if row else ((), ())
+        delta = GroupDelta(cn, *self._diff(old_members, members), *self._diff(old_groups, member_groups),
+                           modify_timestamp)
+        if row is not None and modify_timestamp and not any(delta[1:5]):
+            return None
+        return delta
+
+    @staticmethod
+    def _diff(old: Tuple[str, ...], new: Tuple[str, ...]) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+        """
+        :return: tuple of what is in new but not old and what is in old but not new, each in its original order
+        """
+        old_set, new_set = set(old), set(new)
+        return tuple(i for i in new if i not in old_set), tuple(i for i in old if i not in new_set)
@@ -1,22 +1,80 @@
 import json
 import logging
 import re
-from typing import Optional
+import sys
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple, Union
 from warnings import warn
 
+from ldap.filter import escape_filter_chars
+
 from mcommunity.mcommunity_base import MCommunityBase
+from mcommunity.mcommunity_session import MCommunitySession
 
 logger = logging.getLogger(__name__)
 
+ELIGIBLE_VALUES = frozenset(['yes', 'yesDelay', 'yesImmed'])  # uSE eligibility values that mean the user is eligible
+
+# Affiliations from lowest to highest; an affiliation's rank is its index. A umichInstRoles value has the affiliation as
+# its prefix, followed by a campus or subtype suffix, e.g. 'FacultyAA', 'StudentFLNT', 'Retiree'.
+AFFILIATIONS: Tuple[str, ...] = (
+    'NA', 'Alumni', 'Retiree', 'SponsoredAffiliate', 'TemporaryStaff', 'Student', 'RegularStaff', 'Faculty'
+)
+_ROLE_PREFIX = re.compile('|'.join(AFFILIATIONS[1:]))
+_role_ranks: Dict[Union[str, bytes], int] = {}  # Rank of each distinct role value seen; there are only a few dozen
+_SPONSORED_UM_ACCOUNT = re.compile('um[0-9]+')  # Uniqname of a type 3 sponsored affiliate
+_SPONSORED_99_UMID = re.compile('99')  # UMID prefix of a type 2 sponsored affiliate
+
+
+class ServiceEntitlement(NamedTuple):
+    system: str  # e.g. 'enterprise', 'box'
+    eligibility: str  # e.g. 'yes', 'yesDelay', 'no'
+    status: str  # e.g. 'active', 'role', ''
+    change_date: Optional[datetime]  # When the entitlement last changed, in UTC; None if missing or malformed
+    eligible: bool  # Whether eligibility is one of ELIGIBLE_VALUES
+
+    @classmethod
+    def from_json(cls, use: Union[str, bytes]) -> 'ServiceEntitlement':
+        """
+        :param use: one umichServiceEntitlement value, a JSON object as a string or the bytes LDAP returns
+        :return: the parsed entitlement
+        """
+        r = json.loads(use)
+        try:
+            change_date = datetime.strptime(r.get('changeDate', ''), '%Y%m%d%H%M%SZ').replace(tzinfo=timezone.utc)
+        except (TypeError, ValueError):
+            change_date = None
+        eligibility = r.get('eligibility') or ''
+        return cls(sys.intern(r.get('system') or ''), sys.intern(eligibility), sys.intern(r.get('status') or ''),
+                   change_date, eligibility in ELIGIBLE_VALUES)
+
 
 class MCommunityUser(MCommunityBase):
     search_base: str = 'ou=People,dc=umich,dc=edu'
+    group_search_base: str = 'ou=User Groups,ou=Groups,dc=umich,dc=edu'  # Same as MCommunityGroup.search_base
     ldap_attributes: list = [
         '*', 'umichServiceEntitlement', 'entityid', 'umichDisplaySN', 'umichNameOfRecord', 'displayName'
     ]
+    fetch_profiles: dict = {
+        'minimal': ['uid', 'entityid', 'displayName'],
+        'eligibility': ['uid', 'entityid', 'displayName', 'umichInstRoles', 'umichServiceEntitlement'],
+        'full': ldap_attributes,
+    }
 
-    def __init__(self, uniqname: str, mcommunity_app_cn, mcommunity_secret):
-        super().__init__(mcommunity_app_cn, mcommunity_secret)
+    def __init__(self, uniqname: str, mcommunity_app_cn=None, mcommunity_secret=None, raw_result: Optional[list] = None,
+                 profile: Union[str, list, None] = None, session: Optional[MCommunitySession] = None):
+        """
+        Get data about an M-Community user via LDAP.
+        :param uniqname: the uniqname of the user
+        :param raw_result: an already-fetched query result for this user (e.g. from MCommunityBase.search_many); if
+        given, no search is done
+        :param profile: which attributes to fetch: 'minimal', 'eligibility', 'full' (the default) or a list of
+        attributes; anything read later that the profile left out is fetched with one follow-up search. If raw_result
+        is given, this is the profile it was fetched with.
+        :param session: session to use instead of mcommunity_app_cn and mcommunity_secret, see MCommunitySession.user
+        """
+        super().__init__(mcommunity_app_cn, mcommunity_secret, session)
         self.name: str = uniqname
         self.query_object: str = f'uid={uniqname}'
         self.email: str = self.name + '@umich.edu'
@@ -24,8 +82,12 @@ class MCommunityUser(MCommunityBase):
         self.affiliations: list = []  # Populate via populate_affiliations
         self.highest_affiliation: str = ''  # Populate via populate_highest_affiliation
         self.service_entitlements: list = []  # Populate via populate_service_entitlements
+        self._entitlements: Optional[Dict[str, ServiceEntitlement]] = None  # Parsed on first use, see entitlements
 
-        self.raw_result = self.search(self.search_base, self.query_object, self.ldap_attributes)
+        self._fetched_attributes = self.profile_attributes(profile)
+        if raw_result is None:
+            raw_result = self.search(self.search_base, self.query_object, self._fetched_attributes)
+        self.raw_result = raw_result
         self.entityid: str = self._decode('entityid')  # a.k.a. UMID
         self.display_name: str = self._decode('displayName')  # Display name, a.k.a. preferred name
 
@@ -36,6 +98,31 @@ class MCommunityUser(MCommunityBase):
             self.exists: bool = True
             self.errors: Optional[BaseException] = None
 
+    @classmethod
+    def affiliation_rank(cls, roles: Iterable[Union[str, bytes]]) -> int:
+        """
+        Classify a user's roles in one pass.
+        :param roles: umichInstRoles values, decoded or as the bytes LDAP returns
+        :return: index in AFFILIATIONS of the highest affiliation among the roles; 0 ('NA') if there are none
+        """
+        rank = 0
+        for role in roles:
+            role_rank = _role_ranks.get(role)
+            if role_rank is None:
+                role_rank = cls._role_rank(role)
+            if role_rank > rank:
+                rank = role_rank
+        return rank
+
+    @classmethod
+    def classify_affiliations(cls, role_lists: Iterable[Iterable[Union[str, bytes]]]) -> array:
+        """
+        Classify many users' roles at once, e.g. the umichInstRoles of every result from search_many.
+        :param role_lists: one list of umichInstRoles values per user
+        :return: array of one affiliation_rank per user, in the same order
+        """
+        return array('B', map(cls.affiliation_rank, role_lists))
+
     ##################
     # Public Methods #
     ##################
@@ -46,15 +133,17 @@ class MCommunityUser(MCommunityBase):
         :param service: the uSE to look for in the service_entitlement list
         :return: boolean for whether or not they are eligible
         """
-        eligible = False
-        self.populate_service_entitlements()
-        for i in self.service_entitlements:
-            r = json.loads(i)
-            if r.get('system') == service:
-                if r.get('eligibility') in ['yes', 'yesDelay', 'yesImmed']:
-                    eligible = True
-                    break
-        return eligible
+        entitlement = self.entitlements.get(service)
+        return entitlement is not None and entitlement.eligible
+
+    def check_service_entitlements(self, services: Iterable[str]) -> Dict[str, bool]:
+        """
+        Check eligibility for many services at once; see check_service_entitlement.
+        :param services: the uSE systems to check
+        :return: dict of each service to whether or not they are eligible
+        """
+        entitlements = self.entitlements
+        return {service: service in entitlements and entitlements[service].eligible for service in services}
 
     def check_sponsorship_type(self) -> int:
         """
@@ -64,15 +153,29 @@ class MCommunityUser(MCommunityBase):
         """
         if not self.highest_affiliation:
             self.populate_highest_affiliation()
-        if self.highest_affiliation == 'SponsoredAffiliate':
-            if re.match('^um[0-9]+', self.name):
-                return 3
-            elif re.match('^99', self.entityid):
-                return 2
-            else:
-                return 1
-        else:
-            return 0
+        return self._sponsorship_type(self.highest_affiliation, self.name, self.entityid)
+
+    @property
+    def entitlements(self) -> Dict[str, ServiceEntitlement]:
+        """
+        The user's uSE, parsed once and indexed by system. If a system appears more than once, an eligible entry wins
+        over an ineligible one, then the most recently changed.
+        :return: dict of system to ServiceEntitlement
+        """
+        if self._entitlements is None:
+            self.populate_service_entitlements()
+            self._entitlements = self._index_entitlements(self.service_entitlements)
+        return self._entitlements
+
+    def groups(self) -> list:
+        """
+        Find every group the user is a direct member of with a single search on the groups' member attribute, rather
+        than loading the groups and scanning their member lists.
+        :return: list of group cnames
+        """
+        dn = self.raw_result[0][0] if self.raw_result else f'uid={self.name},{self.search_base}'
+        result = self.search(self.group_search_base, f'(member={escape_filter_chars(dn)})', ['cn'])
+        return [self._rdn_value(group_dn) for group_dn, _ in result if group_dn]
 
     def populate_affiliations(self) -> None:
         """
@@ -89,23 +192,7 @@ class MCommunityUser(MCommunityBase):
         :return: None
         """
         self.populate_affiliations()  # Just to make sure; it won't run again if it was already done
-        role = ' '.join(self.affiliations)
-        if 'Faculty' in role:
-            self.highest_affiliation = 'Faculty'
-        elif 'RegularStaff' in role:
-            self.highest_affiliation = 'RegularStaff'
-        elif 'Student' in role:
-            self.highest_affiliation = 'Student'
-        elif 'TemporaryStaff' in role:
-            self.highest_affiliation = 'TemporaryStaff'
-        elif 'SponsoredAffiliate' in role:
-            self.highest_affiliation = 'SponsoredAffiliate'
-        elif 'Retiree' in role:
-            self.highest_affiliation = 'Retiree'
-        elif 'Alumni' in role:
-            self.highest_affiliation = 'Alumni'
-        else:
-            self.highest_affiliation = 'NA'
+        self.highest_affiliation = AFFILIATIONS[self.affiliation_rank(self.affiliations)]
 
     def populate_service_entitlements(self) -> None:
         """
@@ -123,3 +210,52 @@ class MCommunityUser(MCommunityBase):
         if self.errors:
             d['errors'] = self.errors.__repr__()
         return d
+
+    ###################
+    # Private Methods #
+    ###################
+    @classmethod
+    def _index_entitlements(cls, service_entitlements: Iterable[Union[str, bytes]]) -> Dict[str, ServiceEntitlement]:
+        """
+        Parse uSE values and index them by system; see entitlements.
+        :param service_entitlements: umichServiceEntitlement values
+        :return: dict of system to ServiceEntitlement
+        """
+        entitlements = {}
+        for use in service_entitlements:
+            entitlement = ServiceEntitlement.from_json(use)
+            current = entitlements.get(entitlement.system)
+            if current is None or cls._entitlement_rank(entitlement) > cls._entitlement_rank(current):
+                entitlements[entitlement.system] = entitlement
+        return entitlements
+
+    @staticmethod
+    def _role_rank(role: Union[str, bytes]) -> int:
+        """
+        Rank one role value by its affiliation prefix and remember it for affiliation_rank.
+        :param role: a umichInstRoles value
+        :return: index in AFFILIATIONS; 0 if the role does not start with a known affiliation
+        """
+        match = _ROLE_PREFIX.match(role.decode('UTF-8') if type(role) == bytes else role)
+        rank = AFFILIATIONS.index(match.group()) if match else 0
+        _role_ranks[role] = rank
+        return rank
+
+    @staticmethod
+    def _entitlement_rank(entitlement: ServiceEntitlement) -> tuple:
+        return entitlement.eligible, entitlement.change_date or datetime.min.replace(tzinfo=timezone.utc)
+
+    @staticmethod
+    def _sponsorship_type(highest_affiliation: str, uniqname: str, entityid: str) -> int:
+        """
+        :return: see check_sponsorship_type
+        """
+        if highest_affiliation == 'SponsoredAffiliate':
+            if _SPONSORED_UM_ACCOUNT.match(uniqname):
+                return 3
+            elif _SPONSORED_99_UMID.match(entityid):
+                return 2
+            else:
+                return 1
+        else:
+            return 0
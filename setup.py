@@ -8,5 +8,6 @@ setup(
       author='Maggie Davidson',
       author_email='jmaggie@umich.edu',
       packages=['mcommunity'],
-      install_requires=['python-ldap==3.4.0']
+      install_requires=['python-ldap==3.4.0'],
+      entry_points={'console_scripts': ['mcommunity=mcommunity.mcommunity_cli:main']}
 )
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import unittest
+from unittest.mock import MagicMock, patch
+
+import ldap
+
+from mcommunity import mcommunity_mocks as mocks
+from mcommunity.mcommunity_async import AsyncMCommunityClient
+from mcommunity.mcommunity_group import MCommunityGroup
+from mcommunity.mcommunity_pool import MCommunityConnectionPool
+from mcommunity.mcommunity_retry import RetryPolicy, SearchTimeout
+from mcommunity.mcommunity_session import MCommunitySession
+from mcommunity.mcommunity_user import MCommunityUser
+
+
+class FakeAsyncConnection:
+    """
+    Stand-in for an LDAPObject that answers search_ext/result3 from the mocks, with results becoming ready on the
+    second poll and in reverse order of submission.
+    """
+
+    def __init__(self):
+        self.searches = {}
+        self.polls = 0
+        self.abandoned = []
+
+    def search_ext(self, search_base, scope, query_object, ldap_attributes):
+        msgid = len(self.searches) + 1
+        self.searches[msgid] = (search_base, query_object, ldap_attributes)
+        return msgid
+
+    def result3(self, msgid, all=1, timeout=None):
+        self.polls += 1
+        if self.polls % 2 or not self.searches:
+            return None, None, None, None
+        msgid = max(self.searches)
+        search_base, query_object, ldap_attributes = self.searches.pop(msgid)
+        if query_object == 'uid=broken':
+            raise ldap.NO_SUCH_OBJECT({'msgid': msgid})
+        return ldap.RES_SEARCH_RESULT, mocks.mcomm_side_effect(search_base, query_object, ldap_attributes), msgid, []
+
+    def abandon(self, msgid):
+        self.abandoned.append(msgid)
+
+    def unbind_s(self):
+        pass
+
+
+class AsyncMCommunityClientTestCase(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.connection = FakeAsyncConnection()
+        self.patcher = patch('mcommunity.mcommunity_base.MCommunityBase.connect', return_value=self.connection)
+        self.connect = self.patcher.start()
+        self.client = AsyncMCommunityClient(mocks.test_app, mocks.test_secret, max_concurrency=2)
+        self.client.poll_interval = 0
+
+    async def test_fetch_user(self):
+        user = await self.client.fetch_user('nemcardf')
+        self.assertIsInstance(user, MCommunityUser)
+        self.assertEqual(mocks.faculty_mock, user.raw_result)
+        self.assertEqual('00000000', user.entityid)
+
+    async def test_fetch_user_not_exists(self):
+        user = await self.client.fetch_user('fake')
+        self.assertFalse(user.exists)
+
+    async def test_fetch_users_gather_in_order(self):
+        uniqnames = ['nemcardf', 'nemcards', 'nemcarda', 'nemcardrs', 'fake'] * 4
+        users = await self.client.fetch_users(uniqnames)
+        self.assertEqual(uniqnames, [user.name for user in users])
+        self.assertEqual(mocks.student_mock, users[1].raw_result)
+        self.assertEqual(1, self.connect.call_count)  # Every search shared one connection
+
+    async def test_fetch_users_return_exceptions(self):
+        users = await self.client.fetch_users(['nemcardf', 'broken'], return_exceptions=True)
+        self.assertTrue(users[0].exists)
+        self.assertIsInstance(users[1], ldap.NO_SUCH_OBJECT)
+
+    async def test_fetch_groups(self):
+        groups = await self.client.fetch_groups(['test-group', 'fake'], return_exceptions=True)
+        self.assertIsInstance(groups[0], MCommunityGroup)
+        self.assertCountEqual(['nemcardf', 'nemcardrs', 'nemcarda'], groups[0].members)
+        self.assertIsInstance(groups[1], NameError)
+
+    async def test_cancelled_search_is_abandoned(self):
+        self.client.poll_interval = 10
+        task = asyncio.ensure_future(self.client.fetch_user('nemcardf'))
+        while not self.connection.searches:  # Wait for the search to be sent
+            await asyncio.sleep(0.001)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual([1], self.connection.abandoned)
+
+    async def test_identical_searches_coalesced(self):
+        session = MCommunitySession(mocks.test_app, mocks.test_secret)
+        client = AsyncMCommunityClient(session=session)
+        client.poll_interval = 0
+        with patch.object(self.connection, 'search_ext', wraps=self.connection.search_ext) as search_ext:
+            users = await client.fetch_users(['nemcardf'] * 5 + ['nemcards'])
+        self.assertTrue(all(user.exists for user in users))
+        self.assertEqual(2, search_ext.call_count)  # One search per uniqname
+        self.assertEqual(4, session.stats()['latency']['People/lookup']['coalesced'])
+        await client.close()
+
+    async def test_coalesced_search_survives_leader_cancel(self):
+        self.client.poll_interval = 0.01
+        leader = asyncio.ensure_future(self.client.fetch_user('nemcardf'))
+        while not self.connection.searches:
+            await asyncio.sleep(0.001)
+        follower = asyncio.ensure_future(self.client.fetch_user('nemcardf'))
+        await asyncio.sleep(0.001)
+        leader.cancel()
+        self.assertTrue((await follower).exists)  # Searched again once the shared search was cancelled
+
+    async def test_search_timeout(self):
+        session = MCommunitySession(mocks.test_app, mocks.test_secret, search_timeout=0.01,
+                                    retry_policy=RetryPolicy(max_attempts=2, base_delay=0))
+        client = AsyncMCommunityClient(session=session)
+        client.poll_interval = 10  # Never answered in time
+        with self.assertRaises(SearchTimeout):
+            await client.fetch_user('nemcardf')
+        self.assertEqual([1, 2], self.connection.abandoned)
+        self.assertEqual(2, session.stats()['latency']['People/lookup']['timeouts'])
+        await client.close()
+
+    async def test_close_returns_connection_to_pool(self):
+        await self.client.fetch_user('nemcardf')
+        await self.client.close()
+        self.assertIs(self.connection, self.client.session.connection_pool().acquire(MagicMock()))
+
+    async def asyncTearDown(self) -> None:
+        await self.client.close()
+        self.patcher.stop()
+        MCommunityConnectionPool.close_all()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main(verbosity=3)
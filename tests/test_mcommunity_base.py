@@ -1,12 +1,28 @@
 import json
 import logging
 import unittest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 import ldap
 
 from mcommunity import mcommunity_mocks as mocks
 from mcommunity.mcommunity_base import MCommunityBase
+from mcommunity.mcommunity_pool import MCommunityConnectionPool
+
+
+def paged_connection(pages: list) -> MagicMock:
+    """
+    Mock connection that answers search_ext/result3 with one page of entries per call, setting the paged results
+    cookie until the last page.
+    """
+    connection = MagicMock()
+    responses = []
+    for i, page in enumerate(pages):
+        control = ldap.controls.SimplePagedResultsControl(True, size=len(page), cookie=b'' if i == len(pages) - 1 else
+                                                          f'page{i + 1}'.encode())
+        responses.append((ldap.RES_SEARCH_RESULT, page, i + 1, [control]))
+    connection.result3.side_effect = responses
+    return connection
 
 
 class MCommunityBaseTestCase(unittest.TestCase):
@@ -46,6 +62,39 @@ class MCommunityBaseTestCase(unittest.TestCase):
     def test_search_group_invalid(self):
         self.assertEqual([], self.base.search('ou=User Groups,ou=Groups,dc=umich,dc=edu', 'uid=fake', ['*']))
 
+    def test_search_many_groups_results_by_value(self):
+        results = self.base.search_many('ou=People,dc=umich,dc=edu', 'uid', ['nemcardf', 'nemcards', 'fake'], ['*'])
+        self.assertEqual(mocks.faculty_mock, results['nemcardf'])
+        self.assertEqual(mocks.student_mock, results['nemcards'])
+        self.assertEqual([], results['fake'])
+
+    def test_search_many_chunks_or_filters(self):
+        self.base.search_many('ou=People,dc=umich,dc=edu', 'uid', ['nemcardf', 'nemcards', 'nemcarda'], ['*'], 2)
+        self.assertEqual(2, self.mock.call_count)
+        self.assertEqual('(|(uid=nemcardf)(uid=nemcards))', self.mock.call_args_list[0][0][1])
+        self.assertEqual('(|(uid=nemcarda))', self.mock.call_args_list[1][0][1])
+
+    def test_search_many_escapes_values(self):
+        self.base.search_many('ou=People,dc=umich,dc=edu', 'uid', ['a*)(uid=b'], ['*'])
+        self.assertEqual(r'(|(uid=a\2a\29\28uid=b))', self.mock.call_args[0][1])
+
+    @patch('mcommunity.mcommunity_base.MCommunityBase.connect')
+    def test_search_paged_streams_pages(self, magic_mock):
+        magic_mock.return_value = paged_connection([
+            mocks.faculty_mock + mocks.student_mock, [(None, ['ldap://referral'])] + mocks.alumni_mock
+        ])
+        entries = self.base.search_paged('ou=People,dc=umich,dc=edu', '(umichInstRoles=*)', ['*'], page_size=2)
+        self.assertEqual(mocks.faculty_mock[0], next(entries))  # Nothing is fetched until the generator is consumed
+        self.assertEqual(mocks.student_mock + mocks.alumni_mock, list(entries))
+        search_ext = magic_mock.return_value.search_ext
+        self.assertEqual(2, search_ext.call_count)
+        self.assertEqual(2, search_ext.call_args_list[0][1]['serverctrls'][0].size)
+        self.assertEqual(b'page1', search_ext.call_args_list[1][1]['serverctrls'][0].cookie)
+
+    def test_rdn_value(self):
+        self.assertEqual('nemcardf', self.base._rdn_value('uid=nemcardf,ou=People,dc=umich,dc=edu'))
+        self.assertEqual('test-group', self.base._rdn_value(b'cn=test-group,ou=User Groups,ou=Groups,dc=umich,dc=edu'))
+
     def test_decode_str(self):
         self.base.raw_result = self.base.search('ou=People,dc=umich,dc=edu', 'uid=nemcardf', ['*'])
         self.assertEqual('test_decoding_str', self.base._decode('test_str'))
@@ -91,6 +140,7 @@ class MCommunityBaseTestCase(unittest.TestCase):
 
     def tearDown(self) -> None:
         self.patcher.stop()
+        MCommunityConnectionPool.close_all()
 
 
 if __name__ == '__main__':
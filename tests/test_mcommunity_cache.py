@@ -0,0 +1,104 @@
+import logging
+import unittest
+from unittest.mock import patch
+
+from mcommunity import mcommunity_mocks as mocks
+from mcommunity.mcommunity_base import MCommunityBase
+from mcommunity.mcommunity_cache import MCommunityCache
+from mcommunity.mcommunity_group import MCommunityGroup
+from mcommunity.mcommunity_user import MCommunityUser
+
+people = 'ou=People,dc=umich,dc=edu'
+
+
+class MCommunityCacheTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.cache = MCommunityCache(ttl=60, negative_ttl=10)
+        self.time_patcher = patch('mcommunity.mcommunity_cache.time.monotonic', return_value=1000.0)
+        self.time = self.time_patcher.start()
+
+    def key(self, uniqname):
+        return MCommunityCache.make_key(people, f'uid={uniqname}', ['*'])
+
+    def test_get_miss(self):
+        self.assertIsNone(self.cache.get(self.key('nemcardf')))
+        self.assertEqual(1, self.cache.misses)
+
+    def test_set_then_hit(self):
+        self.cache.set(self.key('nemcardf'), mocks.faculty_mock)
+        self.assertEqual(mocks.faculty_mock, self.cache.get(self.key('nemcardf')))
+        self.assertEqual(1, self.cache.hits)
+
+    def test_entry_expires_after_ttl(self):
+        self.cache.set(self.key('nemcardf'), mocks.faculty_mock)
+        self.time.return_value = 1061.0
+        self.assertIsNone(self.cache.get(self.key('nemcardf')))
+        self.assertEqual(0, self.cache.stats()['entries'])
+
+    def test_negative_entry_uses_negative_ttl(self):
+        self.cache.set(self.key('fake'), [])
+        self.assertEqual([], self.cache.get(self.key('fake')))
+        self.time.return_value = 1011.0
+        self.assertIsNone(self.cache.get(self.key('fake')))
+
+    def test_lru_eviction_by_entries(self):
+        self.cache.max_entries = 2
+        self.cache.set(self.key('nemcardf'), mocks.faculty_mock)
+        self.cache.set(self.key('nemcards'), mocks.student_mock)
+        self.cache.get(self.key('nemcardf'))  # nemcards is now the least recently used
+        self.cache.set(self.key('nemcarda'), mocks.alumni_mock)
+        self.assertIsNone(self.cache.get(self.key('nemcards')))
+        self.assertIsNotNone(self.cache.get(self.key('nemcardf')))
+        self.assertEqual(1, self.cache.evictions)
+
+    def test_lru_eviction_by_bytes(self):
+        self.cache.set(self.key('nemcardf'), mocks.faculty_mock)
+        self.cache.max_bytes = self.cache.stats()['bytes'] + 1
+        self.cache.set(self.key('nemcards'), mocks.student_mock)
+        self.assertEqual(1, self.cache.stats()['entries'])
+        self.assertIsNotNone(self.cache.get(self.key('nemcards')))
+
+    def test_invalidate_uniqname(self):
+        self.cache.set(self.key('nemcardf'), mocks.faculty_mock)
+        self.cache.set(self.key('nemcards'), mocks.student_mock)
+        self.assertEqual(1, self.cache.invalidate(uniqname='NEMCARDF'))
+        self.assertIsNone(self.cache.get(self.key('nemcardf')))
+        self.assertIsNotNone(self.cache.get(self.key('nemcards')))
+
+    def test_invalidate_cn(self):
+        key = MCommunityCache.make_key(MCommunityGroup.search_base, 'cn=test-group', ['*'])
+        self.cache.set(key, mocks.group_mock_1)
+        self.assertEqual(1, self.cache.invalidate(cn='test-group'))
+        self.assertIsNone(self.cache.get(key))
+
+    @patch('mcommunity.mcommunity_base.MCommunityBase._search_ldap')
+    def test_search_uses_cache(self, magic_mock):
+        magic_mock.side_effect = mocks.mcomm_side_effect
+        with patch.object(MCommunityBase, 'cache', self.cache):
+            MCommunityUser('nemcardf', mocks.test_app, mocks.test_secret)
+            user = MCommunityUser('nemcardf', mocks.test_app, mocks.test_secret)
+            missing = [MCommunityUser('fake', mocks.test_app, mocks.test_secret) for _ in range(2)]
+        self.assertEqual(2, magic_mock.call_count)
+        self.assertEqual('00000000', user.entityid)
+        self.assertFalse(missing[1].exists)
+
+    @patch('mcommunity.mcommunity_base.MCommunityBase._search_ldap')
+    def test_search_many_shares_cache_with_search(self, magic_mock):
+        magic_mock.side_effect = mocks.mcomm_side_effect
+        with patch.object(MCommunityBase, 'cache', self.cache):
+            base = MCommunityBase(mocks.test_app, mocks.test_secret)
+            base.search(people, 'uid=nemcardf', ['*'])
+            results = base.search_many(people, 'uid', ['nemcardf', 'nemcards'], ['*'])
+            base.search(people, 'uid=nemcards', ['*'])
+        self.assertEqual(2, magic_mock.call_count)
+        self.assertEqual('(|(uid=nemcards))', magic_mock.call_args_list[1][0][1])
+        self.assertEqual(mocks.faculty_mock, results['nemcardf'])
+
+    def tearDown(self) -> None:
+        self.time_patcher.stop()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main(verbosity=3)
@@ -0,0 +1,89 @@
+import contextlib
+import csv
+import io
+import json
+import logging
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from mcommunity import mcommunity_mocks as mocks
+from mcommunity.mcommunity_cli import build_parser, main
+from mcommunity.mcommunity_pool import MCommunityConnectionPool
+
+
+class CLITestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.patcher = patch('mcommunity.mcommunity_base.MCommunityBase.search')
+        self.mock = self.patcher.start()
+        self.mock.side_effect = mocks.mcomm_side_effect
+        self.tmp = tempfile.TemporaryDirectory()
+        self.credentials = ['--app', mocks.test_app, '--secret', mocks.test_secret]
+
+    def tearDown(self) -> None:
+        self.patcher.stop()
+        self.tmp.cleanup()
+        MCommunityConnectionPool.close_all()
+
+    def run_cli(self, *argv: str, stdin: str = ''):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with patch('sys.stdin', io.StringIO(stdin)), contextlib.redirect_stdout(stdout), \
+                contextlib.redirect_stderr(stderr):
+            status = main([*self.credentials, *argv])
+        return status, stdout.getvalue(), stderr.getvalue()
+
+    def test_users_stdin(self):
+        status, out, err = self.run_cli('--columns', 'uniqname,exists', 'users', stdin='nemcardf\n\nfake\n')
+        self.assertEqual(0, status)
+        self.assertEqual([{'uniqname': 'nemcardf', 'exists': True}, {'uniqname': 'fake', 'exists': False}],
+                         [json.loads(line) for line in out.splitlines()])
+        self.assertIn('mcommunity users: 2 records', err)
+        self.assertIn('cache 0 hits/2 misses', err)
+
+    def test_users_file(self):
+        path = os.path.join(self.tmp.name, 'uniqnames.txt')
+        with open(path, 'w') as f:
+            f.write('nemcardf\nnemcards\nnemcardts\n')
+        output = os.path.join(self.tmp.name, 'users.csv')
+        status, out, _ = self.run_cli('-o', output, '--chunk-size', '2', '-q', 'users', path)
+        self.assertEqual('', out)
+        self.assertEqual(2, self.mock.call_count)
+        with open(output) as f:
+            self.assertEqual(['nemcardf', 'nemcards', 'nemcardts'], [row['uniqname'] for row in csv.DictReader(f)])
+
+    def test_users_cache(self):
+        cache = os.path.join(self.tmp.name, 'cache.sqlite')
+        self.run_cli('--cache', cache, 'users', stdin='nemcardf\n')
+        self.run_cli('--cache', cache, 'users', stdin='nemcardf\n')
+        self.assertEqual(1, self.mock.call_count)  # The second run is answered from the snapshot
+
+    def test_group(self):
+        _, out, _ = self.run_cli('group', 'test-group', 'test-group-2')
+        self.assertEqual(['test-group', 'test-group-2'], [json.loads(line)['name'] for line in out.splitlines()])
+        _, out, _ = self.run_cli('--columns', 'uniqname', 'group', '--members', '--recursive', 'nested-parent')
+        self.assertIn('{"uniqname": "nemcards"}', out.splitlines())
+
+    def test_eligibility(self):
+        _, out, err = self.run_cli('-f', 'csv', 'eligibility', '-s', 'Box', '-s', 'Zoom',
+                                   stdin='nemcardf\nnemcarda\nfake\n')
+        rows = list(csv.DictReader(io.StringIO(out)))
+        self.assertEqual(['uniqname', 'exists', 'highest_affiliation', 'sponsorship_type', 'Box', 'Zoom'],
+                         list(rows[0]))
+        self.assertEqual(['nemcardf', 'nemcarda', 'fake'], [row['uniqname'] for row in rows])
+        self.assertEqual('False', rows[2]['Box'])
+        self.assertIn('mcommunity eligibility: 3 records', err)
+
+    def test_credentials_required(self):
+        with patch.dict('os.environ', {}, clear=True), contextlib.redirect_stderr(io.StringIO()), \
+                self.assertRaises(SystemExit):
+            main(['users'])
+        with patch.dict('os.environ', {'MCOMMUNITY_APP_CN': 'app', 'MCOMMUNITY_SECRET': 'secret'}):
+            args = build_parser().parse_args(['eligibility', '-s', 'Box'])
+        self.assertEqual(('app', 'secret', ['Box'], '-'), (args.app, args.secret, args.services, args.file))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main(verbosity=3)
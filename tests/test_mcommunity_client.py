@@ -0,0 +1,76 @@
+import logging
+import unittest
+from unittest.mock import patch
+
+import ldap
+
+from mcommunity import mcommunity_mocks as mocks
+from mcommunity.mcommunity_client import MCommunityClient
+from mcommunity.mcommunity_group import MCommunityGroup
+from mcommunity.mcommunity_user import MCommunityUser
+
+test_users = ['nemcardf', 'nemcardrs', 'nemcards', 'fake', 'nemcarda']
+
+
+class MCommunityClientTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.patcher = patch('mcommunity.mcommunity_base.MCommunityBase.search')
+        self.mock = self.patcher.start()
+        self.mock.side_effect = mocks.mcomm_side_effect
+        self.client = MCommunityClient(mocks.test_app, mocks.test_secret, max_workers=2)
+
+    def test_fetch_users_ordered(self):
+        results = list(self.client.fetch_users(test_users))
+        self.assertEqual(test_users, [r.name for r in results])
+        self.assertEqual(test_users, [r.value.name for r in results])
+        self.assertTrue(all(isinstance(r.value, MCommunityUser) for r in results))
+        self.assertEqual([True, True, True, False, True], [r.value.exists for r in results])
+
+    def test_fetch_users_as_completed(self):
+        results = list(self.client.fetch_users(test_users, max_workers=3, ordered=False))
+        self.assertCountEqual(test_users, [r.name for r in results])
+
+    def test_fetch_users_isolates_errors(self):
+        def side_effect(*args):
+            if args[1] == 'uid=nemcards':
+                raise ldap.NO_SUCH_OBJECT()
+            return mocks.mcomm_side_effect(*args)
+        self.mock.side_effect = side_effect
+        results = {r.name: r for r in self.client.fetch_users(test_users)}
+        self.assertIsInstance(results['nemcards'].error, ldap.NO_SUCH_OBJECT)
+        self.assertIsNone(results['nemcards'].value)
+        self.assertIsNone(results['nemcardf'].error)
+        self.assertTrue(results['nemcardf'].value.exists)
+
+    def test_fetch_groups(self):
+        results = list(self.client.fetch_groups(['test-group', 'fake', 'test-group-2']))
+        self.assertIsInstance(results[0].value, MCommunityGroup)
+        self.assertIsInstance(results[1].error, NameError)
+        self.assertEqual(2, len(results[2].value.members))
+
+    @patch('mcommunity.mcommunity_base.MCommunityBase.search_paged')
+    def test_iter_users(self, magic_mock):
+        magic_mock.return_value = iter(mocks.faculty_mock + mocks.student_mock)
+        users = list(self.client.iter_users('(umichInstRoles=*)'))
+        self.assertEqual(['nemcardf', 'nemcards'], [user.name for user in users])
+        self.assertEqual(mocks.student_mock, users[1].raw_result)
+
+    @patch('mcommunity.mcommunity_base.MCommunityBase.search_paged')
+    def test_iter_groups(self, magic_mock):
+        magic_mock.return_value = iter(mocks.group_mock_1 + mocks.group_mock_2)
+        groups = list(self.client.iter_groups('(cn=test-group*)'))
+        self.assertEqual(['test-group', 'test-group-2'], [group.name for group in groups])
+
+    def test_fetch_stops_early(self):
+        results = self.client.fetch_users(test_users * 10)
+        self.assertEqual('nemcardf', next(results).name)
+        results.close()
+
+    def tearDown(self) -> None:
+        self.patcher.stop()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main(verbosity=3)
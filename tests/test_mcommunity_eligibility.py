@@ -0,0 +1,57 @@
+import logging
+import unittest
+from unittest.mock import patch
+
+from mcommunity import mcommunity_mocks as mocks
+from mcommunity.mcommunity_eligibility import EligibilityEngine, EligibilityRow
+from mcommunity.mcommunity_user import MCommunityUser
+
+
+class EligibilityEngineTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.patcher = patch('mcommunity.mcommunity_base.MCommunityBase.search')
+        self.mock = self.patcher.start()
+        self.mock.side_effect = mocks.mcomm_side_effect
+        self.engine = EligibilityEngine(mocks.test_app, mocks.test_secret, ['enterprise', 'box'], chunk_size=2)
+
+    def test_run_rows(self):
+        rows = list(self.engine.run(['nemcardf', 'nemcardsa2', 'nemcardr', 'fake']))
+        self.assertEqual([
+            EligibilityRow('nemcardf', True, 'Faculty', 0, {'enterprise': True, 'box': True}),
+            EligibilityRow('nemcardsa2', True, 'SponsoredAffiliate', 2, {'enterprise': False, 'box': True}),
+            EligibilityRow('nemcardr', True, 'Retiree', 0, {'enterprise': False, 'box': True}),
+            EligibilityRow('fake', False, 'NA', 0, {'enterprise': False, 'box': False}),
+        ], rows)
+
+    def test_run_batches_and_projects(self):
+        list(self.engine.run(['nemcardf', 'nemcards', 'nemcarda', 'nemcardrs', 'nemcardts']))
+        self.assertEqual(3, self.mock.call_count)  # 5 uniqnames in chunks of 2
+        for call in self.mock.call_args_list:
+            self.assertTrue(call[0][1].startswith('(|'))
+            self.assertEqual(MCommunityUser.fetch_profiles['eligibility'], call[0][2])
+
+    def test_run_duplicates(self):
+        rows = list(self.engine.run(['nemcardf', 'nemcardf']))
+        self.assertEqual(['nemcardf', 'nemcardf'], [row.uniqname for row in rows])
+
+    def test_run_is_lazy(self):
+        rows = self.engine.run(iter(['nemcardf', 'nemcards', 'nemcarda', 'nemcardrs', 'nemcardts', 'nemcardr']))
+        self.assertEqual('nemcardf', next(rows).uniqname)
+        self.assertLessEqual(self.mock.call_count, 2)  # Only max_workers chunks are fetched ahead
+        rows.close()
+
+    def test_stats(self):
+        list(self.engine.run(['nemcardf', 'nemcards', 'nemcarda']))
+        stats = self.engine.stats()
+        self.assertEqual(3, stats['users'])
+        self.assertGreater(stats['seconds'], 0)
+        self.assertAlmostEqual(3 / stats['seconds'], stats['users_per_second'])
+
+    def tearDown(self) -> None:
+        self.patcher.stop()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main(verbosity=3)
@@ -0,0 +1,112 @@
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from mcommunity import mcommunity_mocks as mocks
+from mcommunity.mcommunity_export import MCommunityExporter
+from mcommunity.mcommunity_pool import MCommunityConnectionPool
+from mcommunity.mcommunity_session import MCommunitySession
+
+
+class ExportTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.patcher = patch('mcommunity.mcommunity_base.MCommunityBase.search')
+        self.mock = self.patcher.start()
+        self.mock.side_effect = mocks.mcomm_side_effect
+        self.session = MCommunitySession(mocks.test_app, mocks.test_secret)
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.patcher.stop()
+        self.tmp.cleanup()
+        MCommunityConnectionPool.close_all()
+
+    def test_users_jsonl(self):
+        out = io.StringIO()
+        with MCommunityExporter(out, session=self.session) as exporter:
+            written = exporter.export_users(iter(['nemcardf', 'nemcards\n', '', 'fake']))
+        self.assertEqual(3, written)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(['nemcardf', 'nemcards', 'fake'], [row['uniqname'] for row in rows])
+        self.assertEqual('Natalie Emcard', rows[0]['display_name'])
+        self.assertEqual('Faculty', rows[0]['highest_affiliation'])
+        self.assertFalse(rows[2]['exists'])
+
+    def test_users_batched(self):
+        exporter = MCommunityExporter(io.StringIO(), chunk_size=2, session=self.session)
+        exporter.export_users(['nemcardf', 'nemcardrs', 'nemcards', 'nemcardts', 'nemcarda'])
+        self.assertEqual(3, self.mock.call_count)  # Five users in chunks of two
+        self.assertEqual(5, exporter.records)
+        self.assertFalse(self.mock.call_args[1]['use_cache'])
+
+    def test_columns(self):
+        out = io.StringIO()
+        MCommunityExporter(out, columns=['uniqname', 'mail'], session=self.session).export_users(['nemcardf', 'fake'])
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([{'uniqname': 'nemcardf', 'mail': 'nemcardf@umich.edu'}, {'uniqname': 'fake', 'mail': []}],
+                         rows)
+        self.assertIn('mail', self.mock.call_args[0][2])
+
+    def test_csv(self):
+        out = io.StringIO()
+        exporter = MCommunityExporter(out, format='csv', columns=['uniqname', 'affiliations'], session=self.session)
+        exporter.export_users(['nemcardf'])
+        exporter.export_users(['nemcarda'])
+        rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+        self.assertEqual(['nemcardf', 'nemcarda'], [row['uniqname'] for row in rows])  # One header for both calls
+        self.assertIn(';', rows[0]['affiliations'])
+
+    def test_groups(self):
+        out = io.StringIO()
+        written = MCommunityExporter(out, session=self.session).export_groups(['test-group', 'fake', 'nested-parent'])
+        self.assertEqual(2, written)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual({'name': 'test-group', 'members': ['nemcardf', 'nemcardrs', 'nemcarda'], 'member_groups': []},
+                         rows[0])
+        self.assertEqual(['nested-child', 'nested-shared'], rows[1]['member_groups'])
+        with self.assertRaises(ValueError):
+            MCommunityExporter(out, columns=['name', 'mail'], session=self.session).export_groups(['test-group'])
+
+    def test_group_members(self):
+        out = io.StringIO()
+        written = MCommunityExporter(out, columns=['uniqname'], session=self.session).export_group_members('test-group')
+        self.assertEqual(3, written)
+        self.assertEqual('{"uniqname": "nemcarda"}', out.getvalue().splitlines()[-1])
+
+    def test_search(self):
+        with patch('mcommunity.mcommunity_base.MCommunityBase.search_paged') as search_paged:
+            search_paged.return_value = iter(mocks.faculty_mock + mocks.alumni_mock)
+            out = io.StringIO()
+            written = MCommunityExporter(out, columns=['uniqname', 'entityid'], session=self.session).export_search(
+                '(umichInstRoles=AlumniAA)', page_size=500
+            )
+        self.assertEqual(2, written)
+        self.assertEqual('nemcarda', json.loads(out.getvalue().splitlines()[1])['uniqname'])
+        self.assertEqual(500, search_paged.call_args[0][3])
+
+    def test_gzip(self):
+        path = os.path.join(self.tmp.name, 'users.csv.gz')
+        with MCommunityExporter(path, session=self.session) as exporter:
+            self.assertEqual('csv', exporter.format)
+            exporter.export_users(['nemcardf', 'nemcards'])
+        with gzip.open(path, 'rt', encoding='UTF-8') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(['nemcardf', 'nemcards'], [row['uniqname'] for row in rows])
+
+    def test_bad_options(self):
+        with self.assertRaises(ValueError):
+            MCommunityExporter(io.StringIO(), format='xml', session=self.session)
+        with self.assertRaises(ValueError):
+            MCommunityExporter(io.StringIO(), compress=True, session=self.session)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main(verbosity=3)
@@ -42,6 +42,99 @@ class MCommunityGroupTestCase(unittest.TestCase):
         ]
         self.assertEqual(len(members), len(self.group.members_mcomm_users))  # Should be 4 members
 
+    @patch('mcommunity.mcommunity_base.MCommunityBase.search')
+    def test_populate_members_mcomm_users_batched_matches_per_user(self, magic_mock):
+        magic_mock.side_effect = mocks.mcomm_side_effect
+        group = MCommunityGroup(test_group, mocks.test_app, mocks.test_secret)
+        magic_mock.reset_mock()
+        group.populate_members_mcomm_users(chunk_size=2)
+        self.assertEqual(2, magic_mock.call_count)  # 3 members in chunks of 2
+        for user in group.members_mcomm_users:
+            self.assertEqual(MCommunityUser(user.name, mocks.test_app, mocks.test_secret).to_dict(), user.to_dict())
+
+    def test_parse_members_deduplicates_in_order(self):
+        self.assertEqual((['b', 'a', 'c'], []), MCommunityGroup._parse_members([
+            b'uid=b,ou=People,dc=umich,dc=edu', b'uid=a,ou=People,dc=umich,dc=edu',
+            b'uid=b,ou=People,dc=umich,dc=edu', 'uid=c,ou=People,dc=umich,dc=edu'
+        ]))
+
+    def test_parse_members_separates_nested_groups(self):
+        self.assertEqual((['a'], ['nested-group']), MCommunityGroup._parse_members([
+            b'cn=nested-group,ou=User Groups,ou=Groups,dc=umich,dc=edu', b'uid=a,ou=People,dc=umich,dc=edu'
+        ]))
+
+    def test_member_uid(self):
+        self.assertEqual('nemcardf', MCommunityGroup._member_uid(b'UID=nemcardf,ou=People,dc=umich,dc=edu'))
+        self.assertEqual('nemcardf', MCommunityGroup._member_uid(b'uid=nemcardf'))
+        self.assertIsNone(MCommunityGroup._member_uid(b'cn=test-group,ou=User Groups,ou=Groups,dc=umich,dc=edu'))
+
+    def test_parse_members_large_group(self):
+        values = [f'uid=user{i % 20000},ou=People,dc=umich,dc=edu'.encode() for i in range(40000)]
+        members, _ = MCommunityGroup._parse_members(values)
+        self.assertEqual(20000, len(members))
+        self.assertEqual('user19999', members[-1])
+
+    @patch('mcommunity.mcommunity_base.MCommunityBase.search')
+    def test_init_fetches_member_ranges(self, magic_mock):
+        dn = 'cn=big-group,ou=User Groups,ou=Groups,dc=umich,dc=edu'
+        magic_mock.side_effect = [
+            [(dn, {'cn': [b'big-group'], 'member;range=0-1': [b'uid=a,ou=People', b'uid=b,ou=People']})],
+            [(dn, {'member;range=2-3': [b'uid=c,ou=People', b'uid=a,ou=People']})],
+            [(dn, {'member;range=4-*': [b'uid=d,ou=People']})],
+        ]
+        group = MCommunityGroup('big-group', mocks.test_app, mocks.test_secret)
+        self.assertEqual(['a', 'b', 'c', 'd'], group.members)
+        self.assertEqual(['member;range=2-*'], magic_mock.call_args_list[1][0][2])
+        self.assertEqual(['member;range=4-*'], magic_mock.call_args_list[2][0][2])
+
+    @patch('mcommunity.mcommunity_base.MCommunityBase.search')
+    def test_expand_not_recursive(self, magic_mock):
+        magic_mock.side_effect = mocks.mcomm_side_effect
+        group = MCommunityGroup('nested-parent', mocks.test_app, mocks.test_secret)
+        self.assertEqual(['nested-child', 'nested-shared'], group.member_groups)
+        self.assertEqual({'nemcardf': ('nested-parent',)}, group.expand(recursive=False))
+
+    @patch('mcommunity.mcommunity_base.MCommunityBase.search')
+    def test_expand_recursive(self, magic_mock):
+        magic_mock.side_effect = mocks.mcomm_side_effect
+        group = MCommunityGroup('nested-parent', mocks.test_app, mocks.test_secret)
+        magic_mock.reset_mock()
+        self.assertEqual({
+            'nemcardf': ('nested-parent',),
+            'nemcards': ('nested-parent', 'nested-child'),
+            'nemcarda': ('nested-parent', 'nested-shared'),
+        }, group.expand())
+        # Both subgroups come from one batched search; the cycle and the shared subgroup are not fetched again
+        self.assertEqual(1, magic_mock.call_count)
+
+    @patch('mcommunity.mcommunity_base.MCommunityBase.search')
+    def test_expand_shares_memo(self, magic_mock):
+        magic_mock.side_effect = mocks.mcomm_side_effect
+        memo = {}
+        MCommunityGroup('nested-parent', mocks.test_app, mocks.test_secret).expand(memo=memo)
+        group = MCommunityGroup('nested-child', mocks.test_app, mocks.test_secret)
+        magic_mock.reset_mock()
+        self.assertCountEqual(['nemcards', 'nemcardf', 'nemcarda'], group.expand(memo=memo))
+        magic_mock.assert_not_called()
+
+    @patch('mcommunity.mcommunity_base.MCommunityBase.search')
+    def test_init_minimal_profile_fetches_members(self, magic_mock):
+        magic_mock.side_effect = lambda base, query, attributes, **kwargs: [(
+            mocks.group_mock_1[0][0], {k: v for k, v in mocks.group_mock_1[0][1].items() if k in attributes}
+        )]
+        group = MCommunityGroup(test_group, mocks.test_app, mocks.test_secret, profile='minimal')
+        self.assertEqual(['cn'], magic_mock.call_args_list[0][0][2])
+        self.assertEqual(['member'], magic_mock.call_args_list[1][0][2])
+        self.assertCountEqual(['nemcardf', 'nemcardrs', 'nemcarda'], group.members)
+
+    @patch('mcommunity.mcommunity_base.MCommunityBase.search')
+    def test_populate_members_mcomm_users_profile(self, magic_mock):
+        magic_mock.side_effect = mocks.mcomm_side_effect
+        group = MCommunityGroup(test_group, mocks.test_app, mocks.test_secret, profile='members')
+        group.populate_members_mcomm_users(profile='eligibility')
+        self.assertEqual(MCommunityUser.fetch_profiles['eligibility'], magic_mock.call_args[0][2])
+        self.assertEqual('00000000', group.members_mcomm_users[0].entityid)
+
     def test_group_exists(self):
         self.assertEqual(True, self.group.exists)
 
@@ -0,0 +1,91 @@
+import logging
+import unittest
+from unittest.mock import patch
+
+from mcommunity import mcommunity_mocks as mocks
+from mcommunity.mcommunity_groupset import GroupSet, MemberSet
+from mcommunity.mcommunity_pool import MCommunityConnectionPool
+from mcommunity.mcommunity_session import MCommunitySession
+
+
+class GroupSetTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.patcher = patch('mcommunity.mcommunity_base.MCommunityBase.search')
+        self.mock = self.patcher.start()
+        self.mock.side_effect = mocks.mcomm_side_effect
+        self.session = MCommunitySession(mocks.test_app, mocks.test_secret)
+        self.groups = GroupSet(['test-group', 'test-group-2', 'something-iam-primary'], session=self.session)
+
+    def test_load_batched(self):
+        self.assertEqual(1, self.mock.call_count)  # All three groups in one OR filter
+        self.assertEqual(['test-group', 'test-group-2', 'something-iam-primary'], self.groups.cns)
+        self.assertEqual(['nemcardf', 'nemcardrs', 'nemcarda'], self.groups.members('test-group').to_list())
+
+    def test_union(self):
+        self.assertEqual(['nemcardf', 'nemcardrs', 'nemcarda', 'nemcardts'],
+                         list(self.groups.union('test-group', 'something-iam-primary')))
+
+    def test_intersection(self):
+        self.assertEqual(['nemcarda'], list(self.groups.intersection('test-group', 'something-iam-primary')))
+        self.assertEqual(0, len(self.groups.intersection('test-group-2', 'something-iam-primary')))
+
+    def test_difference(self):
+        self.assertEqual(['nemcarda'], list(self.groups.difference('test-group', 'test-group-2')))
+        self.assertEqual([], list(self.groups.difference('test-group', 'test-group-2', 'something-iam-primary')))
+
+    def test_member_set_operators(self):
+        a, b = self.groups.members('test-group'), self.groups.members('something-iam-primary')
+        self.assertEqual(self.groups.union('test-group', 'something-iam-primary'), a | b)
+        self.assertEqual(['nemcardf', 'nemcardrs'], list(a - b))
+        self.assertEqual(['nemcardf', 'nemcardrs', 'nemcardts'], list(a ^ b))
+        self.assertIn('nemcarda', a & b)
+        self.assertNotIn('nemcardf', a & b)
+        self.assertNotIn('nobody', a)
+        with self.assertRaises(ValueError):
+            a | GroupSet(session=self.session).union()
+
+    def test_counts(self):
+        self.assertEqual({'nemcardf': 2, 'nemcardrs': 2, 'nemcarda': 2, 'nemcardts': 1}, self.groups.counts())
+        self.assertEqual({'nemcardf': 1, 'nemcardrs': 1, 'nemcarda': 1}, self.groups.counts(['test-group']))
+
+    def test_groups_for(self):
+        self.assertEqual(['test-group', 'something-iam-primary'], self.groups.groups_for('nemcarda'))
+        self.assertEqual([], self.groups.groups_for('nobody'))
+
+    def test_missing_group(self):
+        with self.assertRaises(NameError):
+            self.groups.load(['fake', 'nested-child'])
+        self.assertIn('nested-child', self.groups)  # The groups that exist are still added
+        with self.assertRaises(KeyError):
+            self.groups.members('fake')
+
+    def test_recursive(self):
+        groups = GroupSet(['nested-parent'], recursive=True, session=self.session)
+        self.assertCountEqual(['nemcardf', 'nemcards', 'nemcarda'], groups.members('nested-parent'))
+
+    def test_add_and_remove(self):
+        self.groups.add('custom', ['nemcardts', 'new-person'])
+        self.assertEqual(['nemcardts', 'new-person'], list(self.groups.members('custom')))
+        self.groups.remove('custom')
+        self.assertNotIn('custom', self.groups)
+
+    def test_large_groups(self):
+        groups = GroupSet(session=self.session)
+        groups.add('everyone', (f'user{i}' for i in range(300000)))
+        groups.add('evens', (f'user{i}' for i in range(0, 300000, 2)))
+        groups.add('thirds', (f'user{i}' for i in range(0, 300000, 3)))
+        self.assertEqual(150000, len(groups.difference('everyone', 'evens')))
+        self.assertEqual(50000, len(groups.intersection('evens', 'thirds')))
+        self.assertEqual(200000, len(groups.union('evens', 'thirds')))
+        self.assertEqual(3, groups.counts()['user6'])
+        self.assertIsInstance(groups.union('evens'), MemberSet)
+
+    def tearDown(self) -> None:
+        self.patcher.stop()
+        MCommunityConnectionPool.close_all()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main(verbosity=3)
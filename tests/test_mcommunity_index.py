@@ -0,0 +1,61 @@
+import logging
+import unittest
+from unittest.mock import patch
+
+from mcommunity import mcommunity_mocks as mocks
+from mcommunity.mcommunity_group import MCommunityGroup
+from mcommunity.mcommunity_index import MembershipIndex
+
+
+class MembershipIndexTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.patcher = patch('mcommunity.mcommunity_base.MCommunityBase.search')
+        self.mock = self.patcher.start()
+        self.mock.side_effect = mocks.mcomm_side_effect
+        self.groups = [
+            MCommunityGroup(cn, mocks.test_app, mocks.test_secret)
+            for cn in ['test-group', 'test-group-2', 'something-iam-primary']
+        ]
+        self.index = MembershipIndex(self.groups)
+
+    def test_groups_for(self):
+        self.assertEqual({'test-group', 'test-group-2'}, self.index.groups_for('nemcardrs'))
+        self.assertEqual(set(), self.index.groups_for('fake'))
+
+    def test_is_member(self):
+        self.assertTrue(self.index.is_member('nemcardts', 'something-iam-primary'))
+        self.assertFalse(self.index.is_member('nemcardts', 'test-group'))
+
+    def test_is_member_of_any(self):
+        self.assertTrue(self.index.is_member_of_any('nemcarda', ['test-group-2', 'something-iam-primary']))
+        self.assertFalse(self.index.is_member_of_any('nemcardts', ['test-group', 'test-group-2']))
+        self.assertFalse(self.index.is_member_of_any('fake', ['test-group']))
+
+    def test_contains_and_len(self):
+        self.assertIn('nemcardf', self.index)
+        self.assertNotIn('fake', self.index)
+        self.assertEqual(4, len(self.index))
+
+    def test_remove(self):
+        self.index.remove('something-iam-primary')
+        self.assertNotIn('nemcardts', self.index)
+        self.assertEqual({'test-group'}, self.index.groups_for('nemcarda'))
+
+    def test_add_replaces_group(self):
+        self.index.add(self.groups[0])
+        self.assertEqual({'test-group', 'test-group-2'}, self.index.groups_for('nemcardf'))
+
+    def test_recursive(self):
+        index = MembershipIndex([MCommunityGroup('nested-parent', mocks.test_app, mocks.test_secret)], recursive=True)
+        self.assertTrue(index.is_member('nemcards', 'nested-parent'))
+        self.assertFalse(MembershipIndex([MCommunityGroup('nested-parent', mocks.test_app, mocks.test_secret)])
+                         .is_member('nemcards', 'nested-parent'))
+
+    def tearDown(self) -> None:
+        self.patcher.stop()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main(verbosity=3)
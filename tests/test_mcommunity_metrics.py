@@ -0,0 +1,143 @@
+import logging
+import math
+import unittest
+from unittest.mock import patch
+
+import ldap
+
+from mcommunity import mcommunity_mocks as mocks
+from mcommunity.mcommunity_base import MCommunityBase
+from mcommunity.mcommunity_cache import MCommunityCache
+from mcommunity.mcommunity_metrics import MCommunityMetrics
+from mcommunity.mcommunity_pool import MCommunityConnectionPool
+from mcommunity.mcommunity_retry import RetryPolicy, SearchTimeout
+from mcommunity.mcommunity_session import MCommunitySession
+
+
+class MCommunityMetricsTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.metrics = MCommunityMetrics()
+
+    def test_percentiles(self):
+        for ms in range(1, 101):
+            self.metrics.record('People/lookup', ms / 1000)
+        self.assertEqual({'p50': 0.05, 'p95': 0.095, 'p99': 0.099}, self.metrics.percentiles('People/lookup'))
+        self.assertEqual({'p90': 0.09}, self.metrics.percentiles('People/lookup', [90]))
+        self.assertEqual({}, self.metrics.percentiles('People/batch'))
+
+    def test_errors_not_in_percentiles(self):
+        self.metrics.record('People/lookup', 0.01)
+        self.metrics.record('People/lookup', 30.0, SearchTimeout())
+        self.metrics.record('People/lookup', 0.0, ldap.SERVER_DOWN())
+        self.metrics.record('People/lookup', 0.5, ldap.TIMELIMIT_EXCEEDED())
+        self.assertEqual({'People/lookup': {'count': 4, 'errors': 3, 'timeouts': 2, 'coalesced': 0, 'p50': 0.01,
+                                            'p95': 0.01, 'p99': 0.01}}, self.metrics.stats())
+
+    def test_window(self):
+        metrics = MCommunityMetrics(window=10)
+        for ms in range(100):
+            metrics.record('People/lookup', ms / 1000)
+        self.assertEqual(0.09, metrics.percentiles('People/lookup', [1])['p1'])  # Only the latest 10 are kept
+        self.assertEqual(100, metrics.stats()['People/lookup']['count'])
+        metrics.reset()
+        self.assertEqual({}, metrics.stats())
+
+    def test_query_type(self):
+        self.assertEqual('People/lookup', MCommunityBase._query_type('ou=People,dc=umich,dc=edu', 'uid=nemcardf'))
+        self.assertEqual('People/batch', MCommunityBase._query_type('ou=People,dc=umich,dc=edu', '(|(uid=a)(uid=b))'))
+        self.assertEqual('User Groups/filter', MCommunityBase._query_type(
+            'ou=User Groups,ou=Groups,dc=umich,dc=edu', '(member=uid=nemcardf,ou=People,dc=umich,dc=edu)'
+        ))
+        self.assertEqual('People/paged', MCommunityBase._query_type(
+            'ou=People,dc=umich,dc=edu', '(umichInstRoles=Faculty*)', paged=True
+        ))
+
+    @patch('mcommunity.mcommunity_base.MCommunityBase.connect')
+    def test_search_records_latency(self, connect):
+        connect.return_value.search_st.return_value = mocks.faculty_mock
+        session = MCommunitySession(mocks.test_app, mocks.test_secret)
+        MCommunityBase(session=session).search('ou=People,dc=umich,dc=edu', 'uid=nemcardf', ['*'])
+        latency = session.stats()['latency']
+        self.assertEqual(['People/lookup'], list(latency))
+        self.assertEqual(1, latency['People/lookup']['count'])
+        self.assertIn('p99', latency['People/lookup'])
+
+    def test_histograms(self):
+        for seconds in (0.003, 0.02, 0.02, 20.0):
+            self.metrics.record('People/lookup', seconds)
+        histogram = self.metrics.histograms()['People/lookup']
+        self.assertEqual(4, histogram['count'])
+        self.assertAlmostEqual(20.043, histogram['sum'])
+        buckets = dict(histogram['buckets'])
+        self.assertEqual((1, 1, 3, 3, 4),
+                         (buckets[0.005], buckets[0.01], buckets[0.025], buckets[10.0], buckets[math.inf]))
+
+    def tearDown(self) -> None:
+        MCommunityConnectionPool.close_all()
+
+
+class InstrumentationTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = mocks.FakeLDAPServer('ldaps://ldap1.fake')
+        self.patcher = patch('mcommunity.mcommunity_base.ldap.initialize', mocks.fake_initialize([self.server]))
+        self.patcher.start()
+        self.events = []
+        self.metrics = MCommunityMetrics(
+            before_search=[lambda event: event.context.setdefault('started', True)],
+            after_search=[self.events.append]
+        )
+        self.session = MCommunitySession(mocks.test_app, mocks.test_secret, server_uri=self.server.uri,
+                                         cache=MCommunityCache(), metrics=self.metrics)
+        self.base = MCommunityBase(session=self.session)
+
+    def tearDown(self) -> None:
+        self.patcher.stop()
+        MCommunityConnectionPool.close_all()
+
+    def test_counters(self):
+        self.base.search('ou=People,dc=umich,dc=edu', 'uid=nemcardf', ['*'])
+        self.base.search('ou=People,dc=umich,dc=edu', 'uid=nemcardf', ['*'])
+        self.base.search_many('ou=People,dc=umich,dc=edu', 'uid', ['nemcardf', 'nemcards', 'fake'], ['*'])
+        self.base.search('ou=User Groups,ou=Groups,dc=umich,dc=edu', 'cn=test-group', ['*'])
+        counters = self.session.stats()['counters']
+        self.assertEqual((1, 1, 0), (counters['connects'], counters['binds'], counters['bind_errors']))
+        self.assertEqual((3, 3), (counters['searches'], counters['results']))  # nemcardf, nemcards, test-group
+        self.assertEqual({'ou=People,dc=umich,dc=edu': 2, 'ou=User Groups,ou=Groups,dc=umich,dc=edu': 1},
+                         counters['searches_by_base'])
+        self.assertEqual(1, counters['results_by_base']['ou=User Groups,ou=Groups,dc=umich,dc=edu'])
+        self.assertEqual((2, 0, 4), (counters['cache_hits'], counters['snapshot_hits'], counters['cache_misses']))
+        self.assertEqual(counters['searches'], sum(h['count'] for h in self.metrics.histograms().values()))
+
+    def test_hooks(self):
+        self.base.search('ou=People,dc=umich,dc=edu', 'uid=nemcardf', ['*'])
+        self.base.search('ou=People,dc=umich,dc=edu', 'uid=fake', ['*'])
+        self.assertEqual(['uid=nemcardf', 'uid=fake'], [event.query_object for event in self.events])
+        self.assertEqual([1, 0], [event.results for event in self.events])
+        self.assertEqual('People/lookup', self.events[0].query_type)
+        self.assertTrue(self.events[0].context['started'])  # The same event is passed to both hooks
+        self.assertGreaterEqual(self.events[0].seconds, 0)
+
+    def test_hook_errors_ignored(self):
+        def broken(event):
+            raise RuntimeError('exporter down')
+        self.metrics.before_search.append(broken)
+        with self.assertLogs('mcommunity.mcommunity_metrics', logging.ERROR):
+            self.assertEqual(mocks.faculty_mock, self.base.search('ou=People,dc=umich,dc=edu', 'uid=nemcardf', ['*']))
+        self.assertEqual(1, len(self.events))
+
+    def test_retries(self):
+        self.server.down = True
+        self.session.retry_policy = RetryPolicy(max_attempts=3, base_delay=0.01, jitter=0.0)
+        with self.assertRaises(ldap.UNAVAILABLE):
+            self.base.search('ou=People,dc=umich,dc=edu', 'uid=nemcardf', ['*'])
+        counters = self.metrics.counters()
+        self.assertEqual((2, 3, 0), (counters['retries'], counters['bind_errors'], counters['binds']))
+        self.assertAlmostEqual(0.03, counters['sleep_seconds'])
+        self.assertEqual(0, counters['searches'])  # It never got as far as searching
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main(verbosity=3)
@@ -0,0 +1,126 @@
+import logging
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+import ldap
+
+from mcommunity import mcommunity_mocks as mocks
+from mcommunity.mcommunity_base import MCommunityBase
+from mcommunity.mcommunity_pool import MCommunityConnectionPool
+
+
+class MCommunityConnectionPoolTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.pool = MCommunityConnectionPool(max_size=2, acquire_timeout=0.1)
+        self.connect = MagicMock(side_effect=lambda: MagicMock())
+
+    def test_acquire_opens_new_connection(self):
+        self.pool.acquire(self.connect)
+        self.assertEqual(1, self.connect.call_count)
+        self.assertEqual(1, self.pool.size)
+
+    def test_release_reuses_connection(self):
+        connection = self.pool.acquire(self.connect)
+        self.pool.release(connection)
+        self.assertIs(connection, self.pool.acquire(self.connect))
+        self.assertEqual(1, self.connect.call_count)
+
+    def test_acquire_times_out_when_full(self):
+        self.pool.acquire(self.connect)
+        self.pool.acquire(self.connect)
+        with self.assertRaises(ldap.UNAVAILABLE):
+            self.pool.acquire(self.connect)
+
+    def test_acquire_waits_for_release(self):
+        self.pool.acquire_timeout = 5
+        first = self.pool.acquire(self.connect)
+        self.pool.acquire(self.connect)
+        threading.Timer(0.05, self.pool.release, args=(first,)).start()
+        self.assertIs(first, self.pool.acquire(self.connect))
+
+    def test_failed_connect_frees_slot(self):
+        self.connect.side_effect = ldap.INVALID_CREDENTIALS()
+        with self.assertRaises(ldap.INVALID_CREDENTIALS):
+            self.pool.acquire(self.connect)
+        self.assertEqual(0, self.pool.size)
+
+    def test_discard_unbinds_and_frees_slot(self):
+        connection = self.pool.acquire(self.connect)
+        self.pool.discard(connection)
+        connection.unbind_s.assert_called_once()
+        self.assertEqual(0, self.pool.size)
+
+    def test_unhealthy_idle_connection_replaced(self):
+        self.pool.health_check_interval = 0
+        connection = self.pool.acquire(self.connect)
+        connection.whoami_s.side_effect = ldap.SERVER_DOWN()
+        self.pool.release(connection)
+        self.assertIsNot(connection, self.pool.acquire(self.connect))
+        connection.unbind_s.assert_called_once()
+
+    def test_run_rebinds_on_server_down(self):
+        stale = self.pool.acquire(self.connect)
+        stale.search_st.side_effect = ldap.SERVER_DOWN()
+        self.pool.release(stale)
+        result = self.pool.run(self.connect, lambda c: c.search_st())
+        self.assertIsNotNone(result)
+        self.assertEqual(2, self.connect.call_count)
+        self.assertEqual(1, self.pool.size)
+
+    def test_run_new_connection_server_down_raises(self):
+        self.connect.side_effect = lambda: MagicMock(**{'search_st.side_effect': ldap.SERVER_DOWN()})
+        with self.assertRaises(ldap.SERVER_DOWN):
+            self.pool.run(self.connect, lambda c: c.search_st())
+        self.assertEqual(0, self.pool.size)
+
+    def test_connection_context_manager_releases(self):
+        with self.pool.connection(self.connect) as connection:
+            pass
+        self.assertIs(connection, self.pool.acquire(self.connect))
+
+    def test_for_credentials_shared(self):
+        pool = MCommunityConnectionPool.for_credentials(mocks.test_app, 'ldaps://ldap.umich.edu', mocks.test_secret)
+        self.assertIs(pool, MCommunityConnectionPool.for_credentials(
+            mocks.test_app, 'ldaps://ldap.umich.edu', mocks.test_secret
+        ))
+        self.assertIsNot(pool, MCommunityConnectionPool.for_credentials(
+            'other-app', 'ldaps://ldap.umich.edu', mocks.test_secret
+        ))
+        base_pool = MCommunityBase(mocks.test_app, mocks.test_secret).connection_pool()
+        self.assertIs(base_pool, MCommunityBase(mocks.test_app, mocks.test_secret).connection_pool())  # Same session
+        self.assertIsNot(pool, base_pool)
+
+    def test_for_credentials_keyed_by_secret(self):
+        pool = MCommunityConnectionPool.for_credentials(mocks.test_app, 'ldaps://ldap.umich.edu', mocks.test_secret)
+        self.assertIsNot(pool, MCommunityConnectionPool.for_credentials(
+            mocks.test_app, 'ldaps://ldap.umich.edu', 'wrong-secret'
+        ))
+        self.assertIsNot(MCommunityBase(mocks.test_app, mocks.test_secret).connection_pool(),
+                         MCommunityBase(mocks.test_app, 'wrong-secret').connection_pool())
+        self.assertNotIn(mocks.test_secret, str(list(MCommunityConnectionPool._pools)))
+
+    @patch('mcommunity.mcommunity_base.MCommunityBase.connect')
+    def test_wrong_secret_does_not_reuse_connection(self, connect):
+        connect.return_value.search_st.return_value = mocks.faculty_mock
+        MCommunityBase(mocks.test_app, mocks.test_secret).search('ou=People,dc=umich,dc=edu', 'uid=nemcardf', ['*'])
+        connect.side_effect = ldap.INVALID_CREDENTIALS({'desc': 'Invalid credentials'})
+        with self.assertRaises(ldap.INVALID_CREDENTIALS):
+            MCommunityBase(mocks.test_app, 'wrong-secret').search('ou=People,dc=umich,dc=edu', 'uid=nemcards', ['*'])
+
+    @patch('mcommunity.mcommunity_base.MCommunityBase.connect')
+    def test_search_reuses_bound_connection(self, magic_mock):
+        magic_mock.return_value.search_st.return_value = mocks.faculty_mock
+        base = MCommunityBase(mocks.test_app, mocks.test_secret)
+        base.search('ou=People,dc=umich,dc=edu', 'uid=nemcardf', ['*'])
+        base.search('ou=People,dc=umich,dc=edu', 'uid=nemcardf', ['*'])
+        self.assertEqual(1, magic_mock.call_count)
+
+    def tearDown(self) -> None:
+        MCommunityConnectionPool.close_all()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main(verbosity=3)
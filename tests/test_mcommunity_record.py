@@ -0,0 +1,90 @@
+import logging
+import unittest
+from unittest.mock import patch
+
+from mcommunity import mcommunity_mocks as mocks
+from mcommunity.mcommunity_group import MCommunityGroup
+from mcommunity.mcommunity_record import GroupRecord, UserRecord
+from mcommunity.mcommunity_user import MCommunityUser
+
+
+class UserRecordTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.record = UserRecord('nemcardf', mocks.faculty_mock)
+
+    def test_slots(self):
+        self.assertFalse(hasattr(self.record, '__dict__'))
+
+    def test_exists(self):
+        self.assertTrue(self.record.exists)
+        self.assertFalse(UserRecord('fake', []).exists)
+
+    def test_get(self):
+        self.assertEqual('00000000', self.record.entityid)
+        self.assertEqual('Natalie Emcard', self.record.display_name)
+        self.assertEqual('00000000', self.record.get('ENTITYID'))
+        with self.assertRaises(KeyError):
+            self.record.get('mail')  # Not kept
+
+    def test_get_decodes_once(self):
+        roles = self.record.affiliations
+        self.assertEqual(7, len(roles))
+        self.assertIs(self.record.affiliations[0], roles[0])
+
+    def test_not_exists(self):
+        record = UserRecord('fake', [])
+        self.assertEqual('', record.entityid)
+        self.assertEqual([], record.affiliations)
+        self.assertEqual('NA', record.highest_affiliation)
+        self.assertFalse(record.check_service_entitlement('enterprise'))
+
+    def test_highest_affiliation(self):
+        self.assertEqual('Faculty', self.record.highest_affiliation)
+        self.assertEqual('Retiree', UserRecord('nemcardr', mocks.retiree_mock).highest_affiliation)
+
+    def test_check_service_entitlements(self):
+        self.assertEqual({'enterprise': True, 'adobecc': False, 'fake': False},
+                         self.record.check_service_entitlements(['enterprise', 'adobecc', 'fake']))
+        self.assertFalse(UserRecord('nemcardr', mocks.retiree_mock).check_service_entitlement('enterprise'))
+
+    def test_check_sponsorship_type(self):
+        self.assertEqual(0, self.record.check_sponsorship_type())
+        self.assertEqual(2, UserRecord('nemcardsa2', mocks.t2sponsored_mock).check_sponsorship_type())
+        self.assertEqual(3, UserRecord('um999999', mocks.t3sponsored_mock).check_sponsorship_type())
+
+    @patch('mcommunity.mcommunity_base.MCommunityBase.search')
+    def test_from_user(self, mock):
+        mock.side_effect = mocks.mcomm_side_effect
+        user = MCommunityUser('nemcardf', mocks.test_app, mocks.test_secret)
+        user.populate_highest_affiliation()
+        user.populate_service_entitlements()
+        record = UserRecord.from_user(user)
+        self.assertEqual(user.highest_affiliation, record.highest_affiliation)
+        self.assertEqual(user.service_entitlements, record.service_entitlements)
+        self.assertEqual(user.affiliations, record.affiliations)
+
+    def test_to_dict(self):
+        d = self.record.to_dict()
+        self.assertEqual('nemcardf', d['name'])
+        self.assertEqual('Faculty', d['highest_affiliation'])
+        self.assertEqual(mocks.eligible_use_str, d['service_entitlements'])
+
+
+class GroupRecordTestCase(unittest.TestCase):
+
+    @patch('mcommunity.mcommunity_base.MCommunityBase.search')
+    def test_from_group(self, mock):
+        mock.side_effect = mocks.mcomm_side_effect
+        record = GroupRecord.from_group(MCommunityGroup('nested-parent', mocks.test_app, mocks.test_secret))
+        self.assertFalse(hasattr(record, '__dict__'))
+        self.assertEqual('nested-parent', record.name)
+        self.assertIn('nemcardf', record)
+        self.assertEqual(('nested-child', 'nested-shared'), record.member_groups)
+        self.assertEqual(len(record.members), len(record))
+        self.assertEqual(list(record.members), record.to_dict()['members'])
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main(verbosity=3)
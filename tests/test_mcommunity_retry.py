@@ -0,0 +1,239 @@
+import asyncio
+import errno
+import logging
+import unittest
+from unittest.mock import MagicMock, patch
+
+import ldap
+
+from mcommunity import mcommunity_mocks as mocks
+from mcommunity.mcommunity_base import MCommunityBase
+from mcommunity.mcommunity_client import MCommunityClient
+from mcommunity.mcommunity_pool import MCommunityConnectionPool
+from mcommunity.mcommunity_retry import BindTimeout, CircuitBreaker, CircuitOpenError, ConnectTimeout, Deadline, \
+    DeadlineExceeded, RetryPolicy, SearchTimeout
+from mcommunity.mcommunity_session import MCommunitySession
+
+
+class RetryPolicyTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.policy = RetryPolicy(max_attempts=3, base_delay=1, max_delay=3, jitter=0)
+        self.sleep_patcher = patch('mcommunity.mcommunity_retry.time.sleep')
+        self.sleep = self.sleep_patcher.start()
+
+    def test_delay(self):
+        self.assertEqual([1, 2, 3, 3], [self.policy.delay(attempt) for attempt in range(1, 5)])
+        self.policy.jitter = 1.0
+        self.assertTrue(all(0 <= self.policy.delay(2) <= 2 for _ in range(100)))
+
+    def test_call_retries_then_succeeds(self):
+        operation = MagicMock(side_effect=[ldap.SERVER_DOWN(), ldap.UNAVAILABLE(), 'result'])
+        self.assertEqual('result', self.policy.call(operation))
+        self.assertEqual(3, operation.call_count)
+        self.assertEqual([((1,),), ((2,),)], self.sleep.call_args_list)
+
+    def test_call_gives_up(self):
+        operation = MagicMock(side_effect=ldap.SERVER_DOWN())
+        with self.assertRaises(ldap.UNAVAILABLE):
+            self.policy.call(operation)
+        self.assertEqual(3, operation.call_count)
+
+    def test_call_does_not_retry_other_errors(self):
+        operation = MagicMock(side_effect=ldap.NO_SUCH_OBJECT())
+        with self.assertRaises(ldap.NO_SUCH_OBJECT):
+            self.policy.call(operation)
+        self.assertEqual(1, operation.call_count)
+
+    def test_call_deadline(self):
+        self.policy.deadline = 1.5
+        operation = MagicMock(side_effect=ldap.SERVER_DOWN())
+        with self.assertRaises(DeadlineExceeded):
+            self.policy.call(operation)  # Fails, waits 1s, fails, and 2s would be past the deadline
+        self.assertEqual(2, operation.call_count)
+
+    def test_call_batch_deadline(self):
+        operation = MagicMock(return_value='result')
+        with Deadline(0).scope():
+            with self.assertRaises(DeadlineExceeded):
+                self.policy.call(operation)
+        operation.assert_not_called()
+        self.assertIsNone(Deadline.current())
+
+    def test_call_deadline_in_effect(self):
+        self.policy.deadline = 60
+        with Deadline(120).scope():
+            deadline = self.policy.call(Deadline.current)
+        self.assertLess(deadline.remaining(), 61)
+
+    def test_call_async(self):
+        attempts = []
+
+        async def operation():
+            attempts.append(1)
+            if len(attempts) < 2:
+                raise ldap.SERVER_DOWN()
+            return 'result'
+
+        with patch('mcommunity.mcommunity_retry.asyncio.sleep') as sleep:
+            self.assertEqual('result', asyncio.run(self.policy.call_async(operation)))
+        self.assertEqual(2, len(attempts))
+        sleep.assert_called_once_with(1)
+
+    def tearDown(self) -> None:
+        self.sleep_patcher.stop()
+
+
+class CircuitBreakerTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=30)
+        self.time_patcher = patch('mcommunity.mcommunity_retry.time.monotonic', return_value=1000.0)
+        self.time = self.time_patcher.start()
+
+    def test_opens_after_threshold(self):
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(CircuitBreaker.OPEN, self.breaker.state)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.check()
+
+    def test_success_resets_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(CircuitBreaker.CLOSED, self.breaker.state)
+
+    def test_half_open_probe(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.time.return_value = 1031.0
+        self.assertTrue(self.breaker.allow())  # The probe
+        self.assertEqual(CircuitBreaker.HALF_OPEN, self.breaker.state)
+        self.assertFalse(self.breaker.allow())  # Only one probe at a time
+        self.breaker.record_success()
+        self.assertEqual(CircuitBreaker.CLOSED, self.breaker.state)
+        self.assertTrue(self.breaker.allow())
+
+    def test_half_open_probe_fails(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.time.return_value = 1031.0
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(CircuitBreaker.OPEN, self.breaker.state)
+        self.assertFalse(self.breaker.allow())
+
+    def test_policy_fails_fast_when_open(self):
+        policy = RetryPolicy(max_attempts=10, base_delay=0)
+        operation = MagicMock(side_effect=ldap.SERVER_DOWN())
+        with self.assertRaises(CircuitOpenError):
+            policy.call(operation, self.breaker)
+        self.assertEqual(2, operation.call_count)  # Stopped as soon as the circuit opened
+
+    def tearDown(self) -> None:
+        self.time_patcher.stop()
+
+
+class RetryIntegrationTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.session = MCommunitySession(
+            mocks.test_app, mocks.test_secret, retry_policy=RetryPolicy(base_delay=0.05, jitter=0),
+            circuit_breaker=CircuitBreaker(failure_threshold=3)
+        )
+
+    @patch('mcommunity.mcommunity_base.MCommunityBase.connect')
+    def test_search_opens_session_circuit(self, connect):
+        connect.side_effect = ldap.SERVER_DOWN()
+        base = MCommunityBase(session=self.session)
+        with self.assertRaises(ldap.UNAVAILABLE):
+            base.search('ou=People,dc=umich,dc=edu', 'uid=nemcardf', ['*'])
+        self.assertEqual(CircuitBreaker.OPEN, self.session.stats()['circuit'])
+        with self.assertRaises(CircuitOpenError):
+            base.search('ou=People,dc=umich,dc=edu', 'uid=nemcards', ['*'])
+
+    @patch('mcommunity.mcommunity_base.MCommunityBase.connect')
+    def test_client_batch_deadline(self, connect):
+        connect.side_effect = ldap.SERVER_DOWN()
+        self.session.circuit_breaker.failure_threshold = 100
+        self.session.retry_policy.base_delay = 10
+        results = list(MCommunityClient(session=self.session).fetch_users(['nemcardf', 'nemcards'], deadline=1))
+        self.assertTrue(all(isinstance(r.error, DeadlineExceeded) for r in results))
+
+    def tearDown(self) -> None:
+        MCommunityConnectionPool.close_all()
+
+
+class TimeoutTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.session = MCommunitySession(
+            mocks.test_app, mocks.test_secret, retry_policy=RetryPolicy(base_delay=0, jitter=0),
+            connect_timeout=2.0, bind_timeout=3.0, search_timeout=4.0, time_limit=5
+        )
+        self.base = MCommunityBase(session=self.session)
+
+    @patch('mcommunity.mcommunity_base.ldap.initialize')
+    def test_connect_sets_timeouts(self, initialize):
+        connection = self.base.connect()
+        connection.set_option.assert_any_call(ldap.OPT_NETWORK_TIMEOUT, 2.0)
+        connection.set_option.assert_any_call(ldap.OPT_TIMELIMIT, 5)
+        self.assertEqual(-1, connection.timeout)  # The bind timeout does not apply to searches
+
+    @patch('mcommunity.mcommunity_base.ldap.initialize')
+    def test_bind_timeout(self, initialize):
+        initialize.return_value.simple_bind_s.side_effect = ldap.TIMEOUT()
+        with self.assertRaises(BindTimeout):
+            self.base.connect()
+        self.assertEqual(3.0, initialize.return_value.timeout)
+
+    @patch('mcommunity.mcommunity_base.ldap.initialize')
+    def test_connect_timeout(self, initialize):
+        initialize.return_value.simple_bind_s.side_effect = ldap.SERVER_DOWN({'desc': "Can't contact LDAP server",
+                                                                              'errno': errno.ETIMEDOUT})
+        with self.assertRaises(ConnectTimeout):
+            self.base.connect()
+        initialize.return_value.simple_bind_s.side_effect = ldap.SERVER_DOWN({'desc': "Can't contact LDAP server",
+                                                                              'errno': errno.ECONNREFUSED})
+        with self.assertRaises(ldap.SERVER_DOWN) as context:
+            self.base.connect()
+        self.assertNotIsInstance(context.exception, ConnectTimeout)
+
+    @patch('mcommunity.mcommunity_base.MCommunityBase.connect')
+    def test_search_timeout_retried_on_new_connection(self, connect):
+        slow, fast = MagicMock(), MagicMock()
+        slow.search_st.side_effect = ldap.TIMEOUT()
+        fast.search_st.return_value = mocks.faculty_mock
+        connect.side_effect = [slow, fast]
+        self.assertEqual(mocks.faculty_mock, self.base.search('ou=People,dc=umich,dc=edu', 'uid=nemcardf', ['*']))
+        self.assertEqual(4.0, slow.search_st.call_args.kwargs['timeout'])
+        slow.unbind_s.assert_called_once()  # It may still have the search outstanding, so it is not pooled again
+        self.assertEqual(1, self.session.stats()['latency']['People/lookup']['timeouts'])
+
+    @patch('mcommunity.mcommunity_base.MCommunityBase.connect')
+    def test_search_timeout_raised_after_retries(self, connect):
+        connect.return_value.search_st.side_effect = ldap.TIMEOUT()
+        with self.assertRaises(SearchTimeout):
+            self.base.search('ou=People,dc=umich,dc=edu', 'uid=nemcardf', ['*'])
+        self.assertEqual(3, connect.return_value.search_st.call_count)
+        self.assertEqual(3, self.session.circuit_breaker.failures)
+
+    @patch('mcommunity.mcommunity_base.MCommunityBase.connect')
+    def test_search_timeout_capped_by_deadline(self, connect):
+        connect.return_value.search_st.return_value = mocks.faculty_mock
+        with Deadline(1).scope():
+            self.base.search('ou=People,dc=umich,dc=edu', 'uid=nemcardf', ['*'])
+        self.assertLessEqual(connect.return_value.search_st.call_args.kwargs['timeout'], 1)
+        self.assertEqual(-1, Deadline.cap(-1))
+        with Deadline(1).scope():
+            self.assertLessEqual(Deadline.cap(-1), 1)
+
+    def tearDown(self) -> None:
+        MCommunityConnectionPool.close_all()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main(verbosity=3)
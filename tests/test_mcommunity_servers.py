@@ -0,0 +1,142 @@
+import logging
+import unittest
+from unittest.mock import MagicMock, patch
+
+import ldap
+
+from mcommunity import mcommunity_mocks as mocks
+from mcommunity.mcommunity_async import AsyncMCommunityClient
+from mcommunity.mcommunity_pool import MCommunityConnectionPool
+from mcommunity.mcommunity_retry import CircuitBreaker, CircuitOpenError, RetryPolicy
+from mcommunity.mcommunity_servers import MCommunityServerSet
+from mcommunity.mcommunity_session import MCommunitySession
+
+URIS = ['ldaps://ldap1.example.edu', 'ldaps://ldap2.example.edu', 'ldaps://ldap3.example.edu']
+
+
+class MCommunityServerSetTestCase(unittest.TestCase):
+
+    def test_round_robin(self):
+        servers = MCommunityServerSet(URIS)
+        self.assertEqual(URIS * 2, [servers.choose().uri for _ in range(6)])
+
+    def test_least_outstanding(self):
+        servers = MCommunityServerSet(URIS, strategy=MCommunityServerSet.LEAST_OUTSTANDING)
+        servers.servers[0].outstanding = 2
+        servers.servers[1].outstanding = 1
+        self.assertEqual(URIS[2], servers.choose().uri)
+        servers.servers[2].outstanding = 3
+        self.assertEqual(URIS[1], servers.choose().uri)
+
+    def test_latency_weighted(self):
+        servers = MCommunityServerSet(URIS[:2], strategy=MCommunityServerSet.LATENCY)
+        servers.record_success(servers.servers[0], 0.001)
+        servers.record_success(servers.servers[1], 1.0)
+        picks = [servers.choose().uri for _ in range(1000)]
+        self.assertGreater(picks.count(URIS[0]), 900)
+
+    def test_unknown_strategy(self):
+        with self.assertRaises(ValueError):
+            MCommunityServerSet(URIS, strategy='random')
+
+    def test_failed_server_skipped_then_probed(self):
+        servers = MCommunityServerSet(URIS[:2], recovery_timeout=30)
+        with patch('mcommunity.mcommunity_retry.time.monotonic', return_value=1000.0) as monotonic:
+            servers.record_failure(servers.servers[0])
+            self.assertEqual([URIS[1]] * 3, [servers.choose().uri for _ in range(3)])
+            servers.record_failure(servers.servers[1])
+            with self.assertRaises(CircuitOpenError):
+                servers.choose()
+            monotonic.return_value = 1031.0
+            self.assertEqual(URIS[0], servers.choose().uri)  # The probe
+
+    def test_run_fails_over(self):
+        servers = MCommunityServerSet(URIS)
+        failed = []
+
+        def operation(uri):
+            if uri != URIS[2]:
+                raise ldap.SERVER_DOWN()
+            return uri
+
+        self.assertEqual(URIS[2], servers.run(operation, on_failure=failed.append))
+        self.assertEqual(URIS[:2], failed)
+        self.assertEqual([CircuitBreaker.OPEN, CircuitBreaker.OPEN, CircuitBreaker.CLOSED],
+                         [s['state'] for s in servers.stats()])
+
+    def test_run_all_fail(self):
+        servers = MCommunityServerSet(URIS[:2])
+        with self.assertRaises(ldap.SERVER_DOWN):
+            servers.run(lambda uri: (_ for _ in ()).throw(ldap.SERVER_DOWN()))
+        with self.assertRaises(CircuitOpenError):
+            servers.run(lambda uri: uri)
+
+    def test_run_does_not_fail_over_on_other_errors(self):
+        servers = MCommunityServerSet(URIS)
+        with self.assertRaises(ldap.NO_SUCH_OBJECT):
+            servers.run(lambda uri: (_ for _ in ()).throw(ldap.NO_SUCH_OBJECT()))
+        self.assertTrue(all(s.healthy for s in servers.servers))
+
+
+class MultiServerSearchTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.fake_servers = [mocks.FakeLDAPServer(uri) for uri in URIS]
+        self.patcher = patch('mcommunity.mcommunity_base.ldap.initialize', mocks.fake_initialize(self.fake_servers))
+        self.patcher.start()
+        self.session = MCommunitySession(mocks.test_app, mocks.test_secret, servers=MCommunityServerSet(URIS),
+                                         retry_policy=RetryPolicy(base_delay=0))
+
+    def test_spreads_load(self):
+        for _ in range(6):
+            self.assertTrue(self.session.user('nemcardf').exists)
+        self.assertEqual([2, 2, 2], [server.searches for server in self.fake_servers])
+        self.assertEqual(3, self.session.stats()['pool_connections'])
+
+    def test_reroutes_when_server_goes_down(self):
+        for _ in range(3):
+            self.session.user('nemcardf')
+        self.fake_servers[0].down = True
+        for _ in range(4):
+            self.assertTrue(self.session.user('nemcardf').exists)
+        self.assertEqual(1, self.fake_servers[0].searches)
+        self.assertEqual(7, sum(server.searches for server in self.fake_servers))
+        stats = self.session.stats()
+        self.assertEqual(CircuitBreaker.OPEN, stats['servers'][0]['state'])
+        self.assertEqual(CircuitBreaker.CLOSED, stats['circuit'])  # Failing over did not count against the session
+        self.assertEqual(2, stats['pool_connections'])  # The dead server's connection was dropped
+
+    def test_search_timeout_fails_over(self):
+        self.session.search_timeout = 0.05
+        self.fake_servers[0].delay = 1
+        self.assertTrue(self.session.user('nemcardf').exists)
+        self.assertEqual([0, 1, 0], [server.searches for server in self.fake_servers])
+
+    def tearDown(self) -> None:
+        self.patcher.stop()
+        MCommunityConnectionPool.close_all()
+
+
+class AsyncMultiServerTestCase(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.session = MCommunitySession(mocks.test_app, mocks.test_secret, servers=MCommunityServerSet(URIS))
+        self.client = AsyncMCommunityClient(session=self.session)
+
+    async def test_connection_to_chosen_server(self):
+        connection = MagicMock()
+        with patch('mcommunity.mcommunity_base.MCommunityBase.connect', return_value=connection) as connect:
+            self.assertIs(connection, await self.client._get_connection())
+        connect.assert_called_once_with(URIS[0])
+        self.client._drop_connection(connection)
+        self.assertFalse(self.session.servers.servers[0].healthy)
+        self.assertIsNone(self.client._connection)
+
+    async def asyncTearDown(self) -> None:
+        await self.client.close()
+        MCommunityConnectionPool.close_all()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main(verbosity=3)
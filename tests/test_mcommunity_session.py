@@ -0,0 +1,105 @@
+import logging
+import unittest
+from unittest.mock import MagicMock, patch
+
+from mcommunity import mcommunity_mocks as mocks
+from mcommunity.mcommunity_base import MCommunityBase
+from mcommunity.mcommunity_cache import MCommunityCache
+from mcommunity.mcommunity_client import MCommunityClient
+from mcommunity.mcommunity_group import MCommunityGroup
+from mcommunity.mcommunity_pool import MCommunityConnectionPool
+from mcommunity.mcommunity_session import MCommunitySession
+from mcommunity.mcommunity_user import MCommunityUser
+
+
+class MCommunitySessionTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.patcher = patch('mcommunity.mcommunity_base.MCommunityBase.search')
+        self.mock = self.patcher.start()
+        self.mock.side_effect = mocks.mcomm_side_effect
+        self.session = MCommunitySession(mocks.test_app, mocks.test_secret)
+
+    def test_user(self):
+        user = self.session.user('nemcardf', profile='minimal')
+        self.assertIs(self.session, user.session)
+        self.assertEqual(mocks.test_app, user.mcommunity_app_cn)
+        self.assertEqual(mocks.test_secret, user.mcommunity_secret)
+        self.assertNotIn('mcommunity_secret', user.__dict__)
+        self.assertEqual('Natalie Emcard', user.display_name)
+
+    def test_group_members_share_session(self):
+        group = self.session.group('test-group')
+        self.assertIs(self.session, group.session)
+        self.assertTrue(all(user.session is self.session for user in group.populate_members_mcomm_users()))
+
+    def test_old_constructor_uses_default_session(self):
+        user = MCommunityUser('nemcardf', mocks.test_app, mocks.test_secret)
+        group = MCommunityGroup('test-group', mocks.test_app, mocks.test_secret)
+        self.assertIs(user.session, group.session)
+        self.assertIs(MCommunitySession.for_credentials(mocks.test_app, mocks.test_secret), user.session)
+        self.assertIsNot(user.session, MCommunitySession.for_credentials(mocks.test_app, 'other secret'))
+
+    def test_to_dict(self):
+        d = self.session.user('nemcardf').to_dict()
+        self.assertEqual(mocks.test_app, d['mcommunity_app_cn'])
+        self.assertNotIn('session', d)
+        self.assertNotIn('mcommunity_secret', d)
+
+    def test_settings_fall_back_to_class(self):
+        base = MCommunityBase(session=self.session)
+        self.assertEqual(MCommunityBase.server_uri, base._setting('server_uri'))
+        session = MCommunitySession(mocks.test_app, mocks.test_secret, server_uri='ldaps://other.example.edu')
+        self.assertEqual('ldaps://other.example.edu', MCommunityBase(session=session)._setting('server_uri'))
+
+    def test_session_cache(self):
+        self.patcher.stop()  # Use the real search so the cache is consulted
+        self.session.cache = MCommunityCache()
+        with patch.object(MCommunityBase, '_search_ldap', side_effect=mocks.mcomm_side_effect) as search_ldap:
+            self.session.user('nemcardf')
+            self.session.user('nemcardf')
+            MCommunityUser('nemcardf', mocks.test_app, mocks.test_secret)  # Default session; no cache
+        self.assertEqual(2, search_ldap.call_count)
+        self.assertEqual(1, self.session.stats()['cache']['hits'])
+
+    def test_session_pool(self):
+        session = MCommunitySession(mocks.test_app, mocks.test_secret, server_uri='ldaps://pool.example.edu',
+                                    pool_size=2)
+        pool = MCommunityBase(session=session).connection_pool()
+        self.assertEqual(2, pool.max_size)
+        pool.release(pool.acquire(MagicMock))
+        self.assertEqual(1, session.stats()['pool_connections'])
+        session.close()
+        self.assertEqual(0, session.stats()['pool_connections'])
+
+    def test_session_pool_size_honored(self):
+        MCommunityBase(mocks.test_app, mocks.test_secret).connection_pool()  # Default session's pool exists first
+        session = MCommunitySession(mocks.test_app, mocks.test_secret, pool_size=50)
+        self.assertEqual(50, session.connection_pool().max_size)
+        self.assertIsNot(session.connection_pool(), self.session.connection_pool())
+
+    def test_session_close_leaves_other_sessions(self):
+        connection = MagicMock()
+        other = MCommunitySession(mocks.test_app, mocks.test_secret)
+        pool = other.connection_pool()
+        pool.release(pool.acquire(lambda: connection))
+        self.session.connection_pool().release(self.session.connection_pool().acquire(MagicMock))
+        self.session.close()
+        connection.unbind_s.assert_not_called()
+        self.assertEqual(1, other.stats()['pool_connections'])
+        self.assertEqual(0, self.session.stats()['pool_connections'])
+
+    def test_client(self):
+        client = MCommunityClient(session=self.session)
+        results = list(client.fetch_users(['nemcardf', 'fake']))
+        self.assertIs(self.session, results[0].value.session)
+        self.assertFalse(results[1].value.exists)
+
+    def tearDown(self) -> None:
+        self.patcher.stop()
+        MCommunityConnectionPool.close_all()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main(verbosity=3)
@@ -0,0 +1,104 @@
+import logging
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+import ldap
+
+from mcommunity import mcommunity_mocks as mocks
+from mcommunity.mcommunity_base import MCommunityBase
+from mcommunity.mcommunity_pool import MCommunityConnectionPool
+from mcommunity.mcommunity_session import MCommunitySession
+from mcommunity.mcommunity_singleflight import SingleFlight
+
+
+class SingleFlightTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.flight = SingleFlight()
+        self.release = threading.Event()
+
+    def run_concurrently(self, callers: int, call):
+        """
+        Start callers threads running call, wait until all but the first are waiting on it, then let it finish.
+        :return: what each thread got
+        """
+        with ThreadPoolExecutor(callers) as executor:
+            futures = [executor.submit(call) for _ in range(callers)]
+            while self.flight.coalesced < callers - 1:
+                self.release.wait(0.001)
+            self.release.set()
+            return [future.exception() or future.result() for future in futures]
+
+    def test_concurrent_callers_share_one_call(self):
+        operation = MagicMock(side_effect=lambda: self.release.wait() and ['result'])
+        results = self.run_concurrently(5, lambda: self.flight.do('key', operation))
+        self.assertEqual(1, operation.call_count)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(4, self.flight.coalesced)
+        self.assertEqual(0, self.flight.in_flight)
+
+    def test_exception_shared(self):
+        def operation():
+            self.release.wait()
+            raise ldap.NO_SUCH_OBJECT()
+
+        results = self.run_concurrently(3, lambda: self.flight.do('key', operation))
+        self.assertTrue(all(isinstance(result, ldap.NO_SUCH_OBJECT) for result in results))
+
+    def test_sequential_calls_not_shared(self):
+        operation = MagicMock(return_value=['result'])
+        self.flight.do('key', operation)
+        self.flight.do('key', operation)
+        self.assertEqual(2, operation.call_count)
+        self.assertEqual(0, self.flight.coalesced)
+
+    def test_different_keys_not_shared(self):
+        self.assertEqual(['a', 'b'], [self.flight.do(key, lambda key=key: key) for key in ['a', 'b']])
+
+
+class CoalescedSearchTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.release = threading.Event()
+        self.patcher = patch('mcommunity.mcommunity_base.MCommunityBase.connect')
+        self.connect = self.patcher.start()
+        self.connect.return_value.search_st.side_effect = lambda *args, **kwargs: \
+            self.release.wait() and mocks.faculty_mock
+
+    def search_concurrently(self, session: MCommunitySession, callers: int) -> list:
+        with ThreadPoolExecutor(callers) as executor:
+            futures = [executor.submit(
+                MCommunityBase(session=session).search, 'ou=People,dc=umich,dc=edu', 'uid=nemcardf', ['*']
+            ) for _ in range(callers)]
+            while session.single_flight.coalesced < callers - 1:
+                self.release.wait(0.001)
+            self.release.set()
+            return [future.result() for future in futures]
+
+    def test_identical_searches_coalesced(self):
+        session = MCommunitySession(mocks.test_app, mocks.test_secret)
+        results = self.search_concurrently(session, 4)
+        self.assertEqual([mocks.faculty_mock] * 4, results)
+        self.assertEqual(1, self.connect.return_value.search_st.call_count)
+        self.assertEqual(3, session.stats()['latency']['People/lookup']['coalesced'])
+
+    def test_coalesce_off(self):
+        session = MCommunitySession(mocks.test_app, mocks.test_secret, coalesce=False)
+        self.release.set()
+        with ThreadPoolExecutor(4) as executor:
+            for _ in range(4):
+                executor.submit(MCommunityBase(session=session).search, 'ou=People,dc=umich,dc=edu', 'uid=nemcardf',
+                                ['*'])
+        self.assertEqual(4, self.connect.return_value.search_st.call_count)
+        self.assertEqual(0, session.single_flight.coalesced)
+
+    def tearDown(self) -> None:
+        self.patcher.stop()
+        MCommunityConnectionPool.close_all()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main(verbosity=3)
@@ -0,0 +1,84 @@
+import logging
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from mcommunity import mcommunity_mocks as mocks
+from mcommunity.mcommunity_base import MCommunityBase
+from mcommunity.mcommunity_cache import MCommunityCache
+from mcommunity.mcommunity_group import MCommunityGroup
+from mcommunity.mcommunity_snapshot import MCommunitySnapshot
+from mcommunity.mcommunity_user import MCommunityUser
+
+people = 'ou=People,dc=umich,dc=edu'
+
+
+class MCommunitySnapshotTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'snapshot.sqlite3')
+        self.snapshot = MCommunitySnapshot(self.path, max_age=60)
+        self.key = MCommunityCache.make_key(people, 'uid=nemcardf', MCommunityUser.ldap_attributes)
+
+    def test_get_missing(self):
+        self.assertIsNone(self.snapshot.get(self.key))
+
+    def test_round_trip(self):
+        self.snapshot.set(self.key, mocks.faculty_mock)
+        self.assertEqual(mocks.faculty_mock, self.snapshot.get(self.key))
+
+    def test_round_trip_negative(self):
+        self.snapshot.set(self.key, [])
+        self.assertEqual([], self.snapshot.get(self.key))
+
+    def test_shared_between_instances(self):
+        self.snapshot.set(self.key, mocks.faculty_mock)
+        self.assertEqual(mocks.faculty_mock, MCommunitySnapshot(self.path).get(self.key))
+
+    def test_shared_between_threads(self):
+        thread = threading.Thread(target=self.snapshot.set, args=(self.key, mocks.faculty_mock))
+        thread.start()
+        thread.join()
+        self.assertEqual(mocks.faculty_mock, self.snapshot.get(self.key))
+
+    def test_stale_results_ignored_and_pruned(self):
+        with patch('mcommunity.mcommunity_snapshot.time.time', return_value=1000.0):
+            self.snapshot.set(self.key, mocks.faculty_mock)
+        self.assertIsNone(self.snapshot.get(self.key))
+        self.assertEqual(1, self.snapshot.prune())
+
+    def test_warm_fills_cache(self):
+        self.snapshot.set(self.key, mocks.faculty_mock)
+        cache = MCommunityCache()
+        self.assertEqual(1, self.snapshot.warm(cache))
+        self.assertEqual(mocks.faculty_mock, cache.get(self.key))
+
+    def test_delete(self):
+        self.snapshot.set(self.key, mocks.faculty_mock)
+        self.snapshot.delete(self.key)
+        self.assertIsNone(self.snapshot.get(self.key))
+
+    @patch('mcommunity.mcommunity_base.MCommunityBase._search_ldap')
+    def test_users_and_groups_build_from_snapshot(self, magic_mock):
+        magic_mock.side_effect = mocks.mcomm_side_effect
+        with patch.object(MCommunityBase, 'snapshot', self.snapshot):
+            MCommunityUser('nemcardf', mocks.test_app, mocks.test_secret)
+            MCommunityGroup('test-group', mocks.test_app, mocks.test_secret)
+            magic_mock.reset_mock()
+            with patch.object(MCommunityBase, 'snapshot', MCommunitySnapshot(self.path)):  # e.g. the next process
+                user = MCommunityUser('nemcardf', mocks.test_app, mocks.test_secret)
+                group = MCommunityGroup('test-group', mocks.test_app, mocks.test_secret)
+        magic_mock.assert_not_called()
+        self.assertEqual('Natalie Emcard', user.display_name)
+        self.assertCountEqual(['nemcardf', 'nemcardrs', 'nemcarda'], group.members)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main(verbosity=3)
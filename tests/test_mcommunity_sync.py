@@ -0,0 +1,116 @@
+import logging
+import os
+import re
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from mcommunity import mcommunity_mocks as mocks
+from mcommunity.mcommunity_pool import MCommunityConnectionPool
+from mcommunity.mcommunity_session import MCommunitySession
+from mcommunity.mcommunity_sync import GroupDelta, GroupSync
+
+
+class FakeDirectory:
+    """
+    Answers the searches GroupSync makes from a dict of cn -> (modifyTimestamp, member DNs).
+    """
+
+    def __init__(self):
+        self.groups = {
+            'group-a': ('20261018120000Z', [b'uid=nemcardf,ou=People,dc=umich,dc=edu',
+                                            b'uid=nemcards,ou=People,dc=umich,dc=edu']),
+            'group-b': ('20261018130000Z', [b'uid=nemcarda,ou=People,dc=umich,dc=edu',
+                                            b'cn=group-a,ou=User Groups,ou=Groups,dc=umich,dc=edu']),
+        }
+        self.member_fetches = []  # cnames whose members were fetched
+
+    def change(self, cn, modify_timestamp, members):
+        self.groups[cn] = (modify_timestamp, [f'uid={uid},ou=People,dc=umich,dc=edu'.encode() for uid in members])
+
+    def search(self, search_base, query_object, ldap_attributes, use_cache=True):
+        since = re.search(r'\(modifyTimestamp>=([^)]*)\)', query_object)
+        result = []
+        for cn in re.findall(r'\(cn=([^()]*)\)', query_object):
+            if cn not in self.groups or (since and self.groups[cn][0] < since.group(1)):
+                continue
+            modify_timestamp, members = self.groups[cn]
+            attrs = {'cn': [cn.encode()], 'modifyTimestamp': [modify_timestamp.encode()]}
+            if 'member' in ldap_attributes:
+                attrs['member'] = list(members)
+                self.member_fetches.append(cn)
+            result.append((f'cn={cn},{search_base}', attrs))
+        return result
+
+
+class GroupSyncTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = FakeDirectory()
+        self.patcher = patch('mcommunity.mcommunity_base.MCommunityBase.search', side_effect=self.directory.search)
+        self.patcher.start()
+        self.session = MCommunitySession(mocks.test_app, mocks.test_secret)
+        self.sync = GroupSync(['group-a', 'group-b', 'group-missing'], session=self.session)
+
+    def test_first_poll_adds_everyone(self):
+        deltas = list(self.sync.poll())
+        self.assertEqual([
+            GroupDelta('group-a', ('nemcardf', 'nemcards'), (), (), (), '20261018120000Z'),
+            GroupDelta('group-b', ('nemcarda',), (), ('group-a',), (), '20261018130000Z'),
+        ], deltas)
+        self.assertEqual(('nemcardf', 'nemcards'), self.sync.members('group-a'))
+
+    def test_unchanged_groups_not_fetched(self):
+        list(self.sync.poll())
+        self.directory.member_fetches.clear()
+        self.assertEqual([], list(self.sync.poll()))
+        self.assertEqual([], self.directory.member_fetches)
+        self.assertEqual(1, self.sync.last_poll['fetched'])  # Only group-missing, in case it has been created
+
+    def test_changed_group_delta(self):
+        list(self.sync.poll())
+        self.directory.member_fetches.clear()
+        self.directory.change('group-a', '20261018140000Z', ['nemcards', 'nemcardrs'])
+        deltas = list(self.sync.poll())
+        self.assertEqual([GroupDelta('group-a', ('nemcardrs',), ('nemcardf',), (), (), '20261018140000Z')], deltas)
+        self.assertEqual(['group-a'], self.directory.member_fetches)  # group-b was skipped
+        self.assertEqual(('nemcards', 'nemcardrs'), self.sync.members('group-a'))
+
+    def test_touched_without_membership_change(self):
+        list(self.sync.poll())
+        self.directory.change('group-a', '20261018140000Z', ['nemcardf', 'nemcards'])
+        self.assertEqual([], list(self.sync.poll()))
+        self.assertEqual(2, self.sync.last_poll['fetched'])
+
+    def test_full_poll_finds_deleted_group(self):
+        list(self.sync.poll())
+        del self.directory.groups['group-b']
+        self.assertEqual([], list(self.sync.poll()))  # Incremental polls can't see deletions
+        deltas = list(self.sync.poll(full=True))
+        self.assertEqual(1, len(deltas))
+        self.assertTrue(deltas[0].deleted)
+        self.assertEqual(('nemcarda',), deltas[0].removed)
+        self.assertEqual(('group-a',), deltas[0].removed_groups)
+        self.assertEqual((), self.sync.members('group-b'))
+
+    def test_state_survives_restart(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'sync.sqlite')
+            sync = GroupSync(['group-a'], session=self.session, state_path=path)
+            list(sync.poll())
+            sync.close()
+            sync = GroupSync(['group-a'], session=self.session, state_path=path)
+            self.assertEqual([], list(sync.poll()))
+            sync.reset()
+            self.assertEqual(1, len(list(sync.poll())))
+            sync.close()
+
+    def tearDown(self) -> None:
+        self.sync.close()
+        self.patcher.stop()
+        MCommunityConnectionPool.close_all()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main(verbosity=3)
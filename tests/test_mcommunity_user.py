@@ -1,10 +1,11 @@
 import json
 import logging
 import unittest
+from datetime import datetime, timezone
 from unittest.mock import patch
 
 from mcommunity import mcommunity_mocks as mocks
-from mcommunity.mcommunity_user import MCommunityUser
+from mcommunity.mcommunity_user import AFFILIATIONS, MCommunityUser, ServiceEntitlement
 
 test_user = 'nemcardf'
 
@@ -65,6 +66,45 @@ class MCommunityUserTestCase(unittest.TestCase):
         self.assertEqual(False, user.exists)
         self.assertEqual('', user.entityid)
 
+    def test_init_with_raw_result_does_not_search(self):
+        self.mock.reset_mock()
+        user = MCommunityUser('nemcards', mocks.test_app, mocks.test_secret, raw_result=mocks.student_mock)
+        self.mock.assert_not_called()
+        self.assertEqual(True, user.exists)
+        self.assertEqual(mocks.student_mock, user.raw_result)
+
+    def test_init_profile_projects_attributes(self):
+        self.mock.reset_mock()
+        MCommunityUser('nemcardf', mocks.test_app, mocks.test_secret, profile='minimal')
+        self.assertEqual(['uid', 'entityid', 'displayName'], self.mock.call_args[0][2])
+
+    def test_init_profile_custom_list(self):
+        self.mock.reset_mock()
+        MCommunityUser('nemcardf', mocks.test_app, mocks.test_secret, profile=['uid', 'entityid'])
+        self.assertEqual(['uid', 'entityid'], self.mock.call_args_list[0][0][2])
+        self.assertEqual(['displayName'], self.mock.call_args_list[1][0][2])  # Read in __init__, so fetched lazily
+
+    def test_init_profile_unknown(self):
+        with self.assertRaises(ValueError):
+            MCommunityUser('nemcardf', mocks.test_app, mocks.test_secret, profile='everything')
+
+    def test_profile_fetches_missing_attribute_once(self):
+        self.mock.side_effect = lambda base, query, attributes, **kwargs: [(
+            mocks.faculty_mock[0][0], {k: v for k, v in mocks.faculty_mock[0][1].items() if k in attributes}
+        )]
+        user = MCommunityUser('nemcardf', mocks.test_app, mocks.test_secret, profile='minimal')
+        self.mock.reset_mock()
+        user.populate_highest_affiliation()
+        user._decode('umichInstRoles')
+        self.assertEqual('Faculty', user.highest_affiliation)
+        self.assertEqual(1, self.mock.call_count)
+        self.assertEqual(['umichInstRoles'], self.mock.call_args[0][2])
+        self.assertEqual('00000000', user.entityid)
+
+    def test_profile_does_not_change_to_dict(self):
+        user = MCommunityUser('nemcardf', mocks.test_app, mocks.test_secret, profile='eligibility')
+        self.assertEqual(self.nemcardf_dict, user.to_dict())
+
     def test_user_exists(self):
         self.assertEqual(True, self.user.exists)
 
@@ -80,6 +120,36 @@ class MCommunityUserTestCase(unittest.TestCase):
         self.assertEqual(1, len(self.user.raw_result))  # LDAP should always return a 1-item list for a real person
         self.assertEqual(2, len(self.user.raw_result[0]))  # LDAP should always return a 2-item tuple for a real person
 
+    def test_decode_memoized(self):
+        self.assertIs(self.user._decode('displayName'), self.user._decode('displayName'))
+        affiliations = self.user._decode('umichInstRoles', return_str=False)
+        affiliations.append('changed')
+        self.assertNotIn('changed', self.user._decode('umichInstRoles', return_str=False))
+
+    def test_release_raw_result(self):
+        self.user.release_raw_result()
+        self.assertEqual([], self.user.raw_result)
+        self.user.populate_highest_affiliation()
+        self.assertEqual('Faculty', self.user.highest_affiliation)
+        self.assertTrue(self.user.check_service_entitlement('enterprise'))
+        self.assertEqual('', self.user._decode('notAnAttribute'))
+        self.assertEqual(1, self.mock.call_count)  # Nothing is refetched after raw_result is released
+
+    def test_affiliation_rank(self):
+        self.assertEqual(AFFILIATIONS.index('Faculty'), MCommunityUser.affiliation_rank(['AlumniAA', 'FacultyAA']))
+        self.assertEqual(AFFILIATIONS.index('Student'), MCommunityUser.affiliation_rank([b'StudentFLNT', b'Retiree']))
+        self.assertEqual(0, MCommunityUser.affiliation_rank([]))
+        self.assertEqual(0, MCommunityUser.affiliation_rank(['Unknown', 'CommunityMember']))
+
+    def test_affiliation_rank_prefix_only(self):
+        self.assertEqual(AFFILIATIONS.index('Alumni'), MCommunityUser.affiliation_rank(['AlumniStudentGroup']))
+
+    def test_classify_affiliations(self):
+        ranks = MCommunityUser.classify_affiliations([
+            mocks.faculty_mock[0][1]['umichInstRoles'], mocks.retiree_mock[0][1]['umichInstRoles'], []
+        ])
+        self.assertEqual(['Faculty', 'Retiree', 'NA'], [AFFILIATIONS[rank] for rank in ranks])
+
     def test_check_service_entitlements_eligible(self):
         self.assertEqual(True, self.user.check_service_entitlement('enterprise'))
 
@@ -87,6 +157,37 @@ class MCommunityUserTestCase(unittest.TestCase):
         user = MCommunityUser('nemcardr', mocks.test_app, mocks.test_secret)  # Retiree uniqname
         self.assertEqual(False, user.check_service_entitlement('enterprise'))
 
+    def test_check_service_entitlements_many(self):
+        self.assertEqual({'enterprise': True, 'adobecc': False, 'zoom': False},
+                         self.user.check_service_entitlements(['enterprise', 'adobecc', 'zoom']))
+
+    def test_check_service_entitlements_no_use(self):
+        user = MCommunityUser('nemcardfnouse', mocks.test_app, mocks.test_secret)
+        with self.assertWarns(UserWarning):
+            self.assertEqual({'enterprise': False}, user.check_service_entitlements(['enterprise']))
+
+    def test_entitlements_parsed_once(self):
+        with patch('mcommunity.mcommunity_user.json.loads', wraps=json.loads) as loads:
+            for service in ['enterprise', 'box', 'canvas', 'fake']:
+                self.user.check_service_entitlement(service)
+        self.assertEqual(len(mocks.eligible_use_str), loads.call_count)
+
+    def test_entitlements_indexed_by_system(self):
+        box = self.user.entitlements['box']
+        self.assertEqual(ServiceEntitlement(
+            'box', 'yesDelay', 'active', datetime(2020, 8, 15, 8, 20, 46, tzinfo=timezone.utc), True
+        ), box)
+        self.assertEqual(8, len(self.user.entitlements))
+
+    def test_entitlements_duplicate_system_prefers_eligible(self):
+        user = MCommunityUser('nemcardr', mocks.test_app, mocks.test_secret)
+        user.service_entitlements = mocks.ineligible_use_str + [
+            '{"system":"box","changeDate":"20100101000000Z","eligibility":"yes","status":""}',
+            '{"system":"tdx","changeDate":"bad","eligibility":"no","status":""}',
+        ]
+        self.assertTrue(user.check_service_entitlement('box'))
+        self.assertEqual(datetime(2022, 7, 27, 16, 2, 6, tzinfo=timezone.utc), user.entitlements['tdx'].change_date)
+
     def test_check_sponsorship_type_sa1(self):
         user = MCommunityUser('nemcardsa1', mocks.test_app, mocks.test_secret)
         self.assertEqual(1, user.check_sponsorship_type())
@@ -102,6 +203,14 @@ class MCommunityUserTestCase(unittest.TestCase):
     def test_check_sponsorship_type_not_sponsored(self):
         self.assertEqual(0, self.user.check_sponsorship_type())
 
+    def test_groups(self):
+        self.assertCountEqual(['test-group', 'test-group-2', 'nested-parent', 'nested-shared'], self.user.groups())
+        self.assertEqual('(member=uid=nemcardf,ou=People,dc=umich,dc=edu)', self.mock.call_args[0][1])
+        self.assertEqual(['cn'], self.mock.call_args[0][2])
+
+    def test_groups_none(self):
+        self.assertEqual([], MCommunityUser('nemcardr', mocks.test_app, mocks.test_secret).groups())
+
     def test_populate_affiliations(self):
         self.assertEqual([], self.user.affiliations)  # Before populating, there should not be any
         self.user.populate_affiliations()